@@ -0,0 +1,338 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Union,
+)
+
+import oandapyV20
+import oandapyV20.endpoints.pricing as pricing
+import pandas as pd
+from loguru import logger
+from oandapyV20.oandapyV20 import TRADING_ENVIRONMENTS
+from requests.adapters import HTTPAdapter
+from termcolor import colored
+
+from src.bar_aggregator import Bar
+from src.latency import clock
+from src.streaming_pipeline import StreamingDataPipeline
+from src.trading_bot import TradingBot
+
+_DONE = object()
+
+
+def register_environment(
+    name: str, api_url: str, stream_url: Optional[str] = None
+) -> None:
+    """
+    Register an additional OANDA environment, e.g. a local fake server,
+    so that `oandapyV20.API(token, environment=name)` talks to it.
+
+    Args:
+        name (str): environment name
+        api_url (str): base url of the REST api
+        stream_url (Optional[str], optional): base url of the streaming
+        api. Defaults to the REST api url.
+    """
+    TRADING_ENVIRONMENTS[name] = {"api": api_url, "stream": stream_url or api_url}
+
+
+async def stream_ticks(ticks: Iterable[Dict]) -> AsyncIterator[Dict]:
+    """
+    Bridge a blocking tick iterable, such as an oandapyV20 pricing
+    stream, to asyncio by reading it in a background thread.
+
+    Args:
+        ticks (Iterable[Dict]): blocking tick source
+
+    Raises:
+        Exception: any error raised while reading the source
+
+    Yields:
+        Dict: ticks in arrival order
+    """
+    loop = asyncio.get_running_loop()
+    tick_queue = asyncio.Queue()
+
+    def read() -> None:
+        try:
+            for tick in ticks:
+                loop.call_soon_threadsafe(tick_queue.put_nowait, tick)
+        except Exception as e:
+            loop.call_soon_threadsafe(tick_queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(tick_queue.put_nowait, _DONE)
+
+    threading.Thread(target=read, name="tick-reader", daemon=True).start()
+    while True:
+        tick = await tick_queue.get()
+        if tick is _DONE:
+            return
+        if isinstance(tick, Exception):
+            raise tick
+        yield tick
+
+
+class AsyncTradingBot:
+    """
+    Non-blocking facade over `TradingBot`.
+
+    REST calls are dispatched to a dedicated worker pool that shares the
+    client's pooled HTTP session, so awaiting an order or a positions
+    call never blocks the event loop that consumes the ticks.
+    """
+
+    def __init__(self, bot: TradingBot, max_workers: int = 4):
+        self.bot = bot
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="oanda-rest"
+        )
+
+        # Keep one pooled connection per worker instead of the default
+        session = getattr(bot.client, "client", None)
+        if session is not None and hasattr(session, "mount"):
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+    async def _call(self, func: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def get_open_positions(self) -> List[Dict[str, Any]]:
+        return await self._call(self.bot.get_open_positions)
+
+    async def get_buy_in_price(self, instrument: str) -> Union[float, None]:
+        return await self._call(self.bot.get_buy_in_price, instrument)
+
+    async def place_market_order(self, instrument: str, units: int) -> None:
+        await self._call(self.bot.place_market_order, instrument, units)
+
+    async def place_limit_order_take_profit(
+        self,
+        instrument: str,
+        units: int,
+        take_profit_price: float,
+        stop_loss_price: float,
+    ) -> None:
+        await self._call(
+            self.bot.place_limit_order_take_profit,
+            instrument,
+            units,
+            take_profit_price,
+            stop_loss_price,
+        )
+
+    async def place_limit_order_stop_loss(
+        self,
+        instrument: str,
+        units: int,
+        take_profit_price: float,
+        stop_loss_price: float,
+    ) -> None:
+        await self._call(
+            self.bot.place_limit_order_stop_loss,
+            instrument,
+            units,
+            take_profit_price,
+            stop_loss_price,
+        )
+
+    async def close_all_trades(self) -> None:
+        await self._call(self.bot.close_all_trades)
+
+    def close(self) -> None:
+        """Wait for the pending REST calls and release the workers."""
+        self.executor.shutdown(wait=True)
+
+
+class AsyncStreamingDataPipeline(StreamingDataPipeline):
+    """
+    asyncio variant of `StreamingDataPipeline`.
+
+    Ticks are aggregated on the event loop and every completed candle is
+    handed to a separate decision task, which awaits the agent's REST
+    calls. Tick consumption therefore never waits on REST latency.
+    """
+
+    def __init__(self, *args, max_workers: int = 4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_bot = AsyncTradingBot(self.bot, max_workers=max_workers)
+        self.candles: Optional[asyncio.Queue] = None
+
+    async def perform_action_async(
+        self, action: int, instruments_in_positions: List, last_price: float
+    ) -> None:
+        """
+        Perform the action based on the agent's recommendation and the
+        current state of the positions without blocking the event loop.
+
+        Args:
+            action (int): action recommended by the agent
+            instruments_in_positions (List): list of instruments in open positions
+            last_price (float): latest mid price of the candlestick
+        """
+        instrument = self.params["instruments"]
+        in_position = instrument in instruments_in_positions
+        resistance = self.store.last("resistance")
+        support = self.store.last("support")
+        if action == self.ACTION_BUY and not in_position:
+            print("\nNo open position and Agent recommends buying...\n")
+            print("Placing market order to buy...\n")
+            self.events.log("order", kind="buy", units=self.ORDER_SIZE)
+            await self.timed_order_async(
+                self.async_bot.place_market_order, instrument, self.ORDER_SIZE
+            )
+        elif action == self.ACTION_SELL and in_position:
+            print("\nAction is 1 and there are open positions...\n")
+            print("Placing limit order to sell...\n")
+            self.events.log("order", kind="sell", units=-self.ORDER_SIZE)
+            await self.timed_order_async(
+                self.async_bot.place_market_order, instrument, -self.ORDER_SIZE
+            )
+        elif (
+            abs(last_price - resistance) <= 1 * 10**-self.precision
+            and in_position
+            and await self.async_bot.get_buy_in_price(instrument) < resistance
+        ):
+            print(
+                colored("\nPrice at resistance level, closing position...\n", "yellow")
+            )
+            self.events.log("order", kind="take_profit", units=-self.ORDER_SIZE)
+            await self.timed_order_async(
+                self.async_bot.place_limit_order_take_profit,
+                instrument,
+                -self.ORDER_SIZE,
+                resistance,
+                support,
+            )
+        elif (
+            last_price <= support
+            and in_position
+            and await self.async_bot.get_buy_in_price(instrument) > support
+        ):
+            print(colored("\nPrice at support level, closing position...\n", "red"))
+            self.events.log("order", kind="stop_loss", units=-self.ORDER_SIZE)
+            await self.timed_order_async(
+                self.async_bot.place_limit_order_stop_loss,
+                instrument,
+                -self.ORDER_SIZE,
+                resistance,
+                support,
+            )
+        else:
+            print("Holding position...")
+
+    async def timed_order_async(self, place: Callable, *args) -> None:
+        """
+        Place an order and record its round-trip and the time since the
+        decision.
+
+        Args:
+            place (Callable): order coroutine of the async trading bot
+            *args: arguments of the order
+        """
+        if not self.latency.enabled:
+            await place(*args)
+            return
+        start = clock()
+        await place(*args)
+        self.latency.record("order", start)
+        self.latency.record("decision_to_order", self.decision_start)
+
+    async def on_candle_async(
+        self, bar: Bar, last_price: float, tick_start: Optional[int] = None
+    ) -> None:
+        """
+        Let the agent decide on a completed candlestick, act on the
+        decision and append the candlestick to the store.
+
+        Args:
+            bar (Bar): new candlestick
+            last_price (float): latest mid price of the candlestick
+        """
+        action = self.get_action(bar, tick_start)
+        timed = self.latency.enabled
+        if timed:
+            start = clock()
+        positions = await self.async_bot.get_open_positions()
+        if timed:
+            self.latency.record("positions", start)
+        print(f"Open positions: {positions}\n\n")
+        instruments_in_positions = [position["instrument"] for position in positions]
+
+        await self.perform_action_async(action, instruments_in_positions, last_price)
+        self.append_candle(bar)
+
+    async def decide(self) -> None:
+        """Decision task: act on the completed candlesticks in order."""
+        while True:
+            item = await self.candles.get()
+            if item is None:
+                return
+            bar, last_price, tick_start = item
+            try:
+                await self.on_candle_async(bar, last_price, tick_start)
+            except Exception as e:
+                logger.error(f"Error acting on candlestick: {e}")
+
+    async def run(
+        self, ticks: Union[Iterable[Dict], AsyncIterable[Dict], None] = None
+    ) -> pd.DataFrame:
+        """
+        Run the streaming pipeline on the event loop.
+
+        Args:
+            ticks (Union[Iterable[Dict], AsyncIterable[Dict], None], optional):
+            tick source, blocking sources are read in a background thread.
+            Defaults to a dedicated pricing stream for the instrument.
+
+        Returns:
+            pd.DataFrame: dataframe containing the
+            the data during the streaming process
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.prepare_agent)
+        print()
+
+        if ticks is None:
+            r = pricing.PricingStream(accountID=self.accountID, params=self.params)
+            ticks = self.client.request(r)
+        if not hasattr(ticks, "__aiter__"):
+            ticks = stream_ticks(ticks)
+
+        self.bot.watch_transactions()
+        self.start_checkpoints()
+        self.start_feature_store()
+        self.candles = asyncio.Queue()
+        decision_task = asyncio.create_task(self.decide())
+        max_duration_reached = False
+        try:
+            async for tick in ticks:
+                if self.check_max_duration():
+                    max_duration_reached = True
+                    break
+                bar = self.read_tick(tick)
+                if bar is not None:
+                    self.candles.put_nowait((bar, self.last_price, self.tick_start))
+        except oandapyV20.exceptions.V20Error as err:
+            print(f"V20Error encountered: {err}")
+            raise
+        finally:
+            self.candles.put_nowait(None)
+            await decision_task
+            if max_duration_reached:
+                await self.async_bot.close_all_trades()
+            self.async_bot.close()
+            self.stop_checkpoints()
+            self.stop_feature_store()
+            self.bot.stop_watching_transactions()
+        return self.df
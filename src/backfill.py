@@ -0,0 +1,245 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import oandapyV20
+import oandapyV20.endpoints.instruments as instruments
+import pandas as pd
+from dotenv import load_dotenv
+from loguru import logger
+from requests.exceptions import RequestException
+
+from src.candle_cache import (
+    CANDLE_DTYPE,
+    CandleCache,
+    _to_ns,
+    _to_rfc3339,
+    candles_to_records,
+    records_to_frame,
+)
+from src.shared_store import SharedFeatureStore, store_path
+from src.utils import GRANULARITY_SECONDS, calculate_indicators, parse_yml
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the request rate.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, and
+    every request takes one token, waiting for it if none is left.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until one is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def split_range(
+    start: int, end: int, granularity: str, page_size: int = 5000
+) -> List[Tuple[int, int]]:
+    """
+    Split a time range into pages of at most `page_size` candles.
+
+    Args:
+        start (int): inclusive start in epoch nanoseconds
+        end (int): exclusive end in epoch nanoseconds
+        granularity (str): candle granularity, e.g. "M1"
+        page_size (int, optional): candles per page. Defaults to 5000.
+
+    Raises:
+        ValueError: if the granularity has no fixed duration
+
+    Returns:
+        List[Tuple[int, int]]: start and end of every page
+    """
+    if granularity not in GRANULARITY_SECONDS:
+        raise ValueError(f"Unsupported granularity for paging: {granularity}")
+    span = GRANULARITY_SECONDS[granularity] * page_size * 10**9
+    return [(lo, min(lo + span, end)) for lo in range(start, end, span)]
+
+
+class Backfiller:
+    """
+    Parallel paginated download of historical candles.
+
+    The range is split into pages which are fetched by a bounded worker
+    pool. A shared token bucket keeps the request rate under the OANDA
+    limit. Failed pages are retried with exponential backoff, and the
+    pages are stitched and deduplicated in time order.
+    """
+
+    def __init__(
+        self,
+        client: oandapyV20.API,
+        max_workers: int = 8,
+        requests_per_second: float = 100.0,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+        page_size: int = 5000,
+    ):
+        self.client = client
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(requests_per_second)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.page_size = page_size
+        self.last_stats: Dict[str, float] = {}
+
+    def fetch_page(
+        self, instrument: str, granularity: str, page: Tuple[int, int]
+    ) -> np.ndarray:
+        """
+        Fetch the candles of one page, retrying on errors.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            page (Tuple[int, int]): start and end of the page
+
+        Raises:
+            oandapyV20.exceptions.V20Error: if the retries are exhausted
+            RequestException: if the retries are exhausted
+
+        Returns:
+            np.ndarray: records with the CANDLE_DTYPE layout
+        """
+        params = {
+            "granularity": granularity,
+            "price": "M",
+            "from": _to_rfc3339(page[0]),
+            "to": _to_rfc3339(page[1]),
+        }
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                r = instruments.InstrumentsCandles(instrument=instrument, params=params)
+                self.client.request(r)
+                return candles_to_records(r.response["candles"])
+            except (oandapyV20.exceptions.V20Error, RequestException) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.warning(
+                    f"Page {params['from']} of {instrument} failed: {e}. "
+                    f"Retrying in {delay}s..."
+                )
+                time.sleep(delay)
+
+    def backfill(
+        self,
+        instrument: str,
+        granularity: str,
+        start: Union[int, str, pd.Timestamp],
+        end: Union[int, str, pd.Timestamp, None] = None,
+    ) -> np.ndarray:
+        """
+        Download all the complete candles between two timestamps.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            start (Union[int, str, pd.Timestamp]): inclusive start
+            end (Union[int, str, pd.Timestamp, None], optional): exclusive
+            end. Defaults to now.
+
+        Returns:
+            np.ndarray: records with the CANDLE_DTYPE layout, sorted by
+            time without duplicates
+        """
+        now = time.time_ns()
+        end_ns = min(_to_ns(end), now) if end is not None else now
+        pages = split_range(_to_ns(start), end_ns, granularity, self.page_size)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunks = list(
+                executor.map(
+                    lambda page: self.fetch_page(instrument, granularity, page), pages
+                )
+            )
+        elapsed = time.perf_counter() - started
+
+        records = np.concatenate(chunks) if chunks else np.empty(0, CANDLE_DTYPE)
+        _, first = np.unique(records["time"], return_index=True)
+        records = records[first]
+
+        self.last_stats = {
+            "pages": len(pages),
+            "candles": len(records),
+            "seconds": elapsed,
+            "pages_per_second": len(pages) / elapsed if elapsed > 0 else 0.0,
+        }
+        logger.info(
+            f"Backfilled {len(records)} {granularity} candles for {instrument} "
+            f"in {len(pages)} pages ({self.last_stats['pages_per_second']:.1f} "
+            "pages/s)."
+        )
+        return records
+
+
+def main():
+    """Backfill the candle cache over a date range."""
+    parser = argparse.ArgumentParser(description="Backfill historical candles.")
+    parser.add_argument("instrument", help="currency pair to backfill")
+    parser.add_argument("start", help="start of the range, e.g. 2024-01-01")
+    parser.add_argument("--end", default=None, help="end of the range, default now")
+    parser.add_argument("--config", default="./cfg/parameters.yaml")
+    parser.add_argument(
+        "--feature-store",
+        action="store_true",
+        help="also write the candles and indicators to the shared feature store",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    cfg = parse_yml(args.config)
+    granularity = cfg["candlestick"]["granularity"]
+    client = oandapyV20.API(access_token=os.getenv("OANDA_ACCESS_TOKEN"))
+    backfiller = Backfiller(client, **cfg["backfill"])
+    records = backfiller.backfill(args.instrument, granularity, args.start, args.end)
+    cache = CandleCache(cfg["candle_cache"]["path"], client)
+    cache.write(args.instrument, granularity, records)
+
+    if args.feature_store:
+        store_cfg = cfg.get("feature_store", {})
+        df = records_to_frame(cache.read(args.instrument, granularity))
+        df = calculate_indicators(df, fast=True).dropna()
+        path = store_path(
+            store_cfg.get("path", "./data/features"), args.instrument, granularity
+        )
+        with SharedFeatureStore.create(
+            path,
+            df.columns,
+            capacity=store_cfg.get("capacity", 100_000),
+            dtype=store_cfg.get("dtype", "float32"),
+            tz=str(df.index.tz),
+            metadata={"instrument": args.instrument, "granularity": granularity},
+        ) as store:
+            written = store.extend(df.index.as_unit("ns").asi8, df.to_numpy())
+        logger.info(f"Wrote {written} new rows to the feature store {path}.")
+
+
+if __name__ == "__main__":
+    main()
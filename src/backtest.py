@@ -0,0 +1,264 @@
+import argparse
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.kernels import INDICATOR_COLUMNS
+from src.q_learning import QLearningTrader
+from src.shared_store import SharedFeatureStore
+from src.utils import calculate_indicators, parse_yml
+
+ACTION_BUY = 0
+ACTION_SELL = 1
+
+
+@dataclass
+class BacktestResult:
+    equity: pd.Series
+    trades: pd.DataFrame
+    stats: Dict[str, float]
+
+
+class Backtester:
+    """
+    Offline replay of stored candles through the same indicators,
+    Q-learning agent and order rules as `StreamingDataPipeline`.
+
+    Orders are filled against the candles instead of the OANDA API:
+    market orders at the close plus or minus half the spread, the take
+    profit and stop loss limit orders of `perform_action` once the bid
+    reaches their price, and optional take profit / stop loss brackets on
+    entries. Positions are long only, as in the live pipeline.
+    """
+
+    def __init__(
+        self,
+        precision: int,
+        spread: float = 0.0,
+        order_size: int = 100000,
+        initial_balance: float = 100000.0,
+        stop_loss_pips: Optional[float] = None,
+        take_profit_pips: Optional[float] = None,
+        qtrader: Optional[QLearningTrader] = None,
+        verbose: bool = True,
+    ):
+        self.precision = precision
+        self.spread = spread
+        self.order_size = order_size
+        self.initial_balance = initial_balance
+        self.stop_loss_pips = stop_loss_pips
+        self.take_profit_pips = take_profit_pips
+        self.verbose = verbose
+        self.qtrader = qtrader or QLearningTrader(
+            num_actions=3,
+            num_features=11,
+            learning_rate=0.01,
+            discount_factor=0.9,
+            exploration_prob=0.1,
+        )
+
+    def prepare(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calculate the technical indicators if the candles do not carry
+        them yet.
+
+        Args:
+            df (pd.DataFrame): input dataframe that contains
+            candlestick data
+
+        Returns:
+            pd.DataFrame: candles with the technical indicators
+        """
+        if set(INDICATOR_COLUMNS).issubset(df.columns):
+            return df
+        return calculate_indicators(df.copy(), fast=True).dropna(inplace=False)
+
+    def run(self, df: pd.DataFrame) -> BacktestResult:
+        """
+        Replay the candles and simulate the orders of the agent.
+
+        The agent decides on bar i and the decision is executed at the
+        close of bar i + 1 against the support and resistance of bar i,
+        which is the order of events in the live pipeline.
+
+        Args:
+            df (pd.DataFrame): input dataframe that contains
+            candlestick data, with or without indicators
+
+        Returns:
+            BacktestResult: equity curve, closed trades and summary stats
+        """
+        df = self.prepare(df)
+        actions, _ = self.qtrader.train_vectorized(df, verbose=self.verbose)
+        return self.simulate(df, actions)
+
+    def simulate(self, df: pd.DataFrame, actions: Sequence[int]) -> BacktestResult:
+        """
+        Simulate the orders of given decisions, e.g. of one agent of a
+        `BatchQLearningTrader`.
+
+        Args:
+            df (pd.DataFrame): candles with the technical indicators
+            actions (Sequence[int]): action decided on every candle but
+            the last one
+
+        Returns:
+            BacktestResult: equity curve, closed trades and summary stats
+        """
+        actions = np.asarray(actions).tolist()
+        high = df["High"].to_numpy(dtype=np.float64).tolist()
+        low = df["Low"].to_numpy(dtype=np.float64).tolist()
+        close = df["Close"].to_numpy(dtype=np.float64).tolist()
+        resistance = df["resistance"].to_numpy(dtype=np.float64).tolist()
+        support = df["support"].to_numpy(dtype=np.float64).tolist()
+
+        half_spread = self.spread / 2
+        tolerance = 1 * 10**-self.precision
+        units = self.order_size
+        n = len(close)
+
+        balance = self.initial_balance
+        equity = np.full(n, self.initial_balance)
+        trades: List[tuple] = []
+
+        in_position = False
+        entry_price = entry_bar = 0.0
+        take_profit = stop_loss = None  # bracket levels of the open trade
+        exit_limit = None  # pending limit sell placed by the TP/SL rules
+
+        def close_position(bar: int, price: float, reason: str) -> None:
+            nonlocal balance, in_position, exit_limit, take_profit, stop_loss
+            pnl = units * (price - entry_price)
+            balance += pnl
+            trades.append((entry_bar, bar, entry_price, price, pnl, reason))
+            in_position = False
+            exit_limit = take_profit = stop_loss = None
+
+        for j in range(1, n):
+            # Orders resting on the server are filled first, during the bar
+            if in_position:
+                bid_high = high[j] - half_spread
+                bid_low = low[j] - half_spread
+                if stop_loss is not None and bid_low <= stop_loss:
+                    close_position(j, stop_loss, "stop_loss")
+                elif take_profit is not None and bid_high >= take_profit:
+                    close_position(j, take_profit, "take_profit")
+                elif exit_limit is not None and bid_high >= exit_limit[0]:
+                    close_position(j, exit_limit[0], exit_limit[1])
+
+            # The decision on bar j - 1 is acted upon at the close of bar j
+            action = actions[j - 1]
+            price = close[j]
+            level_r = resistance[j - 1]
+            level_s = support[j - 1]
+            if action == ACTION_BUY and not in_position:
+                entry_price = price + half_spread
+                entry_bar = j
+                in_position = True
+                if self.take_profit_pips is not None:
+                    take_profit = entry_price + self.take_profit_pips
+                if self.stop_loss_pips is not None:
+                    stop_loss = entry_price - self.stop_loss_pips
+            elif action == ACTION_SELL and in_position:
+                close_position(j, price - half_spread, "sell")
+            elif (
+                in_position
+                and abs(price - level_r) <= tolerance
+                and round(entry_price, self.precision) < level_r
+            ):
+                exit_limit = (level_r, "take_profit_limit")
+            elif (
+                in_position
+                and price <= level_s
+                and round(entry_price, self.precision) > level_s
+            ):
+                exit_limit = (level_s, "stop_loss_limit")
+
+            equity[j] = balance
+            if in_position:
+                equity[j] += units * (price - half_spread - entry_price)
+
+        if in_position:
+            close_position(n - 1, close[-1] - half_spread, "end_of_data")
+            equity[-1] = balance
+
+        trades_df = pd.DataFrame(
+            trades,
+            columns=[
+                "entry_bar",
+                "exit_bar",
+                "entry_price",
+                "exit_price",
+                "pnl",
+                "reason",
+            ],
+        )
+        if len(trades_df):
+            trades_df["entry_time"] = df.index[trades_df["entry_bar"].to_numpy()]
+            trades_df["exit_time"] = df.index[trades_df["exit_bar"].to_numpy()]
+        equity_curve = pd.Series(equity, index=df.index, name="equity")
+        return BacktestResult(
+            equity=equity_curve,
+            trades=trades_df,
+            stats=self.summarize(equity, trades_df),
+        )
+
+    def summarize(self, equity: np.ndarray, trades: pd.DataFrame) -> Dict[str, float]:
+        """
+        Summarize the performance of a backtest.
+
+        Args:
+            equity (np.ndarray): equity at every bar
+            trades (pd.DataFrame): closed trades
+
+        Returns:
+            Dict[str, float]: summary statistics
+        """
+        running_max = np.maximum.accumulate(equity)
+        drawdown = equity - running_max
+        returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.array([])
+        std = returns.std() if len(returns) else 0.0
+        pnl = trades["pnl"].to_numpy() if len(trades) else np.array([])
+        return {
+            "final_equity": float(equity[-1]),
+            "total_pnl": float(equity[-1] - self.initial_balance),
+            "return": float(equity[-1] / self.initial_balance - 1),
+            "num_trades": int(len(pnl)),
+            "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+            "max_drawdown": float(drawdown.min()),
+            "max_drawdown_pct": float((drawdown / running_max).min()),
+            "sharpe_per_bar": float(returns.mean() / std) if std > 0 else 0.0,
+        }
+
+
+def main():
+    """Backtest the agent on candles stored in a CSV file or a feature store."""
+    parser = argparse.ArgumentParser(description="Backtest the Q-learning agent.")
+    parser.add_argument(
+        "path", help="CSV file with Time, Open, High, Low, Close or a .features store"
+    )
+    parser.add_argument("instrument", help="currency pair of the candles")
+    parser.add_argument("--config", default="./cfg/parameters.yaml")
+    parser.add_argument("--spread", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    cfg = parse_yml(args.config)
+    if args.path.endswith(".features"):
+        df = SharedFeatureStore.open(args.path).to_frame()
+    else:
+        df = pd.read_csv(args.path, index_col="Time", parse_dates=True)
+    backtester = Backtester(
+        cfg["instrument_precision"][args.instrument], spread=args.spread
+    )
+    result = backtester.run(df[["High", "Close", "Low", "Open"]])
+    logger.info(f"Backtest results: {result.stats}")
+
+
+if __name__ == "__main__":
+    main()
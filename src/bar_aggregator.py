@@ -0,0 +1,96 @@
+from typing import List, NamedTuple, Sequence
+
+from src.utils import GRANULARITY_SECONDS
+
+
+class Bar(NamedTuple):
+    granularity: str
+    time: int  # start of the bar in epoch nanoseconds, UTC
+    open: float
+    high: float
+    low: float
+    close: float
+    count: int
+
+
+class _OpenBar:
+    __slots__ = ("start", "open", "high", "low", "close", "count")
+
+    def __init__(self, start: int, price: float):
+        self.start = start
+        self.open = self.high = self.low = self.close = price
+        self.count = 1
+
+
+class BarAggregator:
+    """
+    Event-time OHLC aggregation of ticks into bars of several sizes.
+
+    Ticks are bucketed by their own timestamp, so bars do not depend on
+    the host clock and are reproduced exactly under replay. Every bar
+    keeps its running open, high, low, close and tick count, which makes
+    an update O(1) per bar size. A bar is emitted once the first tick of
+    a later bucket arrives. Ticks older than the open bar are dropped.
+    """
+
+    def __init__(self, granularities: Sequence[str] = ("M1",)):
+        self.granularities = list(granularities)
+        self.sizes = [GRANULARITY_SECONDS[g] * 10**9 for g in self.granularities]
+        self.bars: List[_OpenBar] = [None] * len(self.granularities)
+        self.late_ticks = 0
+
+    def update(self, time: int, price: float) -> List[Bar]:
+        """
+        Add a tick to the open bars.
+
+        Args:
+            time (int): time of the tick in epoch nanoseconds
+            price (float): price of the tick
+
+        Returns:
+            List[Bar]: bars completed by this tick, usually none
+        """
+        completed = []
+        late = False
+        for i, size in enumerate(self.sizes):
+            bar = self.bars[i]
+            start = time - time % size
+            if bar is None or start > bar.start:
+                if bar is not None:
+                    completed.append(self._close(i, bar))
+                self.bars[i] = _OpenBar(start, price)
+            elif start == bar.start:
+                if price > bar.high:
+                    bar.high = price
+                elif price < bar.low:
+                    bar.low = price
+                bar.close = price
+                bar.count += 1
+            else:
+                late = True
+        self.late_ticks += late
+        return completed
+
+    def flush(self) -> List[Bar]:
+        """
+        Emit the bars that are still open, e.g. at the end of a replay.
+
+        Returns:
+            List[Bar]: the open bars
+        """
+        completed = [
+            self._close(i, bar) for i, bar in enumerate(self.bars) if bar is not None
+        ]
+        self.bars = [None] * len(self.granularities)
+        return completed
+
+    def _close(self, i: int, bar: _OpenBar) -> Bar:
+        return Bar(
+            self.granularities[i],
+            bar.start,
+            bar.open,
+            bar.high,
+            bar.low,
+            bar.close,
+            bar.count,
+        )
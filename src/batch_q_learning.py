@@ -0,0 +1,203 @@
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.state_encoder import ArgmaxEncoder, StateEncoder
+
+
+class BatchQLearningTrader:
+    """
+    K tabular Q-learning agents stepped together.
+
+    The Q-tables are stacked into one (num_tables, num_states,
+    num_actions) tensor and every bar chooses the actions and applies the
+    TD updates of all agents with a handful of NumPy operations, using
+    `np.add.at` so that agents sharing a table accumulate their updates.
+    Hyperparameters may differ per agent. Each agent follows the update
+    rule of `QLearningTrader.train_vectorized`.
+    """
+
+    def __init__(
+        self,
+        num_agents: int,
+        num_actions: int,
+        num_states: int,
+        learning_rate: Union[float, Sequence[float]],
+        discount_factor: Union[float, Sequence[float]],
+        exploration_prob: Union[float, Sequence[float]],
+        table_index: Optional[Sequence[int]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.num_agents = num_agents
+        self.num_actions = num_actions
+        self.num_states = num_states
+        self.learning_rate = np.broadcast_to(
+            np.asarray(learning_rate, dtype=np.float64), num_agents
+        )
+        self.discount_factor = np.broadcast_to(
+            np.asarray(discount_factor, dtype=np.float64), num_agents
+        )
+        self.exploration_prob = np.broadcast_to(
+            np.asarray(exploration_prob, dtype=np.float64), num_agents
+        )
+
+        # Agent k reads and writes table table_index[k], one table each by default
+        if table_index is None:
+            table_index = np.arange(num_agents)
+        self.table_index = np.asarray(table_index, dtype=np.int64)
+        num_tables = int(self.table_index.max()) + 1
+        self.q_table = np.zeros((num_tables, num_states, num_actions))
+
+        self.rng = np.random.default_rng(seed)
+        self.agents = np.arange(num_agents)
+        self.current_action = np.full(num_agents, -1, dtype=np.int64)
+        self.cumulative_reward = np.zeros(num_agents)
+
+    def choose_actions(
+        self, states: np.ndarray, active: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Choose an action for every agent.
+
+        Args:
+            states (np.ndarray): state id of every agent
+            active (Optional[np.ndarray], optional): mask of the agents
+            that decide on this bar. Defaults to all.
+
+        Returns:
+            np.ndarray: action of every agent, -1 for inactive agents
+        """
+        q_rows = self.q_table[self.table_index, states]
+        explore = self.rng.random(self.num_agents) < self.exploration_prob
+        random_actions = self.rng.integers(self.num_actions, size=self.num_agents)
+        actions = np.where(explore, random_actions, q_rows.argmax(axis=1))
+        if active is not None:
+            actions = np.where(active, actions, -1)
+        return actions
+
+    def step(
+        self,
+        states: np.ndarray,
+        rewards: np.ndarray,
+        active: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Choose the actions of a bar and update the Q-tables with the
+        rewards of the chosen actions.
+
+        Args:
+            states (np.ndarray): state id of every agent
+            rewards (np.ndarray): reward of every action for every agent,
+            shaped (num_agents, num_actions)
+            active (Optional[np.ndarray], optional): mask of the agents
+            that decide on this bar. Defaults to all.
+
+        Returns:
+            np.ndarray: action of every agent, -1 for inactive agents
+        """
+        actions = self.choose_actions(states, active)
+        acting = actions >= 0
+        reward = np.where(acting, rewards[self.agents, np.maximum(actions, 0)], 0.0)
+        self.cumulative_reward += reward
+
+        # TD update of the previous action in the current state
+        update = acting & (self.current_action >= 0)
+        agents = self.agents[update]
+        tables = self.table_index[agents]
+        state_ids = states[agents]
+        previous = self.current_action[agents]
+        q_rows = self.q_table[tables, state_ids]
+        current_q = q_rows[np.arange(len(agents)), previous]
+        target = reward[agents] + self.discount_factor[agents] * q_rows.max(axis=1)
+        delta = self.learning_rate[agents] * (target - current_q)
+        np.add.at(self.q_table, (tables, state_ids, previous), delta)
+
+        self.current_action = np.where(acting, actions, self.current_action)
+        return actions
+
+    def update(
+        self,
+        states: np.ndarray,
+        current_close: np.ndarray,
+        next_close: np.ndarray,
+        active: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Live counterpart of `QLearningTrader.update` for all agents, e.g.
+        one per instrument of a multi-instrument runner.
+
+        Args:
+            states (np.ndarray): state id of every agent
+            current_close (np.ndarray): closing price the state refers to
+            next_close (np.ndarray): closing price of the new candle
+            active (Optional[np.ndarray], optional): mask of the agents
+            with a new candle. Defaults to all.
+
+        Returns:
+            np.ndarray: action of every agent, -1 for inactive agents
+        """
+        price_change = (next_close - current_close) / current_close
+        rewards = np.column_stack((price_change, -price_change, price_change))
+        return self.step(states, rewards, active)
+
+    def train(
+        self, states: np.ndarray, rewards: np.ndarray, verbose: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Train all agents over aligned histories.
+
+        Args:
+            states (np.ndarray): state ids shaped (num_agents, T)
+            rewards (np.ndarray): rewards shaped (num_agents, T - 1,
+            num_actions)
+            verbose (bool, optional): log the progress. Defaults to True.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: actions shaped (num_agents,
+            T - 1) and the cumulative reward of every agent
+        """
+        if verbose:
+            logger.info(f"Training {self.num_agents} Q-learning agents (batched)...")
+        steps = rewards.shape[1]
+        actions = np.empty((self.num_agents, steps), dtype=np.int64)
+        for t in range(steps):
+            actions[:, t] = self.step(states[:, t], rewards[:, t])
+        if verbose:
+            logger.info(
+                f"Training complete. Steps: {steps}, "
+                f"Mean cumulative reward: {self.cumulative_reward.mean()}"
+            )
+        return actions, self.cumulative_reward.copy()
+
+
+def prepare_batch_arrays(
+    frames: List[pd.DataFrame],
+    encoder: Union[ArgmaxEncoder, StateEncoder, None] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack the training arrays of several candle histories, e.g. one per
+    instrument, trimmed to the length of the shortest one.
+
+    Args:
+        frames (List[pd.DataFrame]): input candlestick data per agent
+        encoder (Union[ArgmaxEncoder, StateEncoder, None], optional):
+        state encoder shared by the agents. Defaults to the legacy
+        argmax encoding.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: state ids shaped (K, T) and
+        rewards shaped (K, T - 1, 3)
+    """
+    length = min(len(df) for df in frames)
+    states, rewards = [], []
+    for df in frames:
+        start = len(df) - length
+        df = df.iloc[start:]
+        encode = encoder or ArgmaxEncoder(df.shape[1])
+        states.append(encode.encode_array(df.to_numpy(dtype=np.float64)))
+        closes = df["Close"].to_numpy(dtype=np.float64)
+        price_change = (closes[1:] - closes[:-1]) / closes[:-1]
+        rewards.append(np.column_stack((price_change, -price_change, price_change)))
+    return np.stack(states), np.stack(rewards)
@@ -0,0 +1,469 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.candle_parser import candles_to_frame
+from src.fetch_historical_data import FetchHistoricalData
+from src.q_learning import QLearningTrader
+from src.streaming_pipeline import StreamingDataPipeline
+from src.tick_recorder import replay_ticks
+from src.utils import (
+    calculate_indicators,
+    calculate_macd,
+    calculate_rsi,
+    calculate_sma,
+    calculate_stochastic_oscillator,
+    calculate_support_resistance,
+    get_candlestick_data,
+)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+Setup = Callable[[int], Tuple[Callable[[], Any], int]]
+BENCHMARKS: Dict[str, Tuple[Setup, Optional[int]]] = {}
+
+
+class InsufficientData(ValueError):
+    """The recorded data is shorter than the requested size."""
+
+
+# Recorded data replacing the synthetic data when given on the command line
+RECORDED: Dict[str, Optional[str]] = {"candles": None, "ticks": None}
+
+
+def register_benchmark(name: str, max_size: Optional[int] = None) -> Callable:
+    """
+    Register a benchmark. The decorated setup function takes the size
+    and returns the function to time and the number of items, e.g. bars
+    or ticks, it processes.
+
+    Args:
+        name (str): name of the benchmark
+        max_size (Optional[int], optional): largest size worth running,
+        for the slow legacy paths. Defaults to no limit.
+
+    Returns:
+        Callable: function decorator
+    """
+
+    def decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name] = (setup, max_size)
+        return setup
+
+    return decorator
+
+
+@lru_cache(maxsize=None)
+def synthetic_candles(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Random walk M1 candles, or the first n recorded candles.
+
+    Args:
+        n (int): number of candles
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: candles indexed by time
+    """
+    if RECORDED["candles"] is not None:
+        df = pd.read_csv(RECORDED["candles"], index_col="Time", parse_dates=True)
+        if len(df) < n:
+            raise InsufficientData(f"only {len(df)} recorded candles")
+        return df[["High", "Close", "Low", "Open"]].iloc[:n]
+    rng = np.random.default_rng(seed)
+    close = 1.1 + np.cumsum(rng.normal(0, 1e-4, n))
+    open = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 5e-5, n))
+    index = pd.date_range(
+        "2024-01-01", periods=n, freq="min", tz="Asia/Singapore", name="Time"
+    )
+    return pd.DataFrame(
+        {
+            "High": np.maximum(open, close) + spread,
+            "Close": close,
+            "Low": np.minimum(open, close) - spread,
+            "Open": open,
+        },
+        index=index,
+    )
+
+
+@lru_cache(maxsize=None)
+def synthetic_indicators(n: int) -> pd.DataFrame:
+    """Candles with the technical indicators, as fed to the agent."""
+    return calculate_indicators(synthetic_candles(n).copy()).dropna()
+
+
+@lru_cache(maxsize=None)
+def synthetic_api_candles(n: int) -> List[Dict]:
+    """Candles in the format of an `InstrumentsCandles` response."""
+    df = synthetic_candles(n)
+    times = df.index.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S.000000000Z")
+    return [
+        {
+            "complete": True,
+            "volume": 10,
+            "time": t,
+            "mid": {"o": f"{o:.5f}", "h": f"{h:.5f}", "l": f"{lo:.5f}", "c": f"{c:.5f}"},
+        }
+        for t, h, c, lo, o in zip(times, *df.to_numpy().T.tolist())
+    ]
+
+
+@lru_cache(maxsize=None)
+def synthetic_ticks(n: int, seed: int = 1) -> List[Dict]:
+    """
+    Pricing stream messages five seconds apart, or the first n recorded
+    ticks.
+
+    Args:
+        n (int): number of ticks
+        seed (int, optional): random seed. Defaults to 1.
+
+    Returns:
+        List[Dict]: tick data in the format of the pricing stream
+    """
+    if RECORDED["ticks"] is not None:
+        ticks = []
+        for tick in replay_ticks(RECORDED["ticks"]):
+            ticks.append(tick)
+            if len(ticks) == n:
+                return ticks
+        raise InsufficientData(f"only {len(ticks)} recorded ticks")
+    rng = np.random.default_rng(seed)
+    mid = 1.1 + np.cumsum(rng.normal(0, 1e-5, n))
+    start = pd.Timestamp("2024-02-01", tz="UTC").value
+    times = pd.to_datetime(start + np.arange(n) * 5 * 10**9, utc=True)
+    times = times.strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+    return [
+        {
+            "type": "PRICE",
+            "instrument": "EUR_USD",
+            "time": t,
+            "closeoutBid": f"{price - 5e-5:.5f}",
+            "closeoutAsk": f"{price + 5e-5:.5f}",
+        }
+        for t, price in zip(times, mid.tolist())
+    ]
+
+
+class BenchmarkClient:
+    """
+    Stand-in for `oandapyV20.API` answering every request from memory
+    with a canned response, so that the REST round-trips are excluded
+    from the timings.
+    """
+
+    def __init__(self, candles: Optional[List[Dict]] = None):
+        self.candles = candles or []
+        self.requests = 0
+
+    def request(self, endpoint: Any) -> Any:
+        self.requests += 1
+        name = type(endpoint).__name__
+        if name.endswith("Stream"):
+            return iter(())
+        if name == "InstrumentsCandles":
+            response = {"candles": self.candles}
+        elif name == "OpenPositions":
+            response = {"positions": []}
+        elif name == "OpenTrades":
+            response = {"trades": []}
+        else:
+            response = {}
+        endpoint.response = response
+        return response
+
+
+class _NullWriter:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _calculate(function: Callable[[pd.DataFrame], pd.DataFrame]) -> Setup:
+    def setup(n: int) -> Tuple[Callable[[], Any], int]:
+        df = synthetic_candles(n).copy()
+        return (lambda: function(df)), n
+
+    return setup
+
+
+register_benchmark("calculate_indicators")(_calculate(calculate_indicators))
+register_benchmark("calculate_indicators_fast")(
+    _calculate(lambda df: calculate_indicators(df, fast=True))
+)
+register_benchmark("calculate_sma")(_calculate(calculate_sma))
+register_benchmark("calculate_rsi")(_calculate(calculate_rsi))
+register_benchmark("calculate_macd")(_calculate(calculate_macd))
+register_benchmark("calculate_stochastic_oscillator")(
+    _calculate(calculate_stochastic_oscillator)
+)
+register_benchmark("calculate_support_resistance")(
+    _calculate(calculate_support_resistance)
+)
+
+
+@register_benchmark("get_candlestick_data", max_size=10_000)
+def bench_get_candlestick_data(n: int) -> Tuple[Callable[[], Any], int]:
+    # One call per bar of twelve mid prices
+    prices = [1.1 + 1e-5 * i for i in range(12)]
+    now = pd.Timestamp("2024-01-01")
+
+    def run() -> None:
+        for _ in range(n):
+            get_candlestick_data(now, prices)
+
+    return run, n
+
+
+@register_benchmark("parse_candles")
+def bench_parse_candles(n: int) -> Tuple[Callable[[], Any], int]:
+    candles = synthetic_api_candles(n)
+    return (lambda: candles_to_frame(candles)), n
+
+
+@register_benchmark("fetch_historical_data")
+def bench_fetch_historical_data(n: int) -> Tuple[Callable[[], Any], int]:
+    fetcher = FetchHistoricalData("EUR_USD", "M1", token="", count=n)
+    fetcher.client = BenchmarkClient(synthetic_api_candles(n))
+    return fetcher.fetch_and_process_data, n
+
+
+def _trader(df: pd.DataFrame) -> QLearningTrader:
+    np.random.seed(0)
+    return QLearningTrader(
+        num_actions=3,
+        num_features=df.shape[1],
+        learning_rate=0.01,
+        discount_factor=0.9,
+        exploration_prob=0.1,
+    )
+
+
+@register_benchmark("q_learning_train", max_size=10_000)
+def bench_q_learning_train(n: int) -> Tuple[Callable[[], Any], int]:
+    df = synthetic_indicators(n)
+    qtrader = _trader(df)
+    return (lambda: qtrader.train(df)), len(df)
+
+
+@register_benchmark("q_learning_train_vectorized")
+def bench_q_learning_train_vectorized(n: int) -> Tuple[Callable[[], Any], int]:
+    df = synthetic_indicators(n)
+    qtrader = _trader(df)
+    return (lambda: qtrader.train_vectorized(df, verbose=False)), len(df)
+
+
+@register_benchmark("process_tick")
+def bench_process_tick(n: int) -> Tuple[Callable[[], Any], int]:
+    ticks = synthetic_ticks(n)
+    pipeline = StreamingDataPipeline(
+        "benchmark",
+        {"instruments": ticks[0]["instrument"] if ticks else "EUR_USD"},
+        BenchmarkClient(),
+        synthetic_indicators(1_000),
+        precision=4,
+        stop_loss_pips=1e-4,
+        take_profit_pips=2e-4,
+    )
+    np.random.seed(0)
+
+    def run() -> None:
+        process_tick = pipeline.process_tick
+        for tick in ticks:
+            process_tick(tick)
+
+    return run, n
+
+
+def measure(setup: Setup, size: int, repeat: int = 3) -> Dict[str, float]:
+    """
+    Time a benchmark and measure the peak memory it allocates.
+
+    The best of `repeat` runs is reported, each on a fresh setup. The
+    peak memory is traced in a separate run, since tracing slows the
+    code down.
+
+    Args:
+        setup (Setup): setup function of the benchmark
+        size (int): size of the data
+        repeat (int, optional): number of timed runs. Defaults to 3.
+
+    Returns:
+        Dict[str, float]: seconds, items per second and peak memory in MB
+    """
+    best = float("inf")
+    items = size
+    with contextlib.redirect_stdout(_NullWriter()):
+        for _ in range(repeat):
+            run, items = setup(size)
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+
+        run, items = setup(size)
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "seconds": best,
+        "items": items,
+        "throughput": items / best if best > 0 else float("inf"),
+        "peak_memory_mb": peak / 2**20,
+    }
+
+
+def run_benchmarks(
+    names: Optional[Sequence[str]] = None,
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    repeat: int = 3,
+) -> Dict[str, Any]:
+    """
+    Run the benchmarks at every size.
+
+    Args:
+        names (Optional[Sequence[str]], optional): benchmarks to run.
+        Defaults to all.
+        sizes (Sequence[int], optional): data sizes. Defaults to
+        `DEFAULT_SIZES`.
+        repeat (int, optional): number of timed runs. Defaults to 3.
+
+    Returns:
+        Dict[str, Any]: environment and the result of every benchmark
+    """
+    results = []
+    logger.disable("src")
+    try:
+        for name in names or BENCHMARKS:
+            setup, max_size = BENCHMARKS[name]
+            for size in sizes:
+                if max_size is not None and size > max_size:
+                    continue
+                try:
+                    stats = measure(setup, size, repeat)
+                except InsufficientData as e:
+                    print(f"{name:<32} {size:>9,} skipped: {e}")
+                    continue
+                result = {"name": name, "size": size, **stats}
+                results.append(result)
+                print(
+                    f"{name:<32} {size:>9,} {result['seconds'] * 1e3:>11.2f} ms "
+                    f"{result['throughput']:>14,.0f} /s "
+                    f"{result['peak_memory_mb']:>9.1f} MB",
+                    flush=True,
+                )
+    finally:
+        logger.enable("src")
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "recorded": dict(RECORDED),
+        "results": results,
+    }
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2
+) -> List[Dict[str, Any]]:
+    """
+    Compare the timings of a report with a baseline.
+
+    Args:
+        report (Dict[str, Any]): output of `run_benchmarks`
+        baseline (Dict[str, Any]): stored output of `run_benchmarks`
+        tolerance (float, optional): relative slowdown tolerated before a
+        benchmark counts as a regression. Defaults to 0.2.
+
+    Returns:
+        List[Dict[str, Any]]: benchmarks slower than the baseline by more
+        than the tolerance
+    """
+    reference = {(r["name"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        base = reference.get((result["name"], result["size"]))
+        if base is None:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        marker = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(
+            f"{result['name']:<32} {result['size']:>9,} "
+            f"{base['seconds'] * 1e3:>11.2f} ms -> "
+            f"{result['seconds'] * 1e3:>11.2f} ms {ratio:>6.2f}x {marker}"
+        )
+        if marker:
+            regressions.append({**result, "baseline_seconds": base["seconds"]})
+    return regressions
+
+
+def main():
+    """Run the benchmark suite and compare it with the stored baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths.")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--candles", default=None, help="CSV of recorded candles")
+    parser.add_argument("--ticks", default=None, help="tick recording to replay")
+    parser.add_argument("--output", default="./data/benchmarks/results.json")
+    parser.add_argument("--baseline", default="./benchmarks/baseline.json")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--list", action="store_true", help="list the benchmarks")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    RECORDED.update(candles=args.candles, ticks=args.ticks)
+
+    report = run_benchmarks(args.names, args.sizes, args.repeat)
+    paths = [args.output] + ([args.baseline] if args.save_baseline else [])
+    for path in paths:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    logger.info(f"Saved the results to {', '.join(paths)}.")
+
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            logger.error(f"{len(regressions)} benchmarks regressed.")
+            sys.exit(1)
+        logger.info("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
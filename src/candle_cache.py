@@ -0,0 +1,319 @@
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import oandapyV20
+import oandapyV20.endpoints.instruments as instruments
+import pandas as pd
+from loguru import logger
+
+from src.candle_parser import parse_candles
+
+CANDLE_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),  # epoch nanoseconds, UTC
+        ("Open", "<f8"),
+        ("High", "<f8"),
+        ("Low", "<f8"),
+        ("Close", "<f8"),
+    ]
+)
+NS_PER_DAY = 86_400 * 10**9
+
+
+def candles_to_records(candles: List[Dict]) -> np.ndarray:
+    """
+    Convert complete candles from the API into structured records.
+    Incomplete candles are dropped so that they never get persisted.
+
+    Args:
+        candles (List[Dict]): candles from the API response
+
+    Returns:
+        np.ndarray: records with the CANDLE_DTYPE layout
+    """
+    arrays = parse_candles(candles, complete_only=True)
+    records = np.empty(len(arrays["time"]), dtype=CANDLE_DTYPE)
+    for column in CANDLE_DTYPE.names:
+        records[column] = arrays[column]
+    return records
+
+
+def records_to_frame(
+    records: np.ndarray, timezone: str = "Asia/Singapore"
+) -> pd.DataFrame:
+    """
+    Convert structured records into the dataframe layout produced by
+    `FetchHistoricalData.fetch_and_process_data`.
+
+    Args:
+        records (np.ndarray): records with the CANDLE_DTYPE layout
+        timezone (str, optional): timezone of the index.
+        Defaults to "Asia/Singapore".
+
+    Returns:
+        pd.DataFrame: candles indexed by time
+    """
+    index = pd.to_datetime(records["time"], utc=True).tz_convert(timezone)
+    index.name = "Time"
+    return pd.DataFrame(
+        {column: records[column] for column in ["High", "Close", "Low", "Open"]},
+        index=index,
+    )
+
+
+class CandleCache:
+    """
+    Persistent on-disk candle cache partitioned by instrument,
+    granularity and UTC day.
+
+    Every partition is a `.npy` file of structured records that is read
+    memory-mapped. Updates only fetch the candles after the last stored
+    timestamp, paging through the API so that arbitrarily long histories
+    can be backfilled.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        client: Optional[oandapyV20.API] = None,
+        page_size: int = 5000,
+    ):
+        self.root = root
+        self.client = client
+        self.page_size = page_size
+
+    def partition_dir(self, instrument: str, granularity: str) -> str:
+        return os.path.join(self.root, instrument, granularity)
+
+    def partitions(self, instrument: str, granularity: str) -> List[str]:
+        """
+        List the partition files of an instrument in time order.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity, e.g. "M1"
+
+        Returns:
+            List[str]: paths of the partition files
+        """
+        directory = self.partition_dir(instrument, granularity)
+        if not os.path.isdir(directory):
+            return []
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".npy"))
+        return [os.path.join(directory, name) for name in names]
+
+    def last_timestamp(self, instrument: str, granularity: str) -> Optional[int]:
+        """
+        Get the timestamp of the latest stored candle.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+
+        Returns:
+            Optional[int]: epoch nanoseconds or None if nothing is stored
+        """
+        for path in reversed(self.partitions(instrument, granularity)):
+            records = np.load(path, mmap_mode="r")
+            if len(records):
+                return int(records["time"][-1])
+        return None
+
+    def write(self, instrument: str, granularity: str, records: np.ndarray) -> None:
+        """
+        Merge records into the day partitions, replacing candles with the
+        same timestamp.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            records (np.ndarray): records with the CANDLE_DTYPE layout
+        """
+        if not len(records):
+            return
+        directory = self.partition_dir(instrument, granularity)
+        os.makedirs(directory, exist_ok=True)
+
+        days = records["time"] // NS_PER_DAY
+        for day in np.unique(days):
+            new = records[days == day]
+            name = pd.Timestamp(int(day) * NS_PER_DAY, tz="UTC")
+            path = os.path.join(directory, f"{name:%Y-%m-%d}.npy")
+            if os.path.exists(path):
+                new = np.concatenate([np.load(path), new])
+            # Keep the latest version of every timestamp, in time order
+            _, last = np.unique(new["time"][::-1], return_index=True)
+            merged = new[::-1][last]
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, merged)
+            os.replace(tmp_path, path)
+
+    def read(
+        self,
+        instrument: str,
+        granularity: str,
+        start: Union[str, pd.Timestamp, None] = None,
+        end: Union[str, pd.Timestamp, None] = None,
+    ) -> np.ndarray:
+        """
+        Read the stored records between two timestamps.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            start (Union[str, pd.Timestamp, None], optional): inclusive
+            start. Defaults to the first stored candle.
+            end (Union[str, pd.Timestamp, None], optional): inclusive end.
+            Defaults to the last stored candle.
+
+        Returns:
+            np.ndarray: records with the CANDLE_DTYPE layout
+        """
+        start_ns = _to_ns(start) if start is not None else None
+        end_ns = _to_ns(end) if end is not None else None
+        chunks = []
+        for path in self.partitions(instrument, granularity):
+            day = int(pd.Timestamp(os.path.basename(path)[:-4], tz="UTC").value)
+            if start_ns is not None and day + NS_PER_DAY <= start_ns:
+                continue
+            if end_ns is not None and day > end_ns:
+                break
+            records = np.load(path, mmap_mode="r")
+            lo = 0 if start_ns is None else np.searchsorted(records["time"], start_ns)
+            hi = (
+                len(records)
+                if end_ns is None
+                else np.searchsorted(records["time"], end_ns, side="right")
+            )
+            chunks.append(records[lo:hi])
+        if not chunks:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.concatenate(chunks)
+
+    def fetch_range(
+        self,
+        instrument: str,
+        granularity: str,
+        start: Union[str, pd.Timestamp],
+        end: Union[str, pd.Timestamp, None] = None,
+    ) -> np.ndarray:
+        """
+        Page through the candles after `start` (exclusive) up to `end`
+        with one request per `page_size` candles.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            start (Union[str, pd.Timestamp]): exclusive start
+            end (Union[str, pd.Timestamp, None], optional): inclusive end.
+            Defaults to now.
+
+        Returns:
+            np.ndarray: records with the CANDLE_DTYPE layout
+        """
+        end_ns = _to_ns(end) if end is not None else None
+        cursor = _to_rfc3339(_to_ns(start))
+        pages = []
+        while True:
+            params = {
+                "granularity": granularity,
+                "price": "M",
+                "from": cursor,
+                "count": self.page_size,
+                "includeFirst": False,
+            }
+            r = instruments.InstrumentsCandles(instrument=instrument, params=params)
+            self.client.request(r)
+            candles = r.response["candles"]
+            if not candles:
+                break
+            records = candles_to_records(candles)
+            if end_ns is not None:
+                records = records[records["time"] <= end_ns]
+            pages.append(records)
+
+            # A short page means the end, the forming candle or the latest
+            # available candle was reached
+            if len(records) < self.page_size:
+                break
+            cursor = _to_rfc3339(int(records["time"][-1]))
+
+        if not pages:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.concatenate(pages)
+
+    def update(
+        self,
+        instrument: str,
+        granularity: str,
+        count: int = 5000,
+        start: Union[str, pd.Timestamp, None] = None,
+    ) -> np.ndarray:
+        """
+        Fetch the candles missing since the last stored timestamp and
+        store them. An empty cache is filled from `start`, or with the
+        latest `count` candles when no start is given.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            count (int, optional): number of candles to seed an empty
+            cache with. Defaults to 5000.
+            start (Union[str, pd.Timestamp, None], optional): backfill
+            start for an empty cache. Defaults to None.
+
+        Returns:
+            np.ndarray: the newly stored records
+        """
+        last = self.last_timestamp(instrument, granularity)
+        if last is not None:
+            records = self.fetch_range(instrument, granularity, last)
+        elif start is not None:
+            records = self.fetch_range(instrument, granularity, _to_ns(start) - 1)
+        else:
+            params = {"granularity": granularity, "price": "M", "count": count}
+            r = instruments.InstrumentsCandles(instrument=instrument, params=params)
+            self.client.request(r)
+            records = candles_to_records(r.response["candles"])
+
+        self.write(instrument, granularity, records)
+        logger.info(f"Cached {len(records)} new {granularity} candles for {instrument}.")
+        return records
+
+    def load(
+        self,
+        instrument: str,
+        granularity: str,
+        count: int = 5000,
+        timezone: str = "Asia/Singapore",
+    ) -> pd.DataFrame:
+        """
+        Bring the cache up to date and return the latest `count` candles.
+
+        Args:
+            instrument (str): currency pair
+            granularity (str): candle granularity
+            count (int, optional): number of candles. Defaults to 5000.
+            timezone (str, optional): timezone of the index.
+            Defaults to "Asia/Singapore".
+
+        Returns:
+            pd.DataFrame: candles indexed by time
+        """
+        self.update(instrument, granularity, count)
+        records = self.read(instrument, granularity)
+        return records_to_frame(records[-count:], timezone)
+
+
+def _to_ns(value: Union[int, str, pd.Timestamp]) -> int:
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tz is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.value)
+
+
+def _to_rfc3339(value: int) -> str:
+    return pd.Timestamp(value, tz="UTC").strftime("%Y-%m-%dT%H:%M:%S.%f") + "000Z"
@@ -0,0 +1,141 @@
+import operator
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+PRICE_COMPONENTS = {"M": ("mid", ""), "B": ("bid", "Bid"), "A": ("ask", "Ask")}
+# Column order of the dataframes throughout the repo
+COLUMNS = ["High", "Close", "Low", "Open"]
+_prices = operator.itemgetter("h", "c", "l", "o")
+
+
+def parse_time(value: str) -> int:
+    """
+    Parse a single RFC3339 timestamp, e.g. of a pricing tick, into epoch
+    nanoseconds.
+
+    Args:
+        value (str): timestamp from the API
+
+    Returns:
+        int: epoch nanoseconds, UTC
+    """
+    return int(np.datetime64(value.rstrip("Z"), "ns").view(np.int64))
+
+
+def parse_times(times: List[str]) -> np.ndarray:
+    """
+    Parse candle timestamps into epoch nanoseconds in one pass.
+
+    Both of the OANDA datetime formats are supported: RFC3339 strings
+    such as "2024-01-01T00:00:00.000000000Z", and UNIX strings such as
+    "1704067200.000000000".
+
+    Args:
+        times (List[str]): timestamps from the API response
+
+    Returns:
+        np.ndarray: int64 epoch nanoseconds, UTC
+    """
+    if not times:
+        return np.empty(0, dtype=np.int64)
+    if "T" in times[0]:
+        return np.array([t.rstrip("Z") for t in times], dtype="datetime64[ns]").view(
+            np.int64
+        )
+    return np.array([_unix_to_ns(t) for t in times], dtype=np.int64)
+
+
+def _unix_to_ns(value: str) -> int:
+    seconds, _, fraction = value.partition(".")
+    return int(seconds) * 10**9 + int(fraction[:9].ljust(9, "0"))
+
+
+def _parse_prices(candles: List[Dict], price: str) -> Tuple[List[str], np.ndarray]:
+    """Parse the requested price components into one float64 block."""
+    columns, values = [], []
+    for component in price:
+        key, prefix = PRICE_COMPONENTS[component]
+        columns += [prefix + column for column in COLUMNS]
+        flat = [value for candle in candles for value in _prices(candle[key])]
+        values.append(np.array(flat, dtype=np.float64).reshape(len(candles), 4))
+    return columns, values[0] if len(values) == 1 else np.hstack(values)
+
+
+def parse_candles(
+    candles: List[Dict],
+    price: str = "M",
+    volume: bool = False,
+    complete_only: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    Parse the candles of an `InstrumentsCandles` response straight into
+    typed arrays, without building intermediate dicts or string columns.
+
+    Mid prices are returned as "Open", "High", "Low" and "Close", bid and
+    ask prices with a "Bid" or "Ask" prefix, e.g. "BidClose".
+
+    Args:
+        candles (List[Dict]): candles from the API response
+        price (str, optional): price components that were requested,
+        any combination of "M", "B" and "A". Defaults to "M".
+        volume (bool, optional): whether to include the tick volume.
+        Defaults to False.
+        complete_only (bool, optional): whether to drop the incomplete
+        candles. Defaults to False.
+
+    Returns:
+        Dict[str, np.ndarray]: int64 epoch nanoseconds under "time",
+        float64 prices and int64 volumes under their column names. The
+        prices are views into one block.
+    """
+    if complete_only:
+        candles = [candle for candle in candles if candle.get("complete", True)]
+    arrays = {"time": parse_times([candle["time"] for candle in candles])}
+    columns, values = _parse_prices(candles, price)
+    for i, column in enumerate(columns):
+        arrays[column] = values[:, i]
+    if volume:
+        arrays["Volume"] = np.array(
+            [candle["volume"] for candle in candles], dtype=np.int64
+        )
+    return arrays
+
+
+def candles_to_frame(
+    candles: List[Dict],
+    timezone: str = "Asia/Singapore",
+    price: str = "M",
+    volume: bool = False,
+    complete_only: bool = False,
+) -> pd.DataFrame:
+    """
+    Parse candles into the dataframe layout of
+    `FetchHistoricalData.fetch_and_process_data`, building the dataframe
+    once around a single float64 block without copying it.
+
+    Args:
+        candles (List[Dict]): candles from the API response
+        timezone (str, optional): timezone of the index.
+        Defaults to "Asia/Singapore".
+        price (str, optional): price components that were requested.
+        Defaults to "M".
+        volume (bool, optional): whether to include the tick volume.
+        Defaults to False.
+        complete_only (bool, optional): whether to drop the incomplete
+        candles. Defaults to False.
+
+    Returns:
+        pd.DataFrame: candles indexed by time
+    """
+    if complete_only:
+        candles = [candle for candle in candles if candle.get("complete", True)]
+    times = parse_times([candle["time"] for candle in candles])
+    index = pd.DatetimeIndex(times.view("datetime64[ns]"), name="Time")
+    index = index.tz_localize("UTC").tz_convert(timezone)
+    columns, values = _parse_prices(candles, price)
+    df = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    if volume:
+        df["Volume"] = np.array([candle["volume"] for candle in candles], dtype=np.int64)
+    return df
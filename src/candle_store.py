@@ -0,0 +1,233 @@
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from src.compact import CompactFrame
+
+
+class CandleStore:
+    """
+    Fixed-capacity, array-backed store for candlestick and indicator
+    data.
+
+    Rows are written twice into a buffer of twice the capacity (once at
+    the head position and once mirrored one capacity further), so the
+    most recent rows are always contiguous in memory. Appending is O(1),
+    memory stays bounded and `tail` returns a view without copying.
+    The values are float64, or float32 in compact mode.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        capacity: int = 10000,
+        tz: Optional[str] = None,
+        dtype: np.dtype = np.float64,
+    ):
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+
+        self.columns = list(columns)
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.capacity = capacity
+        self.tz = tz
+        self.datetime_index = True
+
+        self._data = np.full((2 * capacity, len(self.columns)), np.nan, dtype=dtype)
+        self._times = np.zeros(2 * capacity, dtype=np.int64)
+        self._head = 0  # next write position in [0, capacity)
+        self._end = 0  # exclusive end of the contiguous window of latest rows
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(
+        self,
+        row: Union[Dict[str, float], Sequence[float]],
+        time: Union[int, pd.Timestamp, None] = None,
+    ) -> None:
+        """
+        Append a new row, overwriting the oldest one once the store is
+        full.
+
+        Args:
+            row (Union[Dict[str, float], Sequence[float]]): values keyed by
+            column name, or a sequence in column order
+            time (Union[int, pd.Timestamp, None], optional): timestamp of
+            the row, as epoch nanoseconds or anything pd.Timestamp accepts.
+            Defaults to one step after the previous row.
+        """
+        if isinstance(row, dict):
+            values = [row[column] for column in self.columns]
+        else:
+            values = row
+
+        if time is None:
+            time = self._times[self._end - 1] + 1 if self._size else 0
+        elif not isinstance(time, (int, np.integer)):
+            time = pd.Timestamp(time).value
+
+        position = self._head
+        mirror = position + self.capacity
+        self._data[position] = values
+        self._data[mirror] = values
+        self._times[position] = time
+        self._times[mirror] = time
+
+        self._head = (position + 1) % self.capacity
+        self._end = mirror + 1
+        self._size = min(self._size + 1, self.capacity)
+
+    def tail(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Zero-copy view of the last n rows in chronological order.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            np.ndarray: array view shaped (n, num_columns)
+        """
+        n = self._size if n is None else min(n, self._size)
+        start, end = self._end - n, self._end
+        return self._data[start:end]
+
+    def tail_times(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Zero-copy view of the timestamps of the last n rows.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            np.ndarray: epoch nanoseconds of the rows
+        """
+        n = self._size if n is None else min(n, self._size)
+        start, end = self._end - n, self._end
+        return self._times[start:end]
+
+    def column(self, name: str, n: Optional[int] = None) -> np.ndarray:
+        """
+        Zero-copy view of the last n values of a column.
+
+        Args:
+            name (str): column name
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            np.ndarray: column values in chronological order
+        """
+        return self.tail(n)[:, self.column_index[name]]
+
+    def last_row(self) -> np.ndarray:
+        """
+        Get the latest row.
+
+        Raises:
+            IndexError: if the store is empty
+
+        Returns:
+            np.ndarray: values of the latest row in column order
+        """
+        if not self._size:
+            raise IndexError("CandleStore is empty.")
+        return self._data[self._end - 1]
+
+    def last(self, name: str) -> float:
+        """
+        Get the latest value of a column.
+
+        Args:
+            name (str): column name
+
+        Returns:
+            float: latest value
+        """
+        return float(self.last_row()[self.column_index[name]])
+
+    def to_frame(self, n: Optional[int] = None) -> pd.DataFrame:
+        """
+        Export the last n rows to a dataframe.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            pd.DataFrame: dataframe indexed by time
+        """
+        times = self.tail_times(n)
+        if not self.datetime_index:
+            index = pd.Index(times)
+        elif self.tz is not None:
+            index = pd.to_datetime(times, utc=True).tz_convert(self.tz)
+        else:
+            index = pd.to_datetime(times)
+        return pd.DataFrame(self.tail(n).copy(), index=index, columns=self.columns)
+
+    def to_compact(self, n: Optional[int] = None) -> CompactFrame:
+        """
+        Zero-copy compact view of the last n rows, e.g. to train the
+        agent without exporting a dataframe.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            CompactFrame: frame sharing the memory of a float32 store,
+            a float32 copy of a float64 store
+        """
+        return CompactFrame(self.tail_times(n), self.tail(n), self.columns, self.tz)
+
+    @classmethod
+    def from_frame(
+        cls, df: Union[pd.DataFrame, CompactFrame], capacity: int = 10000
+    ) -> "CandleStore":
+        """
+        Build a store from an existing dataframe, keeping the most recent
+        rows if the dataframe is larger than the capacity.
+
+        Args:
+            df (Union[pd.DataFrame, CompactFrame]): input dataframe that
+            contains candlestick data, a compact frame gives a float32
+            store
+            capacity (int, optional): maximum number of rows.
+            Defaults to 10000.
+
+        Returns:
+            CandleStore: store holding the rows of the dataframe
+        """
+        capacity = max(capacity, 1)
+        if isinstance(df, CompactFrame):
+            store = cls(df.columns, capacity=capacity, tz=df.tz, dtype=np.float32)
+            values, times = df.values[-capacity:], df.times[-capacity:]
+        else:
+            tz = None
+            if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is not None:
+                tz = str(df.index.tz)
+            store = cls(df.columns, capacity=capacity, tz=tz)
+            df = df.iloc[-capacity:]
+            values, times = df.to_numpy(dtype=np.float64), None
+            if isinstance(df.index, pd.DatetimeIndex):
+                times = df.index.as_unit("ns").asi8
+
+        n = len(values)
+        if n:
+            if times is None:
+                store.datetime_index = False
+                times = np.arange(n, dtype=np.int64)
+            end = capacity + n
+            store._data[:n] = values
+            store._data[capacity:end] = values
+            store._times[:n] = times
+            store._times[capacity:end] = times
+            store._head = n % capacity
+            store._end = end
+            store._size = n
+        return store
@@ -0,0 +1,264 @@
+import glob
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from loguru import logger
+
+from src.dqn import DQNTrader
+from src.q_learning import QLearningTrader
+from src.state_encoder import ArgmaxEncoder, SparseQTable, StateEncoder
+
+CHECKPOINT_VERSION = 1
+HYPERPARAMETERS = ["learning_rate", "discount_factor", "exploration_prob"]
+DQN_PARAMETERS = [
+    "batch_size",
+    "replay_capacity",
+    "target_update",
+    "train_every",
+    "reward_scale",
+]
+
+
+def checkpoint_state(
+    qtrader: Union[QLearningTrader, DQNTrader],
+) -> Dict[str, np.ndarray]:
+    """
+    Snapshot the state of an agent into plain arrays. The replay memory
+    and optimizer moments of a `DQNTrader` are not saved.
+
+    Args:
+        qtrader (Union[QLearningTrader, DQNTrader]): agent to snapshot
+
+    Returns:
+        Dict[str, np.ndarray]: arrays to be stored with `np.savez`
+    """
+    state = {
+        "version": np.array(CHECKPOINT_VERSION),
+        "created": np.array(time.time()),
+        "num_actions": np.array(qtrader.num_actions),
+        "num_features": np.array(qtrader.num_features),
+        "cumulative_reward": np.array(qtrader.cumulative_reward, dtype=np.float64),
+        "current_action": np.array(
+            -1 if qtrader.current_action is None else qtrader.current_action
+        ),
+    }
+    for name in HYPERPARAMETERS:
+        state[name] = np.array(getattr(qtrader, name), dtype=np.float64)
+
+    if isinstance(qtrader, DQNTrader):
+        state["agent"] = np.array("dqn")
+        state["hidden_sizes"] = np.array(qtrader.hidden_sizes, dtype=np.int64)
+        state["feature_mean"] = qtrader.feature_mean
+        state["feature_std"] = qtrader.feature_std
+        state["learn_steps"] = np.array(qtrader.learn_steps)
+        for name in DQN_PARAMETERS:
+            state[name] = np.array(getattr(qtrader, name))
+        state["network"] = qtrader.network.flat
+        state["target_network"] = qtrader.target_network.flat
+    elif isinstance(qtrader.q_table, SparseQTable):
+        states = sorted(qtrader.q_table.rows)
+        state["sparse_states"] = np.array(states, dtype=np.int64)
+        state["q_table"] = np.array(
+            [qtrader.q_table.rows[s] for s in states], dtype=np.float64
+        ).reshape(len(states), qtrader.num_actions)
+    else:
+        state["q_table"] = qtrader.q_table.copy()
+
+    encoder = getattr(qtrader, "encoder", None)
+    if isinstance(encoder, StateEncoder):
+        state["encoder_indices"] = np.array(encoder.indices, dtype=np.int64)
+        state["encoder_sizes"] = np.array([len(e) for e in encoder.edges])
+        state["encoder_edges"] = np.concatenate(
+            [np.zeros(0)] + [np.asarray(e, dtype=np.float64) for e in encoder.edges]
+        )
+
+    # The agent draws from the global NumPy random state
+    kind, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    state["rng_keys"] = keys
+    state["rng_position"] = np.array([position, has_gauss])
+    state["rng_gaussian"] = np.array(cached_gaussian)
+    return state
+
+
+def save_checkpoint(qtrader: Union[QLearningTrader, DQNTrader], path: str) -> str:
+    """
+    Write a checkpoint of an agent atomically.
+
+    Args:
+        qtrader (Union[QLearningTrader, DQNTrader]): agent to save
+        path (str): path of the `.npz` file
+
+    Returns:
+        str: path of the checkpoint
+    """
+    return write_checkpoint(checkpoint_state(qtrader), path)
+
+
+def write_checkpoint(state: Dict[str, np.ndarray], path: str) -> str:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **state)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_checkpoint(
+    path: str, restore_rng: bool = True, **kwargs: Any
+) -> Union[QLearningTrader, DQNTrader]:
+    """
+    Restore an agent from a checkpoint.
+
+    Args:
+        path (str): path of the `.npz` file
+        restore_rng (bool, optional): also restore the global NumPy
+        random state. Defaults to True.
+        **kwargs: hyperparameters overriding the stored ones
+
+    Raises:
+        ValueError: if the checkpoint version is not supported
+
+    Returns:
+        Union[QLearningTrader, DQNTrader]: agent in the saved state
+    """
+    with np.load(path) as data:
+        version = int(data["version"])
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version: {version}")
+
+        num_features = int(data["num_features"])
+        params = {name: float(data[name]) for name in HYPERPARAMETERS}
+        if "agent" in data and str(data["agent"]) == "dqn":
+            for name in DQN_PARAMETERS:
+                params[name] = data[name].item()
+            params.update(kwargs)
+            qtrader = DQNTrader(
+                num_actions=int(data["num_actions"]),
+                num_features=num_features,
+                hidden_sizes=data["hidden_sizes"].tolist(),
+                **params,
+            )
+            qtrader.network.flat[:] = data["network"]
+            qtrader.target_network.flat[:] = data["target_network"]
+            qtrader.feature_mean = data["feature_mean"]
+            qtrader.feature_std = data["feature_std"]
+            qtrader.normalizer_fitted = True
+            qtrader.learn_steps = int(data["learn_steps"])
+        else:
+            if "encoder_indices" in data:
+                sizes = data["encoder_sizes"].tolist()
+                edges = np.split(data["encoder_edges"], np.cumsum(sizes)[:-1])
+                encoder = StateEncoder(data["encoder_indices"].tolist(), edges)
+            else:
+                encoder = ArgmaxEncoder(num_features)
+            params.update(kwargs)
+            qtrader = QLearningTrader(
+                num_actions=int(data["num_actions"]),
+                num_features=num_features,
+                encoder=encoder,
+                sparse="sparse_states" in data,
+                **params,
+            )
+            if "sparse_states" in data:
+                for s, row in zip(data["sparse_states"].tolist(), data["q_table"]):
+                    qtrader.q_table[s] = row
+            else:
+                qtrader.q_table[:] = data["q_table"]
+
+        qtrader.cumulative_reward = float(data["cumulative_reward"])
+        current_action = int(data["current_action"])
+        qtrader.current_action = None if current_action < 0 else current_action
+
+        if restore_rng:
+            position, has_gauss = data["rng_position"].tolist()
+            np.random.set_state(
+                (
+                    "MT19937",
+                    data["rng_keys"],
+                    position,
+                    has_gauss,
+                    float(data["rng_gaussian"]),
+                )
+            )
+    return qtrader
+
+
+def latest_checkpoint(directory: str, prefix: str) -> Optional[str]:
+    """
+    Find the most recent checkpoint of an agent.
+
+    Args:
+        directory (str): checkpoint directory
+        prefix (str): name of the agent, e.g. the instrument
+
+    Returns:
+        Optional[str]: path of the latest checkpoint, None if there is none
+    """
+    paths = sorted(glob.glob(os.path.join(directory, f"{prefix}-*.npz")))
+    paths = [path for path in paths if not path.endswith(".tmp.npz")]
+    return paths[-1] if paths else None
+
+
+class CheckpointWriter:
+    """
+    Periodic checkpointing of an agent in a background thread.
+
+    Snapshots are taken and written by the writer thread, so the tick
+    loop never waits on disk. Checkpoints are numbered, the newest
+    `keep` are kept and a final checkpoint is written on `stop`.
+    """
+
+    def __init__(
+        self,
+        qtrader: QLearningTrader,
+        directory: str,
+        prefix: str,
+        interval: float = 300.0,
+        keep: int = 5,
+    ):
+        self.qtrader = qtrader
+        self.directory = directory
+        self.prefix = prefix
+        self.interval = interval
+        self.keep = keep
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def checkpoint(self) -> str:
+        """
+        Write a checkpoint now.
+
+        Returns:
+            str: path of the checkpoint
+        """
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns()}.npz"
+        path = save_checkpoint(self.qtrader, os.path.join(self.directory, name))
+        paths = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.npz")))
+        for old in paths[: -self.keep]:
+            os.remove(old)
+        return path
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.error(f"Error writing checkpoint of {self.prefix}: {e}")
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name=f"checkpoint-{self.prefix}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the periodic writes and write a final checkpoint."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        path = self.checkpoint()
+        logger.info(f"Saved checkpoint {path}.")
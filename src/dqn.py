@@ -0,0 +1,453 @@
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.compact import CompactFrame, candle_arrays
+from src.q_learning import QLearningTrader
+
+
+class MLP:
+    """
+    Fully connected network with ReLU hidden layers and a linear output,
+    trained with Adam. All weights and biases are float32 views into one
+    flat parameter vector, so an Adam step is a handful of ufunc calls
+    whatever the number of layers.
+    """
+
+    def __init__(
+        self,
+        sizes: Sequence[int],
+        learning_rate: float = 1e-3,
+        beta1: float = 0.9,
+        beta2: float = 0.999,
+        epsilon: float = 1e-8,
+    ):
+        self.sizes = [int(size) for size in sizes]
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+        shapes = list(zip(self.sizes[:-1], self.sizes[1:]))
+        total = sum(fan_in * fan_out + fan_out for fan_in, fan_out in shapes)
+        self.flat = np.zeros(total, dtype=np.float32)
+        self.weights, self.biases = self._views(self.flat)
+        self.grads = np.zeros(total, dtype=np.float32)
+        self.weight_grads, self.bias_grads = self._views(self.grads)
+        self.moments = np.zeros(total, dtype=np.float32)
+        self.velocities = np.zeros(total, dtype=np.float32)
+        self.steps = 0
+
+        # He initialization for the ReLU layers
+        for weights in self.weights:
+            fan_in = weights.shape[0]
+            weights[...] = np.random.standard_normal(weights.shape) * np.sqrt(2 / fan_in)
+
+    def _views(self, flat: np.ndarray) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        weights, biases = [], []
+        start = 0
+        for fan_in, fan_out in zip(self.sizes[:-1], self.sizes[1:]):
+            end = start + fan_in * fan_out
+            weights.append(flat[start:end].reshape(fan_in, fan_out))
+            start, end = end, end + fan_out
+            biases.append(flat[start:end])
+            start = end
+        return weights, biases
+
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        """
+        Compute the outputs of a single input or a batch of inputs.
+
+        Args:
+            x (np.ndarray): inputs shaped (num_inputs,) or
+            (batch, num_inputs)
+
+        Returns:
+            np.ndarray: outputs shaped (num_outputs,) or
+            (batch, num_outputs)
+        """
+        last = len(self.weights) - 1
+        for i, (weights, biases) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weights + biases
+            if i < last:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def forward_train(self, x: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Compute the outputs of a batch and keep the layer inputs for the
+        backward pass.
+
+        Args:
+            x (np.ndarray): inputs shaped (batch, num_inputs)
+
+        Returns:
+            Tuple[np.ndarray, List[np.ndarray]]: outputs and the input of
+            every layer
+        """
+        activations = [x]
+        last = len(self.weights) - 1
+        for i, (weights, biases) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weights + biases
+            if i < last:
+                np.maximum(x, 0, out=x)
+                activations.append(x)
+        return x, activations
+
+    def backward(self, activations: List[np.ndarray], grad_output: np.ndarray) -> None:
+        """
+        Backpropagate the gradient of the loss with respect to the
+        outputs into `grads`.
+
+        Args:
+            activations (List[np.ndarray]): layer inputs of `forward_train`
+            grad_output (np.ndarray): gradient with respect to the outputs
+        """
+        grad = grad_output
+        for i in range(len(self.weights) - 1, -1, -1):
+            np.matmul(activations[i].T, grad, out=self.weight_grads[i])
+            grad.sum(axis=0, out=self.bias_grads[i])
+            if i > 0:
+                grad = grad @ self.weights[i].T
+                grad *= activations[i] > 0
+
+    def apply_gradients(self) -> None:
+        """Take an Adam step with the gradients in `grads`."""
+        self.steps += 1
+        correction1 = 1 - self.beta1**self.steps
+        correction2 = 1 - self.beta2**self.steps
+        step_size = self.learning_rate * np.sqrt(correction2) / correction1
+        grads, m, v = self.grads, self.moments, self.velocities
+        m *= self.beta1
+        m += (1 - self.beta1) * grads
+        v *= self.beta2
+        v += (1 - self.beta2) * grads * grads
+        self.flat -= step_size * m / (np.sqrt(v) + self.epsilon)
+
+    def copy_from(self, other: "MLP") -> None:
+        """Copy the weights of a network of the same shape."""
+        self.flat[:] = other.flat
+
+
+class ReplayBuffer:
+    """
+    Preallocated ring buffer of transitions. Once full, the oldest
+    transitions are overwritten, so memory stays constant however long
+    the agent runs.
+    """
+
+    def __init__(self, capacity: int, num_features: int):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, num_features), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, num_features), dtype=np.float32)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def push(
+        self, state: np.ndarray, action: int, reward: float, next_state: np.ndarray
+    ) -> None:
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(
+        self, batch_size: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Draw a minibatch uniformly with replacement.
+
+        Args:
+            batch_size (int): number of transitions
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: states,
+            actions, rewards and next states
+        """
+        indices = np.random.randint(self.size, size=batch_size)
+        return (
+            self.states[indices],
+            self.actions[indices],
+            self.rewards[indices],
+            self.next_states[indices],
+        )
+
+
+class DQNTrader(QLearningTrader):
+    """
+    Deep Q-network agent on the continuous feature vector.
+
+    The Q-values are approximated by an `MLP` on standardized features
+    instead of a table over discretized states. Transitions go to a
+    `ReplayBuffer` and every step trains on a random minibatch against a
+    target network that is synchronized every `target_update` steps.
+    The decision and reward logic, and so `update`, are shared with
+    `QLearningTrader`.
+    """
+
+    def __init__(
+        self,
+        num_actions: int,
+        num_features: int,
+        learning_rate: float,
+        discount_factor: float,
+        exploration_prob: float,
+        hidden_sizes: Sequence[int] = (64, 64),
+        batch_size: int = 64,
+        replay_capacity: int = 100_000,
+        target_update: int = 250,
+        train_every: int = 1,
+        reward_scale: float = 1e4,
+    ):
+        self.num_actions = num_actions
+        self.num_features = num_features
+        self.learning_rate = learning_rate
+        self.discount_factor = discount_factor
+        self.exploration_prob = exploration_prob
+        self.hidden_sizes = [int(size) for size in hidden_sizes]
+        self.batch_size = batch_size
+        self.replay_capacity = replay_capacity
+        self.target_update = target_update
+        self.train_every = train_every
+        # Rewards are relative price changes, scaled to be of order one
+        self.reward_scale = reward_scale
+        self.cumulative_reward = 0
+
+        sizes = [num_features, *self.hidden_sizes, num_actions]
+        self.network = MLP(sizes, learning_rate)
+        self.target_network = MLP(sizes, learning_rate)
+        self.target_network.copy_from(self.network)
+        self.memory = ReplayBuffer(replay_capacity, num_features)
+        self.learn_steps = 0
+        self.decisions = 0
+
+        # Feature standardization, fitted on the first training data
+        self.feature_mean = np.zeros(num_features, dtype=np.float32)
+        self.feature_std = np.ones(num_features, dtype=np.float32)
+        self.normalizer_fitted = False
+
+        self.current_state = None
+        self.current_action = None
+        self.latest_q_value = None
+        self.pending = None
+
+    def fit_normalizer(self, features: np.ndarray) -> None:
+        """
+        Fit the feature standardization on training data.
+
+        Args:
+            features (np.ndarray): feature values, one row per time step
+        """
+        features = np.asarray(features, dtype=np.float64)
+        mean = np.nanmean(features, axis=0)
+        std = np.nanstd(features, axis=0)
+        self.feature_mean = np.nan_to_num(mean).astype(np.float32)
+        self.feature_std = np.where(std > 0, std, 1.0).astype(np.float32)
+        self.normalizer_fitted = True
+
+    def normalize(self, features: Union[np.ndarray, pd.Series]) -> np.ndarray:
+        """
+        Standardize a feature row or matrix, missing values become the
+        mean.
+
+        Args:
+            features (Union[np.ndarray, pd.Series]): raw feature values
+
+        Returns:
+            np.ndarray: float32 network inputs
+        """
+        x = np.asarray(features, dtype=np.float32)
+        x = (x - self.feature_mean) / self.feature_std
+        return np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def q_values(self, state: Union[np.ndarray, pd.Series]) -> np.ndarray:
+        """
+        Q-values of every action in a state.
+
+        Args:
+            state (Union[np.ndarray, pd.Series]): raw feature values
+
+        Returns:
+            np.ndarray: Q-value of every action
+        """
+        return self.network.forward(self.normalize(state))
+
+    def choose_action(self, state: Union[np.ndarray, pd.Series]) -> int:
+        """
+        Choose an action based on the current state.
+
+        Args:
+            state (Union[np.ndarray, pd.Series]): an array representing
+            the current state
+
+        Returns:
+            int: action encoded as an integer
+        """
+        if np.random.uniform(0, 1) < self.exploration_prob:
+            return np.random.choice(self.num_actions)  # Explore
+        return int(np.argmax(self.q_values(state)))  # Exploit
+
+    def learn(self) -> Optional[float]:
+        """
+        Train the network on one minibatch from the replay memory.
+
+        Returns:
+            Optional[float]: mean Huber loss of the minibatch, None while
+            the memory holds less than a minibatch
+        """
+        if len(self.memory) < self.batch_size:
+            return None
+        states, actions, rewards, next_states = self.memory.sample(self.batch_size)
+
+        next_q = self.target_network.forward(next_states).max(axis=1)
+        targets = rewards + self.discount_factor * next_q
+        q, activations = self.network.forward_train(states)
+        rows = np.arange(self.batch_size)
+        error = q[rows, actions] - targets
+
+        # Huber loss, its gradient is the error clipped to [-1, 1]
+        grad_output = np.zeros_like(q)
+        grad_output[rows, actions] = np.clip(error, -1, 1) / self.batch_size
+        self.network.backward(activations, grad_output)
+        self.network.apply_gradients()
+
+        self.learn_steps += 1
+        if self.learn_steps % self.target_update == 0:
+            self.target_network.copy_from(self.network)
+        abs_error = np.abs(error)
+        return float(np.where(abs_error < 1, 0.5 * error**2, abs_error - 0.5).mean())
+
+    def take_action(self, action: int, reward: float) -> None:
+        """
+        Store the transition completed by the current state and train on
+        a minibatch.
+
+        Args:
+            action (int): action encoded as an integer
+            reward (float): reward value calculated based on the action
+        """
+        state = self.normalize(self.current_state)
+        # The previous decision ends in the state of this one
+        if self.pending is not None:
+            previous_state, previous_action, previous_reward = self.pending
+            self.memory.push(previous_state, previous_action, previous_reward, state)
+        self.pending = (state, action, reward * self.reward_scale)
+
+        self.decisions += 1
+        loss = self.learn() if self.decisions % self.train_every == 0 else None
+        self.latest_q_value = float(self.network.forward(state)[action])
+        if self.events.enabled("q_update"):
+            self.events.write(
+                "q_update",
+                action=action,
+                q_value=self.latest_q_value,
+                loss=loss,
+                learn_steps=self.learn_steps,
+            )
+
+        self.current_state = None
+        self.current_action = action
+
+    def train_vectorized(
+        self,
+        historical_data: Union[pd.DataFrame, CompactFrame],
+        verbose: bool = True,
+        features: Optional[np.ndarray] = None,
+        epochs: int = 1,
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Train the network by replaying the historical data, with one
+        minibatch update every `train_every` steps once the replay memory
+        holds a minibatch.
+
+        Args:
+            historical_data (Union[pd.DataFrame, CompactFrame]): input
+            candlestick data
+            verbose (bool, optional): log the progress. Defaults to True.
+            features (Optional[np.ndarray], optional): feature matrix with
+            one row per candle to derive the states from. Defaults to None.
+            epochs (int, optional): passes over the data. Defaults to 1.
+
+        Returns:
+            Tuple[List[int], List[float]]: actions taken and the
+            cumulative rewards at each time step of the last pass
+        """
+        if verbose:
+            logger.info("Training the deep Q-network...")
+
+        block, closes = candle_arrays(historical_data)
+        if features is None:
+            features = block
+        if not self.normalizer_fitted:
+            self.fit_normalizer(features)
+        inputs = self.normalize(features)
+        price_change = (closes[1:] - closes[:-1]) / closes[:-1]
+        rewards = np.column_stack((price_change, -price_change, price_change))
+
+        # Decide on every step with the network of that step
+        forward = self.network.forward
+        random = np.random.random
+        randint = np.random.randint
+        for _ in range(epochs):
+            actions = []
+            cumulative_rewards = [np.nan]
+            cumulative_reward = self.cumulative_reward
+            for t in range(len(rewards)):
+                if random() < self.exploration_prob:
+                    action = randint(self.num_actions)  # Explore
+                else:
+                    action = int(forward(inputs[t]).argmax())  # Exploit
+                actions.append(action)
+                reward = rewards[t, action]
+                cumulative_reward += reward
+                cumulative_rewards.append(cumulative_reward)
+
+                self.memory.push(
+                    inputs[t], action, reward * self.reward_scale, inputs[t + 1]
+                )
+                if t % self.train_every == 0:
+                    self.learn()
+            self.cumulative_reward = cumulative_reward
+
+        self.current_state = None
+        self.current_action = actions[-1] if actions else self.current_action
+        self.pending = None
+
+        if verbose:
+            logger.info(
+                f"Training complete. Steps: {len(actions)}, "
+                f"Minibatch updates: {self.learn_steps}, "
+                f"Cumulative reward: {self.cumulative_reward}"
+            )
+        return actions, cumulative_rewards
+
+    def train(
+        self,
+        historical_data: pd.DataFrame,
+        verbose: bool = True,
+        features: Optional[np.ndarray] = None,
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Train the network on historical data, see `train_vectorized`.
+
+        Args:
+            historical_data (pd.DataFrame): input candlestick data
+            verbose (bool, optional): log the progress. Defaults to True.
+            features (Optional[np.ndarray], optional): feature matrix with
+            one row per candle. Defaults to None.
+
+        Returns:
+            Tuple[List[int], List[float]]: actions taken and the
+            cumulative rewards at each time step
+        """
+        return self.train_vectorized(historical_data, verbose, features)
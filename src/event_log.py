@@ -0,0 +1,241 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# Default level of every event type
+EVENT_LEVELS = {
+    "tick": "DEBUG",
+    "bar": "INFO",
+    "decision": "INFO",
+    "q_update": "DEBUG",
+    "order": "INFO",
+}
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class NullEventLog:
+    """Event log that drops every event, used when logging is disabled."""
+
+    def enabled(self, event: str) -> bool:
+        return False
+
+    def write(self, event: str, **fields: Any) -> None:
+        pass
+
+    def log(self, event: str, **fields: Any) -> None:
+        pass
+
+    def bind(self, **context: Any) -> "NullEventLog":
+        return self
+
+    def close(self) -> None:
+        pass
+
+
+NULL_EVENT_LOG = NullEventLog()
+
+
+class EventLog:
+    """
+    Structured event log written as JSON lines by a background thread.
+
+    Every event type has a level, see `EVENT_LEVELS`, and may be
+    sampled, keeping one event in `sampling[event]`. Types without a
+    level are dropped. The producer only checks the filter and puts a
+    tuple on a bounded queue, all serialization and I/O happen on the
+    writer thread. When the queue is full the event is dropped and
+    counted rather than blocking the tick loop. Hot paths guard with
+    `enabled` so that filtered events cost no formatting at all:
+
+        if events.enabled("tick"):
+            events.write("tick", bid=bid, ask=ask)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        level: str = "INFO",
+        levels: Optional[Dict[str, str]] = None,
+        sampling: Optional[Dict[str, int]] = None,
+        queue_size: int = 100_000,
+        batch_size: int = 1000,
+    ):
+        self.path = path
+        self.level = LEVELS[level.upper()]
+        event_levels = {**EVENT_LEVELS, **(levels or {})}
+        self.sampling = {
+            event: int(every) for event, every in (sampling or {}).items() if every > 1
+        }
+        self.counters = {event: itertools.count() for event in self.sampling}
+        # Event types at or above the level
+        self.active = {
+            event
+            for event, name in event_levels.items()
+            if LEVELS[name.upper()] >= self.level
+        }
+        self.event_levels = event_levels
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, cfg: Dict, path: str) -> "EventLog":
+        """
+        Build the event log from the `event_log` section of the
+        configuration.
+
+        Args:
+            cfg (Dict): level, per-event levels, sampling and queue size
+            path (str): path of the JSON lines file
+
+        Returns:
+            EventLog: running event log
+        """
+        return cls(
+            path,
+            level=cfg.get("level", "INFO"),
+            levels=cfg.get("levels"),
+            sampling=cfg.get("sampling"),
+            queue_size=cfg.get("queue_size", 100_000),
+        )
+
+    def enabled(self, event: str) -> bool:
+        """
+        Check whether the next event of a type passes the level and the
+        sampling. Each call of a sampled type counts as one event.
+
+        Args:
+            event (str): event type
+
+        Returns:
+            bool: True if the event should be written
+        """
+        if event not in self.active:
+            return False
+        counter = self.counters.get(event)
+        return counter is None or next(counter) % self.sampling[event] == 0
+
+    def write(self, event: str, **fields: Any) -> None:
+        """
+        Queue an event that already passed `enabled`.
+
+        Args:
+            event (str): event type
+            **fields: values of the event
+        """
+        try:
+            self._queue.put_nowait((time.time_ns(), event, fields))
+        except queue.Full:
+            self.dropped += 1
+
+    def log(self, event: str, **fields: Any) -> None:
+        """
+        Queue an event if it passes the level and the sampling.
+
+        Args:
+            event (str): event type
+            **fields: values of the event
+        """
+        if self.enabled(event):
+            self.write(event, **fields)
+
+    def bind(self, **context: Any) -> "BoundEventLog":
+        """
+        Attach fixed fields, e.g. the instrument of a pipeline, to every
+        event written through the returned log.
+
+        Args:
+            **context: fields added to every event
+
+        Returns:
+            BoundEventLog: view of this log with the context fields
+        """
+        return BoundEventLog(self, context)
+
+    def _run(self) -> None:
+        get = self._queue.get
+        while True:
+            items = [get()]
+            # Drain what is already queued into one write
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for item in items:
+                if item is None:
+                    stop = True
+                    continue
+                time_ns, event, fields = item
+                record = {
+                    "time": time_ns,
+                    "event": event,
+                    "level": self.event_levels.get(event, "INFO"),
+                    **fields,
+                }
+                lines.append(json.dumps(record, default=_to_json))
+            if lines:
+                try:
+                    self._file.write("\n".join(lines) + "\n")
+                    self._file.flush()
+                    self.written += len(lines)
+                except OSError as e:
+                    logger.error(f"Error writing events to {self.path}: {e}")
+            if stop:
+                return
+
+    def close(self) -> None:
+        """Write the queued events and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self.dropped:
+            logger.warning(f"Dropped {self.dropped} events, the queue was full.")
+
+
+class BoundEventLog:
+    """View of an `EventLog` that adds fixed fields to every event."""
+
+    def __init__(self, parent: EventLog, context: Dict[str, Any]):
+        self.parent = parent
+        self.context = context
+        self.enabled = parent.enabled
+
+    def write(self, event: str, **fields: Any) -> None:
+        self.parent.write(event, **self.context, **fields)
+
+    def log(self, event: str, **fields: Any) -> None:
+        if self.enabled(event):
+            self.write(event, **fields)
+
+    def bind(self, **context: Any) -> "BoundEventLog":
+        return BoundEventLog(self.parent, {**self.context, **context})
+
+    def close(self) -> None:
+        self.parent.close()
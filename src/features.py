@@ -0,0 +1,255 @@
+import math
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.bar_aggregator import Bar
+from src.utils import (
+    GRANULARITY_SECONDS,
+    _EWMState,
+    _RollingExtreme,
+    _RollingWindow,
+    _safe_div,
+)
+
+FEATURES: Dict[str, Callable[..., "Feature"]] = {}
+
+
+def register_feature(name: str) -> Callable:
+    """
+    Register a feature kind under the name used in the configuration.
+
+    Args:
+        name (str): name of the feature kind
+
+    Returns:
+        Callable: class decorator
+    """
+
+    def decorator(cls):
+        FEATURES[name] = cls
+        return cls
+
+    return decorator
+
+
+class Feature:
+    """
+    Incremental feature of one bar series. Subclasses keep constant-size
+    state and compute their `outputs` for every new bar.
+    """
+
+    outputs: List[str] = []
+
+    def update(self, open: float, high: float, low: float, close: float) -> List[float]:
+        raise NotImplementedError
+
+
+@register_feature("ohlc")
+class OHLCFeature(Feature):
+    outputs = ["Open", "High", "Low", "Close"]
+
+    def update(self, open, high, low, close):
+        return [open, high, low, close]
+
+
+@register_feature("return")
+class ReturnFeature(Feature):
+    outputs = ["return"]
+
+    def __init__(self):
+        self.previous_close = math.nan
+
+    def update(self, open, high, low, close):
+        value = _safe_div(close, self.previous_close) - 1
+        self.previous_close = close
+        return [value]
+
+
+@register_feature("sma")
+class SMAFeature(Feature):
+    def __init__(self, window: int = 5):
+        self.outputs = [f"SMA_{window}"]
+        self.window = _RollingWindow(window)
+
+    def update(self, open, high, low, close):
+        self.window.append(close)
+        return [self.window.mean()]
+
+
+@register_feature("ema")
+class EMAFeature(Feature):
+    def __init__(self, span: int = 10):
+        self.outputs = [f"EMA_{span}"]
+        self.ewm = _EWMState(span)
+
+    def update(self, open, high, low, close):
+        return [self.ewm.update(close)]
+
+
+@register_feature("rsi")
+class RSIFeature(Feature):
+    def __init__(self, span: int = 5):
+        self.outputs = [f"RSI_{span}"]
+        self.previous_close = math.nan
+        self.gain = _EWMState(span)
+        self.loss = _EWMState(span)
+
+    def update(self, open, high, low, close):
+        delta = close - self.previous_close
+        self.previous_close = close
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-delta if delta < 0 else -0.0)
+        return [100 - _safe_div(100, 1 + _safe_div(gain, loss))]
+
+
+@register_feature("macd")
+class MACDFeature(Feature):
+    def __init__(self, short: int = 5, long: int = 13):
+        self.outputs = [f"MACD_{short}_{long}"]
+        self.short = _EWMState(short)
+        self.long = _EWMState(long)
+
+    def update(self, open, high, low, close):
+        return [self.short.update(close) - self.long.update(close)]
+
+
+@register_feature("stochastic")
+class StochasticFeature(Feature):
+    def __init__(self, window: int = 5, smoothing: int = 3):
+        self.outputs = [f"%K_{window}", f"%D_{window}"]
+        self.lowest_low = _RollingExtreme(window, maximum=False)
+        self.highest_high = _RollingExtreme(window, maximum=True)
+        self.percent_k = _RollingWindow(smoothing)
+
+    def update(self, open, high, low, close):
+        lowest_low = self.lowest_low.update(low)
+        highest_high = self.highest_high.update(high)
+        percent_k = _safe_div(100 * (close - lowest_low), highest_high - lowest_low)
+        self.percent_k.append(percent_k)
+        return [percent_k, self.percent_k.mean()]
+
+
+@register_feature("bollinger")
+class BollingerFeature(Feature):
+    def __init__(self, window: int = 5, multiplier: float = 0.5):
+        self.outputs = [f"resistance_{window}", f"support_{window}"]
+        self.window = _RollingWindow(window)
+        self.multiplier = multiplier
+
+    def update(self, open, high, low, close):
+        self.window.append(close)
+        mean = self.window.mean()
+        band = self.multiplier * self.window.std()
+        return [mean + band, mean - band]
+
+
+class FeaturePipeline:
+    """
+    Multi-timeframe feature vector built incrementally from bars.
+
+    The same declared features are computed on every timeframe. The
+    first timeframe is the trading granularity. Every completed bar
+    updates the slice of its timeframe in one contiguous float32 vector,
+    so memory and per-bar compute do not grow with the session length.
+    """
+
+    def __init__(self, timeframes: Sequence[str], features: Sequence[Dict]):
+        self.timeframes = list(timeframes)
+        self.specs = [dict(spec) for spec in features]
+        self.features: Dict[str, List[Feature]] = {}
+        self.slices: Dict[str, List[slice]] = {}
+        self.names: List[str] = []
+        for timeframe in self.timeframes:
+            self.features[timeframe] = []
+            self.slices[timeframe] = []
+            for spec in self.specs:
+                params = {k: v for k, v in spec.items() if k != "name"}
+                feature = FEATURES[spec["name"]](**params)
+                start = len(self.names)
+                self.names += [f"{timeframe}_{output}" for output in feature.outputs]
+                self.features[timeframe].append(feature)
+                self.slices[timeframe].append(slice(start, len(self.names)))
+        self.vector = np.full(len(self.names), np.nan, dtype=np.float32)
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "FeaturePipeline":
+        """
+        Build the pipeline from the `features` section of the
+        configuration.
+
+        Args:
+            cfg (Dict): timeframes and feature declarations
+
+        Returns:
+            FeaturePipeline: pipeline with empty state
+        """
+        return cls(cfg["timeframes"], cfg["indicators"])
+
+    @property
+    def size(self) -> int:
+        return len(self.names)
+
+    def on_bar(self, bar: Bar) -> bool:
+        """
+        Update the features of the bar's timeframe.
+
+        Args:
+            bar (Bar): completed bar
+
+        Returns:
+            bool: True if the bar is of the trading granularity
+        """
+        if bar.granularity not in self.features:
+            return False
+        features = self.features[bar.granularity]
+        slices = self.slices[bar.granularity]
+        for feature, position in zip(features, slices):
+            self.vector[position] = feature.update(
+                bar.open, bar.high, bar.low, bar.close
+            )
+        return bar.granularity == self.timeframes[0]
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Replay historical candles of the trading granularity, building
+        the higher timeframes from them, and record the feature vector
+        after every candle. The state then continues from the last
+        candle.
+
+        Args:
+            df (pd.DataFrame): input dataframe that contains
+            candlestick data with a DatetimeIndex
+
+        Returns:
+            np.ndarray: float32 feature matrix with one row per candle
+        """
+        base = self.timeframes[0]
+        base_size = GRANULARITY_SECONDS[base] * 10**9
+        sizes = {tf: GRANULARITY_SECONDS[tf] * 10**9 for tf in self.timeframes[1:]}
+        open_bars: Dict[str, Optional[list]] = {tf: None for tf in sizes}
+
+        times = df.index.as_unit("ns").asi8.tolist()
+        candles = df[["Open", "High", "Low", "Close"]].to_numpy(dtype=float).tolist()
+        matrix = np.empty((len(times), self.size), dtype=np.float32)
+        for i, (time, (open, high, low, close)) in enumerate(zip(times, candles)):
+            self.on_bar(Bar(base, time, open, high, low, close, 1))
+            for timeframe, size in sizes.items():
+                start = time - time % size
+                bar = open_bars[timeframe]
+                if bar is not None and bar[0] != start:
+                    self.on_bar(Bar(timeframe, *bar))
+                    bar = None
+                if bar is None:
+                    bar = open_bars[timeframe] = [start, open, high, low, close, 0]
+                bar[2] = max(bar[2], high)
+                bar[3] = min(bar[3], low)
+                bar[4] = close
+                bar[5] += 1
+                # The candle that ends the bucket completes the bar
+                if (time + base_size) % size == 0:
+                    self.on_bar(Bar(timeframe, *bar))
+                    open_bars[timeframe] = None
+            matrix[i] = self.vector
+        return matrix
@@ -1,11 +1,24 @@
+from typing import Optional
+
 import oandapyV20
 import oandapyV20.endpoints.instruments as instruments
 import pandas as pd
 
+from src.candle_cache import CandleCache
+from src.candle_parser import candles_to_frame
+
 
 class FetchHistoricalData:
     def __init__(
-        self, instrument, granularity, token, count=5000, timezone="Asia/Singapore"
+        self,
+        instrument,
+        granularity,
+        token,
+        count=5000,
+        timezone="Asia/Singapore",
+        cache: Optional[CandleCache] = None,
+        price: str = "M",
+        volume: bool = False,
     ):
         self.instrument = instrument
         self.granularity = granularity
@@ -13,7 +26,16 @@ class FetchHistoricalData:
         self.token = token
         self.timezone = timezone
         self.client = oandapyV20.API(access_token=self.token)
-        self.params = {"granularity": self.granularity, "count": self.count}
+        self.price = price
+        self.volume = volume
+        self.params = {
+            "granularity": self.granularity,
+            "count": self.count,
+            "price": self.price,
+        }
+        self.cache = cache
+        if self.cache is not None and self.cache.client is None:
+            self.cache.client = self.client
 
     def fetch_data(self) -> pd.DataFrame:
         """
@@ -42,6 +64,23 @@ class FetchHistoricalData:
         df = pd.DataFrame(data)
         return df
 
+    def fetch_candles(self) -> pd.DataFrame:
+        """
+        Fetch historical data from the OANDA API and parse the candles
+        straight into typed arrays, building the dataframe once.
+
+        Returns:
+            pd.DataFrame: candles indexed by time, with the bid/ask prices
+            and the volume when requested
+        """
+        r = instruments.InstrumentsCandles(
+            instrument=self.instrument, params=self.params
+        )
+        self.client.request(r)
+        return candles_to_frame(
+            r.response["candles"], self.timezone, self.price, self.volume
+        )
+
     def check_columns(self, df: pd.DataFrame) -> None:
         """
         Check if the DataFrame contains the expected columns.
@@ -121,14 +160,14 @@ class FetchHistoricalData:
 
     def fetch_and_process_data(self) -> pd.DataFrame:
         """
-        Chain the methods together to fetch and process the data.
+        Fetch the candles and parse them into a dataframe. With a
+        cache, only the candles missing since the last run are fetched.
 
         Returns:
             pd.DataFrame: processed dataframe
         """
-        df = self.fetch_data()
-        self.check_columns(df)
-        df = self.convert_time(df)
-        df = self.set_index(df)
-        df = self.convert_to_numeric(df)
-        return df
+        if self.cache is not None:
+            return self.cache.load(
+                self.instrument, self.granularity, self.count, self.timezone
+            )
+        return self.fetch_candles()
@@ -0,0 +1,383 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+HAVE_NUMBA = njit is not None
+_RESYNC_EVERY = 1024
+INDICATOR_COLUMNS = ["SMA", "RSI", "MACD", "%K", "%D", "resistance", "support"]
+
+# Loop kernels, compiled with numba when it is installed. They read every
+# input once and write straight into the output buffers. Inputs must be
+# finite, except in the plain rolling mean.
+
+
+def _rolling_mean_std_loop(x, window, mean_out, std_out):
+    # Welford's algorithm over a sliding window
+    n = x.shape[0]
+    mean = 0.0
+    m2 = 0.0
+    for i in range(n):
+        value = x[i]
+        if i < window:
+            delta = value - mean
+            mean += delta / (i + 1)
+            m2 += delta * (value - mean)
+        else:
+            old = x[i - window]
+            delta = value - old
+            old_mean = mean
+            mean += delta / window
+            m2 += delta * (value - mean + old - old_mean)
+            if i % _RESYNC_EVERY == 0:
+                # Recompute the window exactly to stop rounding drift
+                mean = 0.0
+                for k in range(i - window + 1, i + 1):
+                    mean += x[k]
+                mean /= window
+                m2 = 0.0
+                for k in range(i - window + 1, i + 1):
+                    m2 += (x[k] - mean) ** 2
+            elif m2 < 0.0:
+                m2 = 0.0
+        if i >= window - 1:
+            mean_out[i] = mean
+            std_out[i] = math.sqrt(m2 / (window - 1)) if window > 1 else math.nan
+        else:
+            mean_out[i] = math.nan
+            std_out[i] = math.nan
+
+
+def _rolling_mean_loop(x, window, out):
+    # Summed per window so that a NaN only spoils the windows holding it
+    n = x.shape[0]
+    for i in range(n):
+        if i < window - 1:
+            out[i] = math.nan
+            continue
+        total = 0.0
+        for k in range(i - window + 1, i + 1):
+            total += x[k]
+        out[i] = total / window
+
+
+def _rolling_min_max_loop(low, high, window, min_out, max_out):
+    # Monotonic deques of indices stored in preallocated arrays
+    n = low.shape[0]
+    min_queue = np.empty(n, dtype=np.int64)
+    max_queue = np.empty(n, dtype=np.int64)
+    min_head = min_tail = max_head = max_tail = 0
+    for i in range(n):
+        while min_tail > min_head and low[min_queue[min_tail - 1]] >= low[i]:
+            min_tail -= 1
+        min_queue[min_tail] = i
+        min_tail += 1
+        if min_queue[min_head] <= i - window:
+            min_head += 1
+        while max_tail > max_head and high[max_queue[max_tail - 1]] <= high[i]:
+            max_tail -= 1
+        max_queue[max_tail] = i
+        max_tail += 1
+        if max_queue[max_head] <= i - window:
+            max_head += 1
+        if i >= window - 1:
+            min_out[i] = low[min_queue[min_head]]
+            max_out[i] = high[max_queue[max_head]]
+        else:
+            min_out[i] = math.nan
+            max_out[i] = math.nan
+
+
+def _ewm_mean_loop(x, span, out):
+    # Same recurrence as pandas' ewma kernel with adjust=True
+    decay = 1.0 - 2.0 / (span + 1.0)
+    weight = 0.0
+    mean = math.nan
+    for i in range(x.shape[0]):
+        value = x[i]
+        if math.isnan(mean):
+            mean = value
+            weight = 1.0
+        else:
+            weight *= decay
+            if mean != value:
+                mean = (weight * mean + value) / (weight + 1.0)
+            weight += 1.0
+        out[i] = mean
+
+
+# NumPy fallbacks with the same signatures. The rolling windows are
+# accumulated over the `window` shifted, contiguous slices of the input,
+# which is much faster than reducing a sliding window view of short rows.
+
+
+def _shifted(x, window):
+    # Slices x[k:k + size] for every offset k of the window
+    size = len(x) - window + 1
+    for k in range(window):
+        stop = k + size
+        yield x[k:stop]
+
+
+def _rolling_mean_std_numpy(x, window, mean_out, std_out):
+    first = window - 1
+    mean_out[:first] = np.nan
+    std_out[:first] = np.nan
+    if len(x) < window:
+        return
+    mean = mean_out[first:]
+    variance = std_out[first:]
+    mean[:] = 0.0
+    for shifted in _shifted(x, window):
+        mean += shifted
+    mean /= window
+    # Second pass over the deviations, exact where a running sum of
+    # squares would cancel
+    variance[:] = 0.0
+    deviation = np.empty_like(mean)
+    for shifted in _shifted(x, window):
+        np.subtract(shifted, mean, out=deviation)
+        deviation *= deviation
+        variance += deviation
+    variance /= window - 1
+    np.sqrt(variance, out=variance)
+
+
+def _rolling_mean_numpy(x, window, out):
+    first = window - 1
+    if len(x) >= window:
+        mean = out[first:]
+        mean[:] = 0.0
+        for shifted in _shifted(x, window):
+            mean += shifted
+        mean /= window
+    out[:first] = np.nan
+
+
+def _rolling_min_max_numpy(low, high, window, min_out, max_out):
+    first = window - 1
+    min_out[:first] = np.nan
+    max_out[:first] = np.nan
+    if len(low) < window:
+        return
+    lowest = min_out[first:]
+    highest = max_out[first:]
+    lowest[:] = np.inf
+    highest[:] = -np.inf
+    for shifted in _shifted(low, window):
+        np.minimum(lowest, shifted, out=lowest)
+    for shifted in _shifted(high, window):
+        np.maximum(highest, shifted, out=highest)
+
+
+def _ewm_mean_numpy(x, span, out):
+    # Closed form of the recurrence, evaluated in blocks short enough for
+    # decay ** -block to stay finite: within a block starting at s,
+    # numerator[s + j] = decay ** j * cumsum(x[s + k] * decay ** -k)[j]
+    # plus the decayed numerator carried over from the previous block.
+    decay = 1.0 - 2.0 / (span + 1.0)
+    n = len(x)
+    if decay <= 0.0 or n == 0:
+        out[:] = x
+        return
+    block = max(1, min(n, int(600 / -math.log(decay))))
+    offsets = np.arange(block, dtype=np.float64)
+    inverse = decay**-offsets
+    powers = decay**offsets
+    weights = (1.0 - decay * powers) / (1.0 - decay)
+    carry = np.empty(block)
+    numerator = 0.0
+    denominator = 0.0
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        size = stop - start
+        chunk = out[start:stop]
+        np.multiply(x[start:stop], inverse[:size], out=chunk)
+        np.cumsum(chunk, out=chunk)
+        chunk *= powers[:size]
+        # Numerator and denominator carried over from the previous block
+        carry_chunk = carry[:size]
+        np.multiply(powers[:size], decay * numerator, out=carry_chunk)
+        chunk += carry_chunk
+        numerator = chunk[-1]
+        np.multiply(powers[:size], decay * denominator, out=carry_chunk)
+        carry_chunk += weights[:size]
+        denominator = carry_chunk[-1]
+        chunk /= carry_chunk
+
+
+if HAVE_NUMBA:
+    _rolling_mean_std = njit(cache=True)(_rolling_mean_std_loop)
+    _rolling_mean = njit(cache=True)(_rolling_mean_loop)
+    _rolling_min_max = njit(cache=True)(_rolling_min_max_loop)
+    _ewm_mean = njit(cache=True)(_ewm_mean_loop)
+else:
+    _rolling_mean_std = _rolling_mean_std_numpy
+    _rolling_mean = _rolling_mean_numpy
+    _rolling_min_max = _rolling_min_max_numpy
+    _ewm_mean = _ewm_mean_numpy
+
+
+def _buffer(out: Optional[np.ndarray], n: int) -> np.ndarray:
+    return np.empty(n, dtype=np.float64) if out is None else out
+
+
+def rolling_mean_std(
+    x: np.ndarray,
+    window: int,
+    mean_out: Optional[np.ndarray] = None,
+    std_out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling mean and sample standard deviation in one pass, as
+    `rolling(window).mean()` and `rolling(window).std()`.
+
+    Args:
+        x (np.ndarray): finite float64 values
+        window (int): window size
+        mean_out (Optional[np.ndarray], optional): buffer of the means
+        std_out (Optional[np.ndarray], optional): buffer of the
+        standard deviations
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: means and standard deviations,
+        NaN before the first full window
+    """
+    mean_out = _buffer(mean_out, len(x))
+    std_out = _buffer(std_out, len(x))
+    _rolling_mean_std(x, window, mean_out, std_out)
+    return mean_out, std_out
+
+
+def rolling_mean(
+    x: np.ndarray, window: int, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Rolling mean as `rolling(window).mean()`, a window holding NaN is
+    NaN.
+
+    Args:
+        x (np.ndarray): float64 values
+        window (int): window size
+        out (Optional[np.ndarray], optional): output buffer
+
+    Returns:
+        np.ndarray: means, NaN before the first full window
+    """
+    out = _buffer(out, len(x))
+    _rolling_mean(x, window, out)
+    return out
+
+
+def rolling_min_max(
+    low: np.ndarray,
+    high: np.ndarray,
+    window: int,
+    min_out: Optional[np.ndarray] = None,
+    max_out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling minimum of the lows and maximum of the highs.
+
+    Args:
+        low (np.ndarray): finite float64 lows
+        high (np.ndarray): finite float64 highs
+        window (int): window size
+        min_out (Optional[np.ndarray], optional): buffer of the minimums
+        max_out (Optional[np.ndarray], optional): buffer of the maximums
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: minimums and maximums, NaN before
+        the first full window
+    """
+    min_out = _buffer(min_out, len(low))
+    max_out = _buffer(max_out, len(high))
+    _rolling_min_max(low, high, window, min_out, max_out)
+    return min_out, max_out
+
+
+def ewm_mean(x: np.ndarray, span: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Exponentially weighted mean as `ewm(span=span).mean()`.
+
+    Args:
+        x (np.ndarray): finite float64 values
+        span (int): span of the decay
+        out (Optional[np.ndarray], optional): output buffer, may be `x`
+
+    Returns:
+        np.ndarray: weighted means
+    """
+    out = _buffer(out, len(x))
+    _ewm_mean(x, span, out)
+    return out
+
+
+def compute_indicators(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Compute the indicators of `calculate_indicators` into one block.
+
+    SMA and the support and resistance share one rolling mean and
+    standard deviation pass, and the intermediate series are computed in
+    the columns of the block that are filled last, so no temporary of the
+    history's length is allocated besides the block.
+
+    Args:
+        high (np.ndarray): finite float64 highs
+        low (np.ndarray): finite float64 lows
+        close (np.ndarray): finite float64 closes
+        out (Optional[np.ndarray], optional): (n, 7) output buffer,
+        Fortran ordered so that every column is contiguous
+
+    Returns:
+        np.ndarray: indicators in the order of `INDICATOR_COLUMNS`
+    """
+    n = len(close)
+    if out is None:
+        out = np.empty((n, len(INDICATOR_COLUMNS)), order="F")
+    sma, rsi, macd, percent_k, percent_d, resistance, support = out.T
+
+    # SMA, resistance and support
+    rolling_mean_std(close, 5, sma, resistance)
+    resistance *= 0.5
+    np.subtract(sma, resistance, out=support)
+    np.add(sma, resistance, out=resistance)
+
+    # RSI, with the gains and losses in the %K and %D columns
+    gain, loss = percent_k, percent_d
+    gain[0] = 0.0
+    np.subtract(close[1:], close[:-1], out=gain[1:])
+    np.negative(gain, out=loss)
+    np.maximum(gain, 0.0, out=gain)
+    np.maximum(loss, 0.0, out=loss)
+    ewm_mean(gain, 5, gain)
+    ewm_mean(loss, 5, loss)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(gain, loss, out=rsi)
+        rsi += 1.0
+        np.divide(100.0, rsi, out=rsi)
+        np.subtract(100.0, rsi, out=rsi)
+
+    # MACD, with the long average in the %K column
+    ewm_mean(close, 5, macd)
+    macd -= ewm_mean(close, 13, percent_k)
+
+    # Stochastic oscillator, with the rolling high in the %D column
+    lowest_low, highest_high = rolling_min_max(low, high, 5, percent_k, percent_d)
+    np.subtract(highest_high, lowest_low, out=highest_high)
+    np.subtract(close, lowest_low, out=percent_k)
+    percent_k *= 100.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_k /= highest_high
+    rolling_mean(percent_k, 3, percent_d)
+    return out
@@ -0,0 +1,281 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+SUB_BUCKET_BITS = 6  # 32 sub-buckets per power of two, about 3% resolution
+_HALF_BITS = SUB_BUCKET_BITS - 1
+_NUM_BUCKETS = (64 - SUB_BUCKET_BITS + 2) << _HALF_BITS
+PERCENTILES = (50, 90, 99, 99.9)
+
+clock = time.perf_counter_ns  # monotonic clock of the spans
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of nanosecond latencies.
+
+    Values are counted in log-linear buckets: every power of two is split
+    into 32 equal sub-buckets, so a percentile is within about 3% of the
+    true value whatever the magnitude, and recording is a bit length, a
+    shift and a list increment.
+    """
+
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * _NUM_BUCKETS
+        self.total = 0
+        self.max = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def record(self, value: int) -> None:
+        """
+        Count a latency.
+
+        Args:
+            value (int): latency in nanoseconds, negative values count
+            as zero
+        """
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift > 0:
+            self.counts[(shift << _HALF_BITS) + (value >> shift)] += 1
+        else:
+            self.counts[value] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @staticmethod
+    def bucket_upper(index: int) -> int:
+        """Highest value counted in a bucket."""
+        if index < 1 << SUB_BUCKET_BITS:
+            return index
+        shift = (index >> _HALF_BITS) - 1
+        mantissa = index - (shift << _HALF_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+    def percentile(self, percentile: float) -> int:
+        """
+        Latency below which the given share of the values fall.
+
+        Args:
+            percentile (float): percentile between 0 and 100
+
+        Returns:
+            int: latency in nanoseconds, 0 if the histogram is empty
+        """
+        count = self.count
+        if not count:
+            return 0
+        rank = max(1, int(round(percentile / 100 * count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_upper(index), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Summarize the histogram.
+
+        Returns:
+            Dict[str, float]: count, mean, percentiles and maximum in
+            microseconds
+        """
+        count = self.count
+        stats = {
+            "count": count,
+            "mean_us": self.total / count / 1e3 if count else 0.0,
+        }
+        for percentile in PERCENTILES:
+            stats[f"p{percentile:g}_us"] = self.percentile(percentile) / 1e3
+        stats["max_us"] = self.max / 1e3
+        return stats
+
+
+class NullLatency:
+    """Latency recorder of a pipeline when instrumentation is disabled."""
+
+    enabled = False
+
+    def record(self, stage: str, start: int) -> None:
+        pass
+
+    def record_value(self, stage: str, value: int) -> None:
+        pass
+
+
+NULL_LATENCY = NullLatency()
+
+
+class InstrumentLatency:
+    """
+    Latency histograms of the stages of one instrument's pipeline.
+
+    A span is the time from a `clock()` reading to the `record` call:
+
+        start = clock()
+        ...
+        latency.record("decision", start)
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {}
+
+    def record(self, stage: str, start: int) -> None:
+        """
+        Record the span of a stage that began at `start`.
+
+        Args:
+            stage (str): name of the stage
+            start (int): `clock()` reading at the start of the stage
+        """
+        elapsed = clock() - start
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        # Inlined `LatencyHistogram.record`, spans are never negative
+        shift = elapsed.bit_length() - SUB_BUCKET_BITS
+        if shift > 0:
+            histogram.counts[(shift << _HALF_BITS) + (elapsed >> shift)] += 1
+        else:
+            histogram.counts[elapsed] += 1
+        histogram.total += elapsed
+        if elapsed > histogram.max:
+            histogram.max = elapsed
+
+    def record_value(self, stage: str, value: int) -> None:
+        """
+        Record a latency measured otherwise, e.g. the tick lag.
+
+        Args:
+            stage (str): name of the stage
+            value (int): latency in nanoseconds
+        """
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.record(value)
+
+
+class LatencyRecorder:
+    """
+    Latency histograms of all the pipelines of a session, with an
+    optional background thread writing a JSON snapshot of the
+    percentiles every `interval` seconds.
+    """
+
+    def __init__(self, path: Optional[str] = None, interval: float = 10.0):
+        self.path = path
+        self.interval = interval
+        self.instruments: Dict[str, InstrumentLatency] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def bind(self, instrument: str) -> InstrumentLatency:
+        """
+        Get the histograms of an instrument.
+
+        Args:
+            instrument (str): currency pair of the pipeline
+
+        Returns:
+            InstrumentLatency: stage histograms of the instrument
+        """
+        with self._lock:
+            latency = self.instruments.get(instrument)
+            if latency is None:
+                latency = self.instruments[instrument] = InstrumentLatency()
+            return latency
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Summarize every histogram.
+
+        Returns:
+            Dict[str, Dict[str, Dict[str, float]]]: statistics keyed by
+            instrument and stage
+        """
+        with self._lock:
+            instruments = list(self.instruments.items())
+        return {
+            instrument: {
+                stage: histogram.snapshot()
+                for stage, histogram in list(latency.stages.items())
+            }
+            for instrument, latency in instruments
+        }
+
+    def write_snapshot(self, path: Optional[str] = None) -> str:
+        """
+        Write the snapshot as JSON, replacing the previous one atomically.
+
+        Args:
+            path (Optional[str], optional): output file. Defaults to the
+            path of the recorder.
+
+        Returns:
+            str: path of the snapshot
+        """
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        snapshot = {"time": time.time(), "instruments": self.snapshot()}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.error(f"Error writing latency snapshot: {e}")
+
+    def start(self) -> None:
+        """Start writing snapshots in the background."""
+        self._thread = threading.Thread(
+            target=self._run, name="latency-snapshot", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background writes and write a final snapshot."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.path is not None:
+            self.write_snapshot()
+
+    def summary(self) -> List[str]:
+        """
+        Format the snapshot as one line per instrument and stage.
+
+        Returns:
+            List[str]: lines of the summary
+        """
+        lines = []
+        for instrument, stages in self.snapshot().items():
+            for stage, stats in sorted(stages.items()):
+                lines.append(
+                    f"{instrument} {stage}: n={stats['count']} "
+                    f"p50={stats['p50_us']:.1f}us p99={stats['p99_us']:.1f}us "
+                    f"max={stats['max_us']:.1f}us"
+                )
+        return lines
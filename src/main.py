@@ -1,9 +1,10 @@
-import concurrent.futures
+import argparse
+import asyncio
 import datetime
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Dict, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple, Union
 
 import oandapyV20.endpoints.accounts as accounts
 import pandas as pd
@@ -12,8 +13,16 @@ from loguru import logger
 from oandapyV20 import API
 from termcolor import colored
 
+from src.async_pipeline import AsyncStreamingDataPipeline
+from src.candle_cache import CandleCache
+from src.compact import CompactFrame, PrecisionError
+from src.event_log import EventLog
+from src.features import FeaturePipeline
 from src.fetch_historical_data import FetchHistoricalData
+from src.latency import LatencyRecorder
+from src.stream_reader import PricingStreamReader
 from src.streaming_pipeline import StreamingDataPipeline
+from src.tick_recorder import TickRecorder
 from src.utils import calculate_indicators, parse_yml
 
 load_dotenv()
@@ -53,11 +62,15 @@ def fetch_historical_candles(cfg: Dict, instrument: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame containing the historical data
     """
+    cache = None
+    if cfg.get("candle_cache", {}).get("enabled", False):
+        cache = CandleCache(cfg["candle_cache"]["path"])
     fetcher = FetchHistoricalData(
         instrument,
         cfg["candlestick"]["granularity"],
         token,
         cfg["candlestick"]["count"],
+        cache=cache,
     )
     df = fetcher.fetch_and_process_data()
     return df
@@ -65,28 +78,74 @@ def fetch_historical_candles(cfg: Dict, instrument: str) -> pd.DataFrame:
 
 def start_streaming_pipeline(
     instrument: str,
-    df: pd.DataFrame,
+    df: Union[pd.DataFrame, CompactFrame],
     precision: int,
     stop_loss: float,
     take_profit: float,
-):
+    reader: Optional[PricingStreamReader] = None,
+    recorder: Optional[TickRecorder] = None,
+    features: Optional[FeaturePipeline] = None,
+    state_encoder: Optional[Dict] = None,
+    checkpoint: Optional[Dict] = None,
+    agent: Optional[Dict] = None,
+    event_log: Optional[EventLog] = None,
+    latency: Optional[LatencyRecorder] = None,
+    feature_store: Optional[Dict] = None,
+) -> pd.DataFrame:
     """
     Execute the real time streaming pipeline for trading the selected
     currency pair.
 
     Args:
         instrument (str): currency pair to trade
-        df (pd.DataFrame): historical candlestick data
+        df (Union[pd.DataFrame, CompactFrame]): historical candlestick
+        data
         precision (int): number of decimal places
         stop_loss (float): stop loss value
         take_profit (float): take profit value
+        reader (Optional[PricingStreamReader], optional): shared pricing
+        stream to subscribe to. Defaults to a dedicated stream.
+        recorder (Optional[TickRecorder], optional): recorder of the
+        incoming ticks. Defaults to None.
+        features (Optional[FeaturePipeline], optional): multi-timeframe
+        features of the agent's state. Defaults to the candle row.
+        state_encoder (Optional[Dict], optional): features and number of
+        bins of the discretized state. Defaults to one state per feature.
+        checkpoint (Optional[Dict], optional): checkpoint settings of the
+        agent. Defaults to no checkpoints.
+        agent (Optional[Dict], optional): type and settings of the agent.
+        Defaults to the tabular Q-learning agent.
+        event_log (Optional[EventLog], optional): structured log of the
+        session events. Defaults to None.
+        latency (Optional[LatencyRecorder], optional): latency histograms
+        of the pipeline stages. Defaults to None.
+        feature_store (Optional[Dict], optional): settings of the shared
+        feature store the pipeline writes. Defaults to None.
+
+    Returns:
+        pd.DataFrame: candlestick data gathered during the session
     """
     client = API(access_token=token)
     params = {"instruments": instrument}
     pipeline = StreamingDataPipeline(
-        accountID, params, client, df, precision, stop_loss, take_profit
+        accountID,
+        params,
+        client,
+        df,
+        precision,
+        stop_loss,
+        take_profit,
+        recorder=recorder,
+        features=features,
+        state_encoder=state_encoder,
+        checkpoint=checkpoint,
+        agent=agent,
+        event_log=event_log,
+        latency=latency,
+        feature_store=feature_store,
     )
-    pipeline.run()
+    ticks = reader.subscribe(instrument) if reader is not None else None
+    return pipeline.run(ticks)
 
 
 def select_currency_pair(round_number: int) -> str:
@@ -138,78 +197,456 @@ def get_instrument_config(
     return precision, stoploss, takeprofit
 
 
-def start_pipeline_in_concurrent_executor(
-    executor: ThreadPoolExecutor,
-    instrument: str,
-    df: pd.DataFrame,
-    precision: int,
-    stoploss: float,
-    takeprofit: float,
-) -> Any:
+def create_tick_recorder(cfg: Dict) -> Optional[TickRecorder]:
     """
-    Start the pipeline in a concurrent executor.
+    Create a recorder for the ticks of this session if enabled in the
+    configuration.
 
     Args:
-        executor (ThreadPoolExecutor): multithreading executor
-        instrument (str): currency pair to trade
-        df (pd.DataFrame): historical candlestick data
-        precision (int): number of decimal places
-        stoploss (float): stop loss value
-        takeprofit (float): take profit value
+        cfg (Dict): configuration dictionary
 
     Returns:
-        Any: result of the pipeline execution,
-        not compulsory to return anything
+        Optional[TickRecorder]: recorder writing to a new file, None if
+        recording is disabled
     """
-    future = executor.submit(
-        start_streaming_pipeline,
-        instrument,
-        df,
-        precision,
-        stoploss,
-        takeprofit,
+    if not cfg.get("tick_recorder", {}).get("enabled", False):
+        return None
+    name = f"ticks-{datetime.datetime.now():%Y%m%d-%H%M%S}.bin"
+    return TickRecorder(os.path.join(cfg["tick_recorder"]["path"], name))
+
+
+def create_event_log(cfg: Dict) -> Optional[EventLog]:
+    """
+    Create the structured event log of this session if enabled in the
+    configuration.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[EventLog]: event log writing to a new file, None if
+        disabled
+    """
+    if not cfg.get("event_log", {}).get("enabled", False):
+        return None
+    name = f"events-{datetime.datetime.now():%Y%m%d-%H%M%S}.jsonl"
+    return EventLog.from_config(
+        cfg["event_log"], os.path.join(cfg["event_log"]["path"], name)
     )
+
+
+def create_feature_pipeline(cfg: Dict) -> Optional[FeaturePipeline]:
+    """
+    Create the multi-timeframe feature pipeline if enabled in the
+    configuration.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[FeaturePipeline]: feature pipeline, None if disabled
+    """
+    if not cfg.get("features", {}).get("enabled", False):
+        return None
+    return FeaturePipeline.from_config(cfg["features"])
+
+
+def create_latency_recorder(cfg: Dict) -> Optional[LatencyRecorder]:
+    """
+    Create the latency instrumentation of the pipelines if enabled in
+    the configuration and start writing its snapshots.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[LatencyRecorder]: running recorder, None if disabled
+    """
+    latency_cfg = cfg.get("latency", {})
+    if not latency_cfg.get("enabled", False):
+        return None
+    recorder = LatencyRecorder(latency_cfg["path"], latency_cfg.get("interval", 10))
+    recorder.start()
+    return recorder
+
+
+def get_state_encoder_config(cfg: Dict) -> Optional[Dict]:
+    """
+    Get the state discretization settings if enabled in the
+    configuration.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[Dict]: features and number of bins, None if disabled
+    """
+    encoder_cfg = cfg.get("state_encoder", {})
+    return encoder_cfg if encoder_cfg.get("enabled", False) else None
+
+
+def get_checkpoint_config(cfg: Dict) -> Optional[Dict]:
+    """
+    Get the checkpoint settings of the agents if enabled in the
+    configuration.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[Dict]: checkpoint settings, None if disabled
+    """
+    checkpoint_cfg = cfg.get("checkpoint", {})
+    return checkpoint_cfg if checkpoint_cfg.get("enabled", False) else None
+
+
+def get_feature_store_config(cfg: Dict) -> Optional[Dict]:
+    """
+    Get the settings of the shared feature stores if enabled in the
+    configuration.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[Dict]: path, capacity and dtype, None if disabled
+    """
+    store_cfg = cfg.get("feature_store", {})
+    return store_cfg if store_cfg.get("enabled", False) else None
+
+
+def get_agent_config(cfg: Dict) -> Optional[Dict]:
+    """
+    Get the type and settings of the agent.
+
+    Args:
+        cfg (Dict): configuration dictionary
+
+    Returns:
+        Optional[Dict]: agent settings, None for the tabular Q-learning
+        agent
+    """
+    agent_cfg = cfg.get("agent", {})
+    return agent_cfg if agent_cfg.get("type", "q_learning") != "q_learning" else None
+
+
+def to_compact(
+    cfg: Dict, instrument: str, df: pd.DataFrame
+) -> Union[pd.DataFrame, CompactFrame]:
+    """
+    Convert the historical data of an instrument to a compact frame if
+    enabled in the configuration and precise enough for the instrument.
+
+    Args:
+        cfg (Dict): configuration dictionary
+        instrument (str): currency pair of the data
+        df (pd.DataFrame): candlestick and indicator data
+
+    Returns:
+        Union[pd.DataFrame, CompactFrame]: compact frame, or the
+        dataframe if compact mode is disabled or too imprecise
+    """
+    compact_cfg = cfg.get("compact", {})
+    if not compact_cfg.get("enabled", False):
+        return df
     try:
-        result = future.result()
-    except Exception as e:
-        print(f"An exception occurred: {e}")
-    return result
+        return CompactFrame.from_frame(
+            df,
+            cfg["instrument_precision"][instrument],
+            compact_cfg.get("tolerance", 0.01),
+        )
+    except PrecisionError as e:
+        logger.warning(f"Keeping {instrument} in float64: {e}")
+        return df
+
+
+def prepare_historical_data(
+    cfg: Dict, instrument: str
+) -> Union[pd.DataFrame, CompactFrame]:
+    """
+    Fetch the historical candlestick data of an instrument and calculate
+    the technical indicators.
+
+    Args:
+        cfg (Dict): configuration dictionary
+        instrument (str): currency pair to fetch data for
+
+    Returns:
+        Union[pd.DataFrame, CompactFrame]: historical data, a compact
+        frame in compact mode
+    """
+    df = fetch_historical_candles(cfg, instrument)
+    df = calculate_indicators(df, fast=True).dropna(inplace=False)
+    return to_compact(cfg, instrument, df)
+
+
+def fetch_all_historical_candles(
+    cfg: Dict, instruments: List[str]
+) -> Dict[str, Union[pd.DataFrame, CompactFrame]]:
+    """
+    Fetch the historical candlestick data of all the instruments in
+    parallel and calculate the technical indicators.
+
+    Args:
+        cfg (Dict): configuration dictionary
+        instruments (List[str]): currency pairs to fetch data for
+
+    Returns:
+        Dict[str, Union[pd.DataFrame, CompactFrame]]: historical data
+        keyed by instrument, compact frames in compact mode
+    """
+    if not instruments:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(instruments)) as executor:
+        frames = executor.map(
+            lambda instrument: prepare_historical_data(cfg, instrument), instruments
+        )
+        return dict(zip(instruments, frames))
+
+
+def run_pipelines(
+    cfg: Dict,
+    instruments: List[str],
+    historical_data: Dict[str, Union[pd.DataFrame, CompactFrame]],
+    max_restarts: int = 3,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Start the streaming pipelines of all the instruments at the same time
+    and supervise them until they finish. All pipelines are fed by a
+    single multiplexed pricing stream. A pipeline that fails is
+    restarted on freshly fetched historical data up to `max_restarts`
+    times.
+
+    Args:
+        cfg (Dict): configuration dictionary
+        instruments (List[str]): currency pairs to trade
+        historical_data (Dict[str, Union[pd.DataFrame, CompactFrame]]):
+        historical data keyed by instrument
+        max_restarts (int, optional): maximum number of restarts per
+        instrument. Defaults to 3.
+
+    Returns:
+        Dict[str, pd.DataFrame]: data gathered during the session keyed by
+        instrument, instruments that kept failing are left out
+    """
+    if not instruments:
+        return {}
+    results = {}
+    restarts = {instrument: 0 for instrument in instruments}
+    reader = PricingStreamReader(API(access_token=token), accountID, instruments)
+    recorder = create_tick_recorder(cfg)
+    event_log = create_event_log(cfg)
+    latency = create_latency_recorder(cfg)
+
+    with ThreadPoolExecutor(max_workers=len(instruments)) as executor:
+
+        def start(instrument: str, refetch: bool) -> pd.DataFrame:
+            # The history of a failed pipeline is stale by the time it restarts
+            if refetch:
+                historical_data[instrument] = prepare_historical_data(cfg, instrument)
+            precision, stoploss, takeprofit = get_instrument_config(cfg, instrument)
+            return start_streaming_pipeline(
+                instrument,
+                historical_data[instrument],
+                precision,
+                stoploss,
+                takeprofit,
+                reader,
+                recorder,
+                create_feature_pipeline(cfg),
+                get_state_encoder_config(cfg),
+                get_checkpoint_config(cfg),
+                get_agent_config(cfg),
+                event_log,
+                latency,
+                get_feature_store_config(cfg),
+            )
+
+        def submit(instrument: str, refetch: bool = False) -> Future:
+            return executor.submit(start, instrument, refetch)
+
+        running = {submit(instrument): instrument for instrument in instruments}
+        reader.start()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                instrument = running.pop(future)
+                try:
+                    results[instrument] = future.result()
+                    logger.info(f"Pipeline for {instrument} completed.")
+                except Exception as e:
+                    if restarts[instrument] >= max_restarts:
+                        logger.error(
+                            f"Pipeline for {instrument} failed {restarts[instrument]}"
+                            f" times, giving up: {e}"
+                        )
+                        continue
+                    restarts[instrument] += 1
+                    logger.warning(
+                        f"Pipeline for {instrument} failed: {e}. Restarting "
+                        f"({restarts[instrument]}/{max_restarts})..."
+                    )
+                    running[submit(instrument, refetch=True)] = instrument
+
+    reader.stop(timeout=10)
+    if recorder is not None:
+        recorder.close()
+    if event_log is not None:
+        event_log.close()
+    if latency is not None:
+        latency.stop()
+        for line in latency.summary():
+            logger.info(line)
+    return results
+
+
+async def run_async_pipelines(
+    cfg: Dict,
+    instruments: List[str],
+    historical_data: Dict[str, Union[pd.DataFrame, CompactFrame]],
+) -> Dict[str, pd.DataFrame]:
+    """
+    Run the asyncio variant of the streaming pipelines of all the
+    instruments on one event loop, fed by a single multiplexed pricing
+    stream.
+
+    Args:
+        cfg (Dict): configuration dictionary
+        instruments (List[str]): currency pairs to trade
+        historical_data (Dict[str, Union[pd.DataFrame, CompactFrame]]):
+        historical data keyed by instrument
+
+    Returns:
+        Dict[str, pd.DataFrame]: data gathered during the session keyed by
+        instrument
+    """
+    reader = PricingStreamReader(API(access_token=token), accountID, instruments)
+    recorder = create_tick_recorder(cfg)
+    event_log = create_event_log(cfg)
+    latency = create_latency_recorder(cfg)
+    tasks = []
+    for instrument in instruments:
+        precision, stoploss, takeprofit = get_instrument_config(cfg, instrument)
+        pipeline = AsyncStreamingDataPipeline(
+            accountID,
+            {"instruments": instrument},
+            API(access_token=token),
+            historical_data[instrument],
+            precision,
+            stoploss,
+            takeprofit,
+            recorder=recorder,
+            features=create_feature_pipeline(cfg),
+            state_encoder=get_state_encoder_config(cfg),
+            checkpoint=get_checkpoint_config(cfg),
+            agent=get_agent_config(cfg),
+            event_log=event_log,
+            latency=latency,
+            feature_store=get_feature_store_config(cfg),
+        )
+        tasks.append(pipeline.run(reader.subscribe(instrument)))
+
+    reader.start()
+    try:
+        frames = await asyncio.gather(*tasks)
+    finally:
+        reader.stop(timeout=10)
+        if recorder is not None:
+            recorder.close()
+        if event_log is not None:
+            event_log.close()
+        if latency is not None:
+            latency.stop()
+            for line in latency.summary():
+                logger.info(line)
+    return dict(zip(instruments, frames))
+
+
+def select_instruments_interactively(num_rounds: int = 2) -> List[str]:
+    """
+    Prompt the user to select distinct currency pairs.
+
+    Args:
+        num_rounds (int, optional): number of currency pairs to select.
+        Defaults to 2.
+
+    Returns:
+        List[str]: selected currency pairs
+    """
+    selected = []
+    for round_number in range(1, num_rounds + 1):
+        instrument = select_currency_pair(round_number)
+        while instrument in selected:
+            print("Duplicate pairs are not allowed. Please select again.")
+            instrument = select_currency_pair(round_number)
+        selected.append(instrument)
+    return selected
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Run the QTraderFX pipeline.")
+    parser.add_argument(
+        "--config",
+        default="./cfg/parameters.yaml",
+        help="path to the configuration file",
+    )
+    parser.add_argument(
+        "--instruments",
+        nargs="+",
+        help="currency pairs to trade, overrides the configuration file",
+    )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="run the asyncio variant of the streaming pipelines",
+    )
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="select two currency pairs through the console prompt",
+    )
+    return parser.parse_args()
 
 
 def main():
     """Main function to run the pipeline from end to end."""
 
+    args = parse_args()
     logger.info("Starting the pipeline...")
-    cfg = parse_yml("./cfg/parameters.yaml")
+    cfg = parse_yml(args.config)
 
     # Get account summary before starting the pipeline
     get_account_summary()
     time.sleep(2)
 
-    instrument1 = select_currency_pair(1)
-    instrument2 = select_currency_pair(2)
-
-    while instrument1 == instrument2:
-        print("Duplicate pairs are not allowed. Please select again.")
-        instrument2 = select_currency_pair(2)
+    if args.interactive:
+        instruments = select_instruments_interactively()
+    elif args.instruments:
+        instruments = list(dict.fromkeys(args.instruments))
+    else:
+        instruments = cfg["trading"]["instruments"]
 
-    print(f"Selected currency pairs are : {instrument1}, {instrument2}")
+    unknown = [i for i in instruments if i not in cfg["instrument_precision"]]
+    if unknown:
+        raise ValueError(f"Instruments missing from the configuration: {unknown}")
 
-    precision_1, stoploss_1, takeprofit_1 = get_instrument_config(cfg, instrument1)
-    precision_2, stoploss_2, takeprofit_2 = get_instrument_config(cfg, instrument2)
+    print(f"Selected currency pairs are : {', '.join(instruments)}")
 
-    df_1 = calculate_indicators(fetch_historical_candles(cfg, instrument1)).dropna(
-        inplace=False
-    )
-    df_2 = calculate_indicators(fetch_historical_candles(cfg, instrument2)).dropna(
-        inplace=False
-    )
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        start_pipeline_in_concurrent_executor(
-            executor, instrument1, df_1, precision_1, stoploss_1, takeprofit_1
-        )
-        start_pipeline_in_concurrent_executor(
-            executor, instrument2, df_2, precision_2, stoploss_2, takeprofit_2
+    historical_data = fetch_all_historical_candles(cfg, instruments)
+    if args.asyncio:
+        asyncio.run(run_async_pipelines(cfg, instruments, historical_data))
+    else:
+        run_pipelines(
+            cfg,
+            instruments,
+            historical_data,
+            cfg.get("trading", {}).get("max_restarts", 3),
         )
     logger.info("Pipeline completed.")
 
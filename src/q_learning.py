@@ -1,10 +1,20 @@
+from typing import List, Optional, Tuple, Union
+
 import numpy as np
 import pandas as pd
 from loguru import logger
-from termcolor import colored
+
+from src.bar_aggregator import Bar
+from src.candle_store import CandleStore
+from src.compact import CompactFrame, candle_arrays
+from src.event_log import NULL_EVENT_LOG
+from src.state_encoder import ArgmaxEncoder, SparseQTable, StateEncoder
 
 
 class QLearningTrader:
+    MAX_DENSE_STATES = 1_000_000  # larger state spaces use a sparse Q-table
+    events = NULL_EVENT_LOG  # structured log of the decisions and Q-updates
+
     def __init__(
         self,
         num_actions,
@@ -12,6 +22,8 @@ class QLearningTrader:
         learning_rate,
         discount_factor,
         exploration_prob,
+        encoder: Optional[Union[ArgmaxEncoder, StateEncoder]] = None,
+        sparse: Optional[bool] = None,
     ):
 
         self.num_actions = num_actions  # 3: Buy, Sell & Hold
@@ -21,8 +33,17 @@ class QLearningTrader:
         self.exploration_prob = exploration_prob
         self.cumulative_reward = 0
 
-        # Initialize Q-table with zeros
-        self.q_table = np.zeros((num_actions, num_features))
+        # Map feature rows to state ids, one state per feature by default
+        self.encoder = encoder or ArgmaxEncoder(num_features)
+        self.num_states = self.encoder.num_states
+
+        # Initialize Q-table with zeros, rows are states, columns actions
+        if sparse is None:
+            sparse = self.num_states > self.MAX_DENSE_STATES
+        if sparse:
+            self.q_table = SparseQTable(self.num_states, num_actions)
+        else:
+            self.q_table = np.zeros((self.num_states, num_actions))
 
         # Initialize state and action
         self.current_state = None
@@ -44,8 +65,8 @@ class QLearningTrader:
         if np.random.uniform(0, 1) < self.exploration_prob:
             return np.random.choice(self.num_actions)  # Explore
         else:
-            feature_index = np.argmax(state)
-            return np.argmax(self.q_table[:, feature_index])  # Exploit
+            state_id = self.encoder.encode(state)
+            return np.argmax(self.q_table[state_id])  # Exploit
 
     def calculate_reward(
         self, action: int, current_close: float, next_close: float
@@ -81,14 +102,18 @@ class QLearningTrader:
         """
         # Update Q-table based on the observed reward
         if self.current_action is not None:
-            feature_index = np.argmax(self.current_state)
-            current_q_value = self.q_table[self.current_action, feature_index]
+            if self.current_state is None:
+                state_id = 0
+            else:
+                state_id = self.encoder.encode(self.current_state)
+            q_row = self.q_table[state_id]
+            current_q_value = q_row[self.current_action]
             new_q_value = (
                 1 - self.learning_rate
             ) * current_q_value + self.learning_rate * (
-                reward + self.discount_factor * np.max(self.q_table[:, feature_index])
+                reward + self.discount_factor * np.max(q_row)
             )
-            self.q_table[self.current_action, feature_index] = new_q_value
+            q_row[self.current_action] = new_q_value
             self.latest_q_value = new_q_value
 
         # Update current state and action
@@ -128,35 +153,157 @@ class QLearningTrader:
             self.take_action(action, reward)
 
             # Log the state, action, reward, updated Q-value, and cumulative reward
-
-            print(
-                colored("State: ", "green")
-                + "\n"
-                + colored(f"{current_close}", "white")
-                + colored(", Action: ", "green")
-                + colored(f"{action}", "white")
-                + colored(", Reward: ", "green")
-                + colored(f"{reward}", "white")
-                + colored(", Updated Q-value: ", "green")
-                + colored(f"{self.latest_q_value}", "white")
-                + colored(", Cumulative reward: ", "green")
-                + colored(f"{self.cumulative_reward}", "white")
-            )
+            if self.events.enabled("q_update"):
+                self.events.write(
+                    "q_update",
+                    step=i,
+                    close=current_close,
+                    action=action,
+                    reward=reward,
+                    q_value=self.latest_q_value,
+                    cumulative_reward=self.cumulative_reward,
+                )
         logger.info("Training complete.")
         print("Final Q-table:")
         print(self.q_table)
 
         return actions, cumulative_rewards
 
-    def update(self, historical_df: pd.DataFrame, new_data_df: pd.DataFrame) -> int:
+    def prepare_training_arrays(
+        self,
+        historical_data: Union[pd.DataFrame, CompactFrame],
+        features: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Extract the arrays needed for training from the candlestick data
+        in a single pass.
+
+        Args:
+            historical_data (Union[pd.DataFrame, CompactFrame]): input
+            candlestick data, the block of a compact frame is encoded
+            without copying
+            features (Optional[np.ndarray], optional): feature matrix with
+            one row per candle to derive the states from instead of the
+            candlestick data. Defaults to None.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: state index of every row and
+            the reward of every action at every time step, shaped
+            (n - 1, num_actions)
+        """
+        block, closes = candle_arrays(historical_data)
+        if features is None:
+            features = block
+
+        states = self.encoder.encode_array(features)
+
+        price_change = (closes[1:] - closes[:-1]) / closes[:-1]
+        rewards = np.column_stack((price_change, -price_change, price_change))
+        return states, rewards
+
+    def train_vectorized(
+        self,
+        historical_data: Union[pd.DataFrame, CompactFrame],
+        verbose: bool = True,
+        features: Optional[np.ndarray] = None,
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Train the Q-learning model on pre-extracted NumPy arrays. Only
+        the sequential Q-table update runs in a loop, the per-row pandas
+        access and console output of `train` are skipped. Returns the
+        same actions and cumulative rewards as `train` for the same
+        random seed.
+
+        Args:
+            historical_data (Union[pd.DataFrame, CompactFrame]): input
+            candlestick data
+            verbose (bool, optional): log the progress and print the final
+            Q-table. Defaults to True.
+            features (Optional[np.ndarray], optional): feature matrix with
+            one row per candle to derive the states from. Defaults to None.
+
+        Returns:
+            Tuple[List[int], List[float]]: actions taken and the
+            cumulative rewards at each time step
+        """
+        if verbose:
+            logger.info("Training the Q-learning model (vectorized)...")
+
+        states, rewards = self.prepare_training_arrays(historical_data, features)
+        states = states[:-1].tolist()
+        rewards = rewards.tolist()
+
+        # Lists of the visited rows for cheap element access
+        q_rows = {}
+        learning_rate = self.learning_rate
+        discount_factor = self.discount_factor
+        exploration_prob = self.exploration_prob
+        num_actions = self.num_actions
+        random = np.random.random
+        randint = np.random.randint
+
+        actions = []
+        cumulative_rewards = [np.nan]
+        cumulative_reward = self.cumulative_reward
+        previous_action = self.current_action
+        latest_q_value = self.latest_q_value
+
+        for state, step_rewards in zip(states, rewards):
+            q_row = q_rows.get(state)
+            if q_row is None:
+                q_row = q_rows[state] = self.q_table[state].tolist()
+            if random() < exploration_prob:
+                action = randint(num_actions)  # Explore
+            else:
+                action = q_row.index(max(q_row))  # Exploit
+            actions.append(action)
+
+            reward = step_rewards[action]
+            cumulative_reward += reward
+            cumulative_rewards.append(cumulative_reward)
+
+            if previous_action is not None:
+                latest_q_value = (1 - learning_rate) * q_row[
+                    previous_action
+                ] + learning_rate * (reward + discount_factor * max(q_row))
+                q_row[previous_action] = latest_q_value
+            previous_action = action
+
+        for state, q_row in q_rows.items():
+            self.q_table[state] = q_row
+        self.cumulative_reward = cumulative_reward
+        self.latest_q_value = latest_q_value
+        self.current_state = None
+        self.current_action = previous_action
+
+        if verbose:
+            logger.info(
+                f"Training complete. Steps: {len(actions)}, "
+                f"Cumulative reward: {cumulative_reward}"
+            )
+            print("Final Q-table:")
+            print(self.q_table)
+
+        return actions, cumulative_rewards
+
+    def update(
+        self,
+        historical_df: Union[pd.DataFrame, CandleStore],
+        new_data_df: Union[pd.DataFrame, Bar],
+        state: Optional[np.ndarray] = None,
+    ) -> int:
         """
         Continuously update the Q-learning model based on real-time data
         and make trading decisions.
 
         Args:
-            historical_df (pd.DataFrame): historical candlestick data right
-            before the new data
-            new_data_df (pd.DataFrame): new candlestick data at minute-level
+            historical_df (Union[pd.DataFrame, CandleStore]): historical
+            candlestick data right before the new data
+            new_data_df (Union[pd.DataFrame, Bar]): new candlestick data at
+            minute-level, a one-row dataframe or a bar
+            state (Optional[np.ndarray], optional): feature vector of the
+            current state instead of the last historical row.
+            Defaults to None.
 
         Raises:
             ValueError: New data DataFrame must contain exactly one row of data.
@@ -166,14 +313,22 @@ class QLearningTrader:
         """
 
         self.cumulative_reward = 0
-        if len(new_data_df) != 1:
+        if isinstance(new_data_df, Bar):
+            next_close = new_data_df.close
+        elif len(new_data_df) != 1:
             raise ValueError("New data DataFrame must contain exactly one row of data.")
+        else:
+            next_close = new_data_df.iloc[0]["Close"]
 
         # The current state is the last row of the historical data
-        current_state = historical_df.iloc[-1]
-
-        # The new state is the incoming data
-        next_state = new_data_df.iloc[0]
+        if isinstance(historical_df, CandleStore):
+            current_state = historical_df.last_row()
+            current_close = historical_df.last("Close")
+        else:
+            current_state = historical_df.iloc[-1]
+            current_close = current_state["Close"]
+        if state is not None:
+            current_state = state
 
         # Choose an action based on the current state
         action = self.choose_action(current_state)
@@ -186,28 +341,24 @@ class QLearningTrader:
             print("Hold signal detected.")
 
         # Calculate the reward based on the action taken and the observed price movement
-        reward = self.calculate_reward(
-            action, current_state["Close"], next_state["Close"]
-        )
+        reward = self.calculate_reward(action, current_close, next_close)
 
         # Update cumulative reward
         self.cumulative_reward += reward
         # Take the action and update the Q-table
+        self.current_state = current_state
         self.take_action(action, reward)
 
-        # Log the state, action, reward, updated Q-value, and cumulative reward
-        print(
-            colored("State: ", "green")
-            + "\n"
-            + colored(f"{current_state}", "white")
-            + colored(", Action: ", "green")
-            + colored(f"{action}", "white")
-            + colored(", Reward: ", "green")
-            + colored(f"{reward}", "white")
-            + colored(", Updated Q-value: ", "green")
-            + colored(f"{self.latest_q_value}", "white")
-            + colored(", Cumulative reward: ", "green")
-            + colored(f"{self.cumulative_reward}", "white")
-        )
+        # Log the action, reward, updated Q-value, and cumulative reward
+        if self.events.enabled("decision"):
+            self.events.write(
+                "decision",
+                close=current_close,
+                next_close=next_close,
+                action=action,
+                reward=reward,
+                q_value=self.latest_q_value,
+                cumulative_reward=self.cumulative_reward,
+            )
 
         return action
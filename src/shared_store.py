@@ -0,0 +1,473 @@
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.compact import CompactFrame
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, the single writer is not enforced
+    fcntl = None
+
+MAGIC = b"FXFEAT01"
+HEADER_SIZE = 4096
+_FIELDS_OFFSET = 8  # live uint64 fields after the magic
+_LENGTH_OFFSET = 56  # length of the JSON layout
+_LAYOUT_OFFSET = 64
+_SEQUENCE, _SIZE, _END, _HEAD, _COUNT = range(5)
+
+
+class StoreLockedError(RuntimeError):
+    """Another writer already holds the feature store."""
+
+
+def store_path(root: str, instrument: str, granularity: str) -> str:
+    """
+    Path of the feature store of an instrument and granularity, laid out
+    like the candle cache.
+
+    Args:
+        root (str): directory of the feature stores
+        instrument (str): currency pair
+        granularity (str): candle granularity, e.g. "M1"
+
+    Returns:
+        str: path of the store file
+    """
+    return os.path.join(root, instrument, f"{granularity}.features")
+
+
+def _read_layout(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER_SIZE or header[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a feature store.")
+    length = int.from_bytes(header[_LENGTH_OFFSET:_LAYOUT_OFFSET], "little")
+    end = _LAYOUT_OFFSET + length
+    return json.loads(header[_LAYOUT_OFFSET:end])
+
+
+def _initialize(path: str, layout: Dict[str, Any]) -> None:
+    # Built aside and moved into place, so that readers never map a
+    # partial header and readers of a replaced store keep their mapping
+    encoded = json.dumps(layout).encode("utf-8")
+    end = _LAYOUT_OFFSET + len(encoded)
+    if end > HEADER_SIZE:
+        raise ValueError("The columns do not fit in the feature store header.")
+    header = bytearray(HEADER_SIZE)
+    header[: len(MAGIC)] = MAGIC
+    header[_LENGTH_OFFSET:_LAYOUT_OFFSET] = len(encoded).to_bytes(8, "little")
+    header[_LAYOUT_OFFSET:end] = encoded
+    rows = 2 * layout["capacity"]
+    itemsize = np.dtype(layout["dtype"]).itemsize
+    size = HEADER_SIZE + rows * (8 + len(layout["columns"]) * itemsize)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.truncate(size)
+    os.replace(tmp_path, path)
+
+
+class SharedFeatureStore:
+    """
+    Memory-mapped store of the candles and indicators of one instrument
+    and granularity, shared by processes.
+
+    One writer, e.g. the live pipeline or the backfiller, appends rows
+    and any number of readers map the same file. The rows are laid out
+    like `CandleStore`, written twice into a buffer of twice the
+    capacity so that the latest rows are always contiguous.
+
+    The header holds a sequence counter used as a seqlock: the writer
+    makes it odd before touching the rows and even again once done, and
+    a reader retries a copy whenever the counter was odd or changed
+    meanwhile. `generation`, the number of completed writes, tells
+    readers whether there are new rows. A single writer is enforced with
+    an exclusive lock on `<path>.lock`.
+
+    Use `create` to write and `open` to read:
+
+        store = SharedFeatureStore.open(store_path(root, "EUR_USD", "M1"))
+        df = store.to_frame()
+    """
+
+    def __init__(self, path: str, writable: bool = False):
+        layout = _read_layout(path)
+        if layout is None:
+            raise FileNotFoundError(f"No feature store at {path}.")
+        self.path = path
+        self.writable = writable
+        self.columns = list(layout["columns"])
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.capacity = int(layout["capacity"])
+        self.dtype = np.dtype(layout["dtype"])
+        self.tz = layout.get("tz")
+        self.metadata = layout.get("metadata", {})
+        self._lock_file = None
+
+        rows = 2 * self.capacity
+        times_end = HEADER_SIZE + 8 * rows
+        values_end = times_end + rows * len(self.columns) * self.dtype.itemsize
+        fields_end = _FIELDS_OFFSET + 40
+        self._map = np.memmap(path, dtype=np.uint8, mode="r+" if writable else "r")
+        self._state = self._map[_FIELDS_OFFSET:fields_end].view(np.uint64)
+        self._times = self._map[HEADER_SIZE:times_end].view(np.int64)
+        self._values = (
+            self._map[times_end:values_end]
+            .view(self.dtype)
+            .reshape(rows, len(self.columns))
+        )
+
+    @classmethod
+    def open(cls, path: str) -> "SharedFeatureStore":
+        """
+        Map a feature store for reading.
+
+        Args:
+            path (str): path of the store file
+
+        Raises:
+            FileNotFoundError: if there is no store at the path
+
+        Returns:
+            SharedFeatureStore: read-only store
+        """
+        return cls(path)
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        columns: Sequence[str],
+        capacity: int = 100_000,
+        dtype: Any = np.float32,
+        tz: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> "SharedFeatureStore":
+        """
+        Open a feature store for writing, continuing an existing store
+        with the same columns, capacity and dtype, or creating a new one
+        in its place.
+
+        Args:
+            path (str): path of the store file
+            columns (Sequence[str]): names of the columns
+            capacity (int, optional): maximum number of rows.
+            Defaults to 100_000.
+            dtype (Any, optional): float32 or float64. Defaults to float32.
+            tz (Optional[str], optional): timezone of the exported index.
+            Defaults to UTC.
+            metadata (Optional[Dict[str, Any]], optional): extra JSON
+            fields, e.g. the instrument. Defaults to None.
+
+        Raises:
+            StoreLockedError: if another writer holds the store
+
+        Returns:
+            SharedFeatureStore: writable store
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        lock_file = open(path + ".lock", "a")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise StoreLockedError(f"{path} already has a writer.") from None
+            layout = {
+                "columns": list(columns),
+                "capacity": int(capacity),
+                "dtype": np.dtype(dtype).name,
+                "tz": tz,
+                "metadata": metadata or {},
+            }
+            existing = _read_layout(path)
+            if existing is None or any(
+                existing.get(key) != layout[key]
+                for key in ("columns", "capacity", "dtype")
+            ):
+                _initialize(path, layout)
+            store = cls(path, writable=True)
+        except BaseException:
+            lock_file.close()
+            raise
+        store._lock_file = lock_file
+        # A writer that died mid-write left the sequence odd
+        if int(store._state[_SEQUENCE]) & 1:
+            store._state[_SEQUENCE] += 1
+        return store
+
+    def __enter__(self) -> "SharedFeatureStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return int(self._state[_SIZE])
+
+    @property
+    def generation(self) -> int:
+        """Number of completed writes."""
+        return int(self._state[_SEQUENCE]) // 2
+
+    @property
+    def count(self) -> int:
+        """Number of rows written since the store was created."""
+        return int(self._state[_COUNT])
+
+    def _write(self, times: np.ndarray, values: np.ndarray) -> None:
+        if not self.writable:
+            raise PermissionError(f"{self.path} is open for reading.")
+        state = self._state
+        capacity = self.capacity
+        positions = (int(state[_HEAD]) + np.arange(len(times))) % capacity
+        mirrors = positions + capacity
+        last = int(positions[-1])
+
+        state[_SEQUENCE] += 1
+        self._values[positions] = values
+        self._values[mirrors] = values
+        self._times[positions] = times
+        self._times[mirrors] = times
+        state[_HEAD] = (last + 1) % capacity
+        state[_END] = last + capacity + 1
+        state[_SIZE] = min(int(state[_SIZE]) + len(times), capacity)
+        state[_COUNT] += len(times)
+        state[_SEQUENCE] += 1
+
+    def append(self, row: Sequence[float], time: int) -> None:
+        """
+        Append a row, overwriting the oldest one once the store is full.
+
+        Args:
+            row (Sequence[float]): values in column order
+            time (int): epoch nanoseconds of the row
+        """
+        if not self.writable:
+            raise PermissionError(f"{self.path} is open for reading.")
+        state = self._state
+        position = int(state[_HEAD])
+        mirror = position + self.capacity
+
+        state[_SEQUENCE] += 1
+        self._values[position] = row
+        self._values[mirror] = row
+        self._times[position] = time
+        self._times[mirror] = time
+        state[_HEAD] = (position + 1) % self.capacity
+        state[_END] = mirror + 1
+        state[_SIZE] = min(int(state[_SIZE]) + 1, self.capacity)
+        state[_COUNT] += 1
+        state[_SEQUENCE] += 1
+
+    def extend(self, times: np.ndarray, values: np.ndarray) -> int:
+        """
+        Append the rows newer than the latest stored row, e.g. the
+        history of a restarted writer.
+
+        Args:
+            times (np.ndarray): epoch nanoseconds of the rows, increasing
+            values (np.ndarray): rows in column order
+
+        Returns:
+            int: number of rows written
+        """
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values)
+        last = self.last_time()
+        if last is not None:
+            start = int(np.searchsorted(times, last, side="right"))
+            times, values = times[start:], values[start:]
+        first = max(len(times) - self.capacity, 0)
+        times, values = times[first:], values[first:]
+        if len(times):
+            self._write(times, values)
+        return len(times)
+
+    def read(self, function: Callable[[], Any], timeout: float = 1.0) -> Any:
+        """
+        Run a read of the rows that is consistent with a single
+        generation, retrying it while the writer is busy.
+
+        Args:
+            function (Callable[[], Any]): read copying what it needs
+            timeout (float, optional): seconds to wait for the writer.
+            Defaults to 1.0.
+
+        Raises:
+            TimeoutError: if the writer stays busy, e.g. it died mid-write
+
+        Returns:
+            Any: result of the read
+        """
+        deadline = time.monotonic() + timeout
+        state = self._state
+        while True:
+            sequence = int(state[_SEQUENCE])
+            if not sequence & 1:
+                result = function()
+                if int(state[_SEQUENCE]) == sequence:
+                    return result
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The writer of {self.path} is stuck mid-write.")
+            time.sleep(0)
+
+    def _window(self, n: Optional[int]) -> Tuple[int, int]:
+        size = int(self._state[_SIZE])
+        end = int(self._state[_END])
+        n = size if n is None else min(n, size)
+        return end - n, end
+
+    def view(self, n: Optional[int] = None) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Zero-copy views of the last n rows. Later writes may overwrite
+        them, a reader checks `generation` against the returned one
+        before trusting what it computed from them.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            Tuple[int, np.ndarray, np.ndarray]: generation, times and
+            values shaped (n, num_columns)
+        """
+
+        def read() -> Tuple[int, int, int]:
+            return (self.generation, *self._window(n))
+
+        generation, start, end = self.read(read)
+        return generation, self._times[start:end], self._values[start:end]
+
+    def tail(self, n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Consistent copy of the last n rows.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: times and values shaped
+            (n, num_columns)
+        """
+
+        def read() -> Tuple[np.ndarray, np.ndarray]:
+            start, end = self._window(n)
+            return self._times[start:end].copy(), self._values[start:end].copy()
+
+        return self.read(read)
+
+    def last_time(self) -> Optional[int]:
+        """Epoch nanoseconds of the latest row, None if empty."""
+        times, _ = self.tail(1)
+        return int(times[0]) if len(times) else None
+
+    def to_frame(self, n: Optional[int] = None) -> pd.DataFrame:
+        """
+        Export the last n rows to a float64 dataframe.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            pd.DataFrame: candlestick and indicator data indexed by time
+        """
+        times, values = self.tail(n)
+        index = pd.to_datetime(times, utc=True)
+        if self.tz is not None:
+            index = index.tz_convert(self.tz)
+        index.name = "Time"
+        return pd.DataFrame(values.astype(np.float64), index=index, columns=self.columns)
+
+    def to_compact(self, n: Optional[int] = None) -> CompactFrame:
+        """
+        Export the last n rows to a compact frame.
+
+        Args:
+            n (Optional[int], optional): number of rows. Defaults to all
+            stored rows.
+
+        Returns:
+            CompactFrame: candlestick and indicator data
+        """
+        times, values = self.tail(n)
+        return CompactFrame(times, values, self.columns, self.tz)
+
+    def wait(
+        self, generation: int, timeout: Optional[float] = None, interval: float = 0.05
+    ) -> int:
+        """
+        Wait for writes after a generation.
+
+        Args:
+            generation (int): last generation seen
+            timeout (Optional[float], optional): seconds to wait.
+            Defaults to no limit.
+            interval (float, optional): polling interval in seconds.
+            Defaults to 0.05.
+
+        Returns:
+            int: current generation, unchanged on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.generation <= generation:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            time.sleep(interval)
+        return self.generation
+
+    def flush(self) -> None:
+        """Write the dirty pages of a writable store to disk."""
+        if self.writable:
+            self._map.flush()
+
+    def close(self) -> None:
+        """Flush the rows and release the writer lock."""
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def main():
+    """Print the latest rows of a feature store, optionally following it."""
+    parser = argparse.ArgumentParser(description="Inspect a shared feature store.")
+    parser.add_argument("path", help="feature store file")
+    parser.add_argument("--tail", type=int, default=5, help="rows to print")
+    parser.add_argument("--follow", action="store_true", help="print new rows")
+    args = parser.parse_args()
+
+    store = SharedFeatureStore.open(args.path)
+    print(
+        f"{args.path}: {len(store)}/{store.capacity} rows, {store.dtype}, "
+        f"generation {store.generation}, {store.metadata}"
+    )
+    generation, count = store.generation, store.count
+    print(store.to_frame(args.tail).to_string())
+    while args.follow:
+        generation = store.wait(generation)
+        new_count = store.count
+        df = store.to_frame(min(new_count - count, store.capacity))
+        print(df.to_string(header=False))
+        count = new_count
+
+
+if __name__ == "__main__":
+    main()
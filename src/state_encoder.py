@@ -0,0 +1,164 @@
+import math
+from bisect import bisect_right
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+def _as_float_array(features: np.ndarray) -> np.ndarray:
+    # float32 feature blocks are encoded as they are, without a copy
+    features = np.asarray(features)
+    if features.dtype not in (np.float32, np.float64):
+        features = features.astype(np.float64)
+    return features
+
+
+class ArgmaxEncoder:
+    """
+    Legacy state encoding: the state is the index of the largest value
+    of the row, skipping NaN as `np.argmax` over a Series does. There is
+    one state per feature.
+    """
+
+    def __init__(self, num_features: int):
+        self.num_states = num_features
+
+    def encode(self, row: Union[np.ndarray, pd.Series, Sequence[float]]) -> int:
+        values = np.asarray(row, dtype=np.float64)
+        return int(np.where(np.isnan(values), -np.inf, values).argmax())
+
+    def encode_array(self, features: np.ndarray) -> np.ndarray:
+        features = _as_float_array(features)
+        return np.where(np.isnan(features), -np.inf, features).argmax(axis=1)
+
+
+class StateEncoder:
+    """
+    Discretize chosen features into a single state id.
+
+    Every feature is binned by its edges as `np.digitize` does, and the
+    bin numbers are combined in mixed radix, so a row maps to one of
+    `num_states` ids. NaN falls into the last bin of its feature. Whole
+    arrays are encoded with `np.digitize` for training, single rows with
+    `bisect` in time independent of the history length.
+    """
+
+    def __init__(self, indices: Sequence[int], edges: Sequence[Sequence[float]]):
+        if len(indices) != len(edges):
+            raise ValueError("Every encoded feature needs its own bin edges.")
+        self.indices = [int(i) for i in indices]
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.edge_lists = [e.tolist() for e in self.edges]
+        radices = [len(e) + 1 for e in self.edges]
+        self.strides = np.cumprod([1] + radices[:-1]).astype(np.int64)
+        self.stride_list = self.strides.tolist()
+        self.num_states = int(np.prod(radices))
+
+    @classmethod
+    def fit(
+        cls,
+        data: Union[pd.DataFrame, np.ndarray],
+        columns: Sequence[Union[str, int]],
+        num_bins: int = 5,
+        names: Optional[Sequence[str]] = None,
+    ) -> "StateEncoder":
+        """
+        Place the bin edges at the quantiles of the training data so that
+        the bins are about equally populated.
+
+        Args:
+            data (Union[pd.DataFrame, np.ndarray]): training data, one row
+            per time step
+            columns (Sequence[Union[str, int]]): features to encode, by
+            name or position
+            num_bins (int, optional): bins per feature. Defaults to 5.
+            names (Optional[Sequence[str]], optional): column names of an
+            array. Defaults to the dataframe columns.
+
+        Returns:
+            StateEncoder: encoder with quantile bin edges
+        """
+        if isinstance(data, pd.DataFrame):
+            names = list(data.columns)
+            data = data.to_numpy(dtype=np.float64)
+        indices = [
+            names.index(column) if isinstance(column, str) else column
+            for column in columns
+        ]
+        quantiles = np.linspace(0, 1, num_bins + 1)[1:-1]
+        edges = []
+        for i in indices:
+            column = np.asarray(data[:, i], dtype=np.float64)
+            column = column[np.isfinite(column)]
+            edges.append(
+                np.unique(np.quantile(column, quantiles)) if len(column) else []
+            )
+        return cls(indices, edges)
+
+    def encode(self, row: Union[np.ndarray, pd.Series, Sequence[float]]) -> int:
+        """
+        Encode a single row, e.g. the latest candle while streaming.
+
+        Args:
+            row (Union[np.ndarray, pd.Series, Sequence[float]]): feature
+            values in column order
+
+        Returns:
+            int: state id
+        """
+        if not isinstance(row, list):
+            row = np.asarray(row, dtype=np.float64).tolist()
+        state = 0
+        for i, edges, stride in zip(self.indices, self.edge_lists, self.stride_list):
+            value = row[i]
+            bucket = len(edges) if math.isnan(value) else bisect_right(edges, value)
+            state += bucket * stride
+        return state
+
+    def encode_array(self, features: np.ndarray) -> np.ndarray:
+        """
+        Encode every row of a feature matrix.
+
+        Args:
+            features (np.ndarray): feature values, one row per time step
+
+        Returns:
+            np.ndarray: state id of every row
+        """
+        features = _as_float_array(features)
+        states = np.zeros(len(features), dtype=np.int64)
+        for i, edges, stride in zip(self.indices, self.edges, self.strides):
+            states += np.digitize(features[:, i], edges) * stride
+        return states
+
+
+class SparseQTable:
+    """
+    Hash-backed Q-table for large state spaces. Only the visited states
+    hold a row of action values, unseen states read as zeros.
+    """
+
+    def __init__(self, num_states: int, num_actions: int):
+        self.num_states = num_states
+        self.num_actions = num_actions
+        self.rows: Dict[int, np.ndarray] = {}
+
+    def __getitem__(self, state: int) -> np.ndarray:
+        row = self.rows.get(state)
+        if row is None:
+            row = self.rows[state] = np.zeros(self.num_actions)
+        return row
+
+    def __setitem__(self, state: int, values: Sequence[float]) -> None:
+        self[state][:] = values
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def shape(self):
+        return (self.num_states, self.num_actions)
+
+    def __repr__(self) -> str:
+        return f"SparseQTable({len(self)} of {self.num_states} states visited)"
@@ -0,0 +1,198 @@
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import oandapyV20
+import oandapyV20.endpoints.pricing as pricing
+from loguru import logger
+from requests.exceptions import RequestException
+
+_STOP = object()
+
+
+def _put_latest(tick_queue: queue.Queue, item: object) -> bool:
+    """
+    Put an item into a bounded queue, dropping the oldest items while it
+    is full.
+
+    Returns:
+        bool: True if an item was dropped
+    """
+    dropped = False
+    while True:
+        try:
+            tick_queue.put_nowait(item)
+            return dropped
+        except queue.Full:
+            pass
+        try:
+            tick_queue.get_nowait()
+            dropped = True
+        except queue.Empty:
+            pass
+
+
+class PricingStreamReader:
+    """
+    Read a single pricing stream for many instruments and demultiplex
+    the ticks into one queue per subscribed instrument.
+
+    One long-lived HTTP stream serves every instrument, so the number of
+    connections and the heartbeat handling stay constant as the
+    instrument list grows. The queues hold at most `max_queue_size`
+    ticks, a subscriber that falls behind loses its oldest ticks, which
+    are counted in `dropped`.
+    """
+
+    HEARTBEAT = "HEARTBEAT"
+
+    def __init__(
+        self,
+        client,
+        accountID,
+        instruments: List[str],
+        reconnect_delay: float = 5.0,
+        max_queue_size: int = 10_000,
+    ):
+        if max_queue_size <= 0:
+            raise ValueError("The queue size must be a positive integer.")
+        self.client = client
+        self.accountID = accountID
+        self.instruments = list(instruments)
+        self.reconnect_delay = reconnect_delay
+        self.max_queue_size = max_queue_size
+        self.last_heartbeat = None
+        self.tick_count = 0
+        self.dropped: Dict[str, int] = {instrument: 0 for instrument in instruments}
+
+        self._queues: Dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def subscribe(self, instrument: str) -> Iterator[Dict]:
+        """
+        Subscribe to the ticks of an instrument. The returned iterator
+        ends when the reader stops, or right away if it has already
+        stopped, and closing it unsubscribes.
+
+        Args:
+            instrument (str): currency pair
+
+        Raises:
+            ValueError: if the instrument is not part of the stream
+
+        Returns:
+            Iterator[Dict]: ticks of the instrument in arrival order
+        """
+        if instrument not in self.instruments:
+            raise ValueError(f"Instrument not in the stream: {instrument}")
+        tick_queue = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._queues[instrument] = tick_queue
+            if self._closed:
+                tick_queue.put_nowait(_STOP)
+        return self._consume(instrument, tick_queue)
+
+    def _consume(self, instrument: str, tick_queue: queue.Queue) -> Iterator[Dict]:
+        try:
+            while True:
+                tick = tick_queue.get()
+                if tick is _STOP:
+                    return
+                yield tick
+        finally:
+            with self._lock:
+                if self._queues.get(instrument) is tick_queue:
+                    del self._queues[instrument]
+
+    def dispatch(self, message: Dict) -> None:
+        """
+        Route a message from the stream to the queue of its instrument.
+        Heartbeats are recorded once for all instruments.
+
+        Args:
+            message (Dict): message from the pricing stream
+        """
+        if message.get("type") == self.HEARTBEAT:
+            self.last_heartbeat = message.get("time")
+            return
+        instrument = message.get("instrument")
+        tick_queue = self._queues.get(instrument)
+        if tick_queue is not None:
+            if _put_latest(tick_queue, message):
+                if not self.dropped[instrument]:
+                    logger.warning(
+                        f"Subscriber of {instrument} is falling behind, "
+                        "dropping its oldest ticks."
+                    )
+                self.dropped[instrument] += 1
+            self.tick_count += 1
+
+    def run(self) -> None:
+        """
+        Read the stream until stopped, reconnecting on errors. The
+        subscriptions end when the reader stops for any reason.
+        """
+        params = {"instruments": ",".join(self.instruments)}
+        try:
+            while not self._stop_event.is_set():
+                request = pricing.PricingStream(accountID=self.accountID, params=params)
+                try:
+                    for message in self.client.request(request):
+                        if self._stop_event.is_set():
+                            break
+                        self.dispatch(message)
+                except (oandapyV20.exceptions.V20Error, RequestException) as err:
+                    logger.warning(
+                        f"Pricing stream error: {err}. "
+                        f"Reconnecting in {self.reconnect_delay}s..."
+                    )
+                    self._stop_event.wait(self.reconnect_delay)
+                except Exception as err:
+                    logger.exception(
+                        f"Unexpected pricing stream error: {err}. "
+                        f"Reconnecting in {self.reconnect_delay}s..."
+                    )
+                    self._stop_event.wait(self.reconnect_delay)
+                else:
+                    if not self._stop_event.is_set():
+                        logger.warning("Pricing stream ended, reconnecting...")
+                        self._stop_event.wait(self.reconnect_delay)
+        finally:
+            self._close_queues()
+
+    def _close_queues(self) -> None:
+        with self._lock:
+            self._closed = True
+            for tick_queue in self._queues.values():
+                _put_latest(tick_queue, _STOP)
+
+    def start(self) -> threading.Thread:
+        """
+        Run the reader in a background thread.
+
+        Returns:
+            threading.Thread: the reader thread
+        """
+        self._thread = threading.Thread(
+            target=self.run, name="pricing-stream-reader", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop reading and end all the subscriptions.
+
+        Args:
+            timeout (Optional[float], optional): seconds to wait for the
+            reader thread. Defaults to None.
+        """
+        # The stream is checked on every message, heartbeats arrive every
+        # few seconds so the reader thread exits shortly after
+        self._stop_event.set()
+        self._close_queues()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -1,5 +1,6 @@
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
 
 import oandapyV20
 import oandapyV20.endpoints.pricing as pricing
@@ -7,20 +8,34 @@ import pandas as pd
 from loguru import logger
 from termcolor import colored
 
+from src.bar_aggregator import Bar, BarAggregator
+from src.candle_parser import parse_time
+from src.candle_store import CandleStore
+from src.checkpoint import CheckpointWriter, latest_checkpoint, load_checkpoint
+from src.compact import CompactFrame
+from src.dqn import DQNTrader
+from src.event_log import NULL_EVENT_LOG, EventLog
+from src.features import FeaturePipeline
+from src.latency import NULL_LATENCY, LatencyRecorder, clock
 from src.q_learning import QLearningTrader
+from src.shared_store import SharedFeatureStore, store_path
+from src.state_encoder import StateEncoder
+from src.tick_recorder import TickRecorder
 from src.trading_bot import TradingBot
-from src.utils import (
-    calculate_indicators,
-    get_candlestick_data,
-    process_streaming_response,
-)
+from src.utils import StreamingIndicators
+
+
+class MalformedTickError(ValueError):
+    """A message of the pricing stream is not a valid price tick."""
 
 
 class StreamingDataPipeline:
+    HEARTBEAT = "HEARTBEAT"
     ACTION_BUY = 0
     ACTION_SELL = 1
     ACTION_HOLD = 2
     ORDER_SIZE = 100000  # 100,000 units of the base currency
+    CANDLE_CAPACITY = 10000  # maximum number of candles kept in memory
 
     def __init__(
         self,
@@ -31,23 +46,81 @@ class StreamingDataPipeline:
         precision,
         stop_loss_pips,
         take_profit_pips,
+        recorder: Optional[TickRecorder] = None,
+        bar_sizes: Sequence[str] = ("M1",),
+        features: Optional[FeaturePipeline] = None,
+        state_encoder: Optional[Dict] = None,
+        checkpoint: Optional[Dict] = None,
+        agent: Optional[Dict] = None,
+        event_log: Optional[EventLog] = None,
+        latency: Optional[LatencyRecorder] = None,
+        feature_store: Optional[Dict] = None,
     ):
         self.accountID = accountID
         self.params = params
         self.client = client
-        self.df = df
+        self.precision = precision
+        # A compact frame keeps the candles and the agent's training data
+        # in float32 blocks
+        self.compact = isinstance(df, CompactFrame)
+        self.store = CandleStore.from_frame(
+            df, capacity=max(len(df), self.CANDLE_CAPACITY)
+        )
         self.start_time = datetime.now()
         self.max_duration = timedelta(minutes=300)
-        self.interval_start = datetime.now()
-        self.interval = timedelta(minutes=1)
-        self.temp_list = []
-        self.qtrader = QLearningTrader(
-            num_actions=3,
-            num_features=11,
-            learning_rate=0.01,
-            discount_factor=0.9,
-            exploration_prob=0.1,
+        self.granularity = bar_sizes[0]
+        self.features = features
+        self.feature_matrix = None
+        self.feature_state = None
+        if features is not None:
+            if features.timeframes[0] != self.granularity:
+                raise ValueError(
+                    "The first feature timeframe must be the trading granularity."
+                )
+            bar_sizes = [*bar_sizes]
+            bar_sizes += [tf for tf in features.timeframes if tf not in bar_sizes]
+            self.feature_matrix = features.transform(
+                df.to_frame() if self.compact else df
+            )
+            self.feature_state = features.vector.copy()
+        self.aggregator = BarAggregator(bar_sizes)
+        self.last_bars: Dict[str, Bar] = {}
+        self.last_price = None
+        self.recorder = recorder
+        self.events = (event_log or NULL_EVENT_LOG).bind(
+            instrument=params["instruments"]
         )
+        self.latency = (
+            latency.bind(params["instruments"]) if latency is not None else NULL_LATENCY
+        )
+        self.tick_start = 0
+        self.decision_start = 0
+        self.indicators = StreamingIndicators.from_frame(df)
+        num_features = features.size if features is not None else 11
+        params = dict(learning_rate=0.01, discount_factor=0.9, exploration_prob=0.1)
+        if agent is not None and agent.get("type") == "dqn":
+            params.update({k: v for k, v in agent.items() if k != "type"})
+            self.qtrader = DQNTrader(num_actions=3, num_features=num_features, **params)
+        else:
+            encoder = None
+            if state_encoder is not None:
+                if features is not None:
+                    data, names = self.feature_matrix, features.names
+                elif self.compact:
+                    data, names = df.values, df.columns
+                else:
+                    data, names = df, None
+                encoder = StateEncoder.fit(
+                    data, state_encoder["columns"], state_encoder["num_bins"], names
+                )
+            self.qtrader = QLearningTrader(
+                num_actions=3, num_features=num_features, encoder=encoder, **params
+            )
+        self.qtrader.events = self.events
+        self.checkpoint = checkpoint
+        self.checkpoint_writer: Optional[CheckpointWriter] = None
+        self.feature_store = feature_store
+        self.shared_store: Optional[SharedFeatureStore] = None
         self.bot = TradingBot(
             client,
             accountID,
@@ -56,6 +129,16 @@ class StreamingDataPipeline:
             take_profit_pips,
         )
 
+    @property
+    def df(self) -> pd.DataFrame:
+        """
+        Export the candles held in the store to a dataframe.
+
+        Returns:
+            pd.DataFrame: candlestick and indicator data
+        """
+        return self.store.to_frame()
+
     def check_max_duration(self) -> bool:
         """
         Check if the maximum duration has been reached. We are adpopting
@@ -74,37 +157,64 @@ class StreamingDataPipeline:
         console."""
         print("\nNo open position and Agent recommends buying...\n")
         print("Placing market order to buy...\n")
-        self.bot.place_market_order(self.params["instruments"], self.ORDER_SIZE)
+        self.events.log("order", kind="buy", units=self.ORDER_SIZE)
+        self.timed_order(
+            self.bot.place_market_order, self.params["instruments"], self.ORDER_SIZE
+        )
 
     def handle_sell_action(self) -> None:
         """Execute the sell action and print the message to the
         console."""
         print("\nAction is 1 and there are open positions...\n")
         print("Placing limit order to sell...\n")
-        self.bot.place_market_order(self.params["instruments"], -self.ORDER_SIZE)
+        self.events.log("order", kind="sell", units=-self.ORDER_SIZE)
+        self.timed_order(
+            self.bot.place_market_order, self.params["instruments"], -self.ORDER_SIZE
+        )
 
     def handle_take_profit(self) -> None:
         """Execute the take profit action when the price is at the
         resistance level and print the message to the console."""
         print(colored("\nPrice at resistance level, closing position...\n", "yellow"))
-        self.bot.place_limit_order_take_profit(
+        self.events.log("order", kind="take_profit", units=-self.ORDER_SIZE)
+        self.timed_order(
+            self.bot.place_limit_order_take_profit,
             self.params["instruments"],
             -self.ORDER_SIZE,
-            self.df["resistance"].iloc[-1],
-            self.df["support"].iloc[-1],
+            self.store.last("resistance"),
+            self.store.last("support"),
         )
 
     def handle_stop_loss(self) -> None:
         """Execute the stop loss action when the price is at the
         resistance level and print the message to the console."""
         print(colored("\nPrice at support level, closing position...\n", "red"))
-        self.bot.place_limit_order_stop_loss(
+        self.events.log("order", kind="stop_loss", units=-self.ORDER_SIZE)
+        self.timed_order(
+            self.bot.place_limit_order_stop_loss,
             self.params["instruments"],
             -self.ORDER_SIZE,
-            self.df["resistance"].iloc[-1],
-            self.df["support"].iloc[-1],
+            self.store.last("resistance"),
+            self.store.last("support"),
         )
 
+    def timed_order(self, place: Callable, *args) -> None:
+        """
+        Place an order and record its round-trip and the time since the
+        decision.
+
+        Args:
+            place (Callable): order method of the trading bot
+            *args: arguments of the order
+        """
+        if not self.latency.enabled:
+            place(*args)
+            return
+        start = clock()
+        place(*args)
+        self.latency.record("order", start)
+        self.latency.record("decision_to_order", self.decision_start)
+
     def perform_action(self, action: int, instruments_in_positions: List) -> None:
         """
         Perform the action based on the agent's recommendation and the
@@ -114,6 +224,8 @@ class StreamingDataPipeline:
             action (int): action recommended by the agent
             instruments_in_positions (List): list of instruments in open positions
         """
+        resistance = self.store.last("resistance")
+        support = self.store.last("support")
         if (
             action == self.ACTION_BUY
             and self.params["instruments"] not in instruments_in_positions
@@ -125,23 +237,144 @@ class StreamingDataPipeline:
         ):
             self.handle_sell_action()
         elif (
-            abs(self.temp_list[-1] - self.df["resistance"].iloc[-1])
-            <= 1 * 10**-self.precision
+            abs(self.last_price - resistance) <= 1 * 10**-self.precision
             and self.params["instruments"] in instruments_in_positions
-            and self.bot.get_buy_in_price(self.params["instruments"])
-            < self.df["resistance"].iloc[-1]
+            and self.bot.get_buy_in_price(self.params["instruments"]) < resistance
         ):
             self.handle_take_profit()
         elif (
-            self.temp_list[-1] <= self.df["support"].iloc[-1]
+            self.last_price <= support
             and self.params["instruments"] in instruments_in_positions
-            and self.bot.get_buy_in_price(self.params["instruments"])
-            > self.df["support"].iloc[-1]
+            and self.bot.get_buy_in_price(self.params["instruments"]) > support
         ):
             self.handle_stop_loss()
         else:
             print("Holding position...")
 
+    def aggregate_tick(self, tick: Dict) -> Optional[Bar]:
+        """
+        Add the tick to the open bars, keyed on the tick's own time, and
+        return the bar once it is complete.
+
+        Args:
+            tick (Dict): tick data from the API
+
+        Raises:
+            MalformedTickError: if the tick has no valid time or prices
+
+        Returns:
+            Optional[Bar]: completed bar of the trading granularity, None
+            while the bar is still gathering data
+        """
+        timed = self.latency.enabled
+        if timed:
+            self.tick_start = start = clock()
+        if self.recorder is not None:
+            self.recorder.record(tick)
+        try:
+            tick_time = parse_time(tick["time"])
+            price = (float(tick["closeoutBid"]) + float(tick["closeoutAsk"])) / 2
+        except (KeyError, TypeError, ValueError) as e:
+            raise MalformedTickError(f"Malformed tick {tick!r}") from e
+        if timed:
+            self.latency.record("tick_parse", start)
+            # Lag of the local clock behind the server time of the tick
+            self.latency.record_value("tick_lag", time.time_ns() - tick_time)
+            start = clock()
+        if self.events.enabled("tick"):
+            self.events.write(
+                "tick",
+                tick_time=tick["time"],
+                bid=tick["closeoutBid"],
+                ask=tick["closeoutAsk"],
+            )
+        candle = None
+        for bar in self.aggregator.update(tick_time, price):
+            self.last_bars[bar.granularity] = bar
+            if self.features is not None:
+                self.features.on_bar(bar)
+            if bar.granularity == self.granularity:
+                candle = bar
+        if timed:
+            self.latency.record("aggregate", start)
+        if candle is None:
+            return None
+        self.last_price = candle.close
+        return candle
+
+    def append_candle(self, bar: Bar) -> Dict[str, float]:
+        """
+        Calculate the indicators of a new candlestick and append it to
+        the store.
+
+        Args:
+            bar (Bar): new candlestick
+
+        Returns:
+            Dict[str, float]: candle and indicator values
+        """
+        timed = self.latency.enabled
+        if timed:
+            start = clock()
+        new_row = self.indicators.update(bar.open, bar.high, bar.low, bar.close)
+        self.store.append(new_row, time=bar.time)
+        if self.shared_store is not None:
+            self.shared_store.append(self.store.last_row(), bar.time)
+        if self.features is not None:
+            self.feature_state = self.features.vector.copy()
+        if timed:
+            self.latency.record("indicators", start)
+        if self.events.enabled("bar"):
+            self.events.write(
+                "bar", granularity=bar.granularity, bar_time=bar.time, **new_row
+            )
+        return new_row
+
+    def get_action(self, bar: Bar, tick_start: Optional[int] = None) -> int:
+        """
+        Let the agent decide on a completed candlestick.
+
+        Args:
+            bar (Bar): new candlestick
+            tick_start (Optional[int], optional): `clock()` reading at the
+            arrival of the tick that completed the candlestick. Defaults
+            to the latest tick.
+
+        Returns:
+            int: action encoded as an integer
+        """
+        if not self.latency.enabled:
+            return self.qtrader.update(self.store, bar, state=self.feature_state)
+        start = clock()
+        action = self.qtrader.update(self.store, bar, state=self.feature_state)
+        self.latency.record("decision", start)
+        self.latency.record(
+            "tick_to_decision", self.tick_start if tick_start is None else tick_start
+        )
+        self.decision_start = clock()
+        return action
+
+    def on_candle(self, bar: Bar) -> None:
+        """
+        Let the agent decide on a completed candlestick, act on the
+        decision and append the candlestick to the store.
+
+        Args:
+            bar (Bar): new candlestick
+        """
+        action = self.get_action(bar)
+        timed = self.latency.enabled
+        if timed:
+            start = clock()
+        positions = self.bot.get_open_positions()
+        if timed:
+            self.latency.record("positions", start)
+        print(f"Open positions: {positions}\n\n")
+        instruments_in_positions = [position["instrument"] for position in positions]
+
+        self.perform_action(action, instruments_in_positions)
+        self.append_candle(bar)
+
     def process_tick(self, tick: Dict) -> None:
         """
         Process the tick data and update the dataframe.
@@ -149,62 +382,139 @@ class StreamingDataPipeline:
         Args:
             tick (Dict): tick data from the API
         """
-        process_streaming_response(tick, self.temp_list)
-        print(
-            f"\nTime: {tick['time']},"
-            f"{colored('closeoutBid:', 'green')} {tick['closeoutBid']},"
-            f"{colored('closeoutAsk:', 'red')} {tick['closeoutAsk']}\n\n"
+        bar = self.aggregate_tick(tick)
+        if bar is not None:
+            self.on_candle(bar)
+
+    def read_tick(self, tick: Dict) -> Optional[Bar]:
+        """
+        Aggregate a message of the pricing stream, skipping heartbeats
+        and malformed ticks. Any other error is raised.
+
+        Args:
+            tick (Dict): message from the pricing stream
+
+        Returns:
+            Optional[Bar]: completed bar of the trading granularity, None
+            otherwise
+        """
+        if tick.get("type") == self.HEARTBEAT:
+            print(
+                colored(
+                    "Processing heartbeat messages for network latency check", "blue"
+                )
+            )
+            return None
+        try:
+            return self.aggregate_tick(tick)
+        except MalformedTickError as e:
+            logger.warning(f"Skipping tick: {e}")
+            return None
+
+    def prepare_agent(self) -> None:
+        """
+        Warm start the agent from the latest checkpoint of the
+        instrument, or train it on the historical data if there is no
+        compatible checkpoint.
+        """
+        if self.checkpoint is not None and self.checkpoint.get("warm_start", True):
+            path = latest_checkpoint(self.checkpoint["path"], self.params["instruments"])
+            if path is not None:
+                qtrader = load_checkpoint(path)
+                if (
+                    type(qtrader) is type(self.qtrader)
+                    and qtrader.num_features == self.qtrader.num_features
+                    and getattr(qtrader, "num_states", None)
+                    == getattr(self.qtrader, "num_states", None)
+                ):
+                    self.qtrader = qtrader
+                    self.qtrader.events = self.events
+                    logger.info(f"Warm started the agent from {path}.")
+                    return
+                logger.warning(f"Checkpoint {path} does not match the agent.")
+        data = self.store.to_compact() if self.compact else self.df
+        _, _ = self.qtrader.train_vectorized(data, features=self.feature_matrix)
+
+    def start_checkpoints(self) -> None:
+        """Start writing checkpoints of the agent in the background."""
+        if self.checkpoint is None:
+            return
+        self.checkpoint_writer = CheckpointWriter(
+            self.qtrader,
+            self.checkpoint["path"],
+            self.params["instruments"],
+            interval=self.checkpoint.get("interval", 300),
+            keep=self.checkpoint.get("keep", 5),
         )
-        if datetime.now() - self.interval_start >= self.interval:
-            print("Aggregating data at the minute-interval...")
-            self.interval_start = datetime.now()
-            if self.temp_list:
-                new_df = get_candlestick_data(self.interval_start, self.temp_list)
-                action = self.qtrader.update(self.df, new_df)
-                positions = self.bot.get_open_positions()
-                print(f"Open positions: {positions}\n\n")
-                instruments_in_positions = [
-                    position["instrument"] for position in positions
-                ]
-
-                self.perform_action(action, instruments_in_positions)
-
-                self.df = pd.concat([self.df, new_df], ignore_index=True)
-                self.temp_list.clear()
-                self.df = calculate_indicators(self.df)
-                logger.info(f"Latest incoming data: {self.df.tail(1)}\n\n")
-        else:
-            print("Gathering streaming data...\n\n")
+        self.checkpoint_writer.start()
 
-    def run(self) -> pd.DataFrame:
+    def stop_checkpoints(self) -> None:
+        """Stop the background writes and save a final checkpoint."""
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.stop()
+            self.checkpoint_writer = None
+
+    def start_feature_store(self) -> None:
+        """
+        Open the shared feature store of the instrument as its writer and
+        append the candles it does not hold yet.
+        """
+        if self.feature_store is None:
+            return
+        instrument = self.params["instruments"]
+        self.shared_store = SharedFeatureStore.create(
+            store_path(self.feature_store["path"], instrument, self.granularity),
+            self.store.columns,
+            capacity=self.feature_store.get("capacity", 100_000),
+            dtype=self.feature_store.get("dtype", "float32"),
+            tz=self.store.tz,
+            metadata={"instrument": instrument, "granularity": self.granularity},
+        )
+        self.shared_store.extend(self.store.tail_times(), self.store.tail())
+
+    def stop_feature_store(self) -> None:
+        """Flush the shared feature store and release it."""
+        if self.shared_store is not None:
+            self.shared_store.close()
+            self.shared_store = None
+
+    def run(self, ticks: Optional[Iterable[Dict]] = None) -> pd.DataFrame:
         """
         Run the streaming pipeline.
 
+        Args:
+            ticks (Optional[Iterable[Dict]], optional): tick source, e.g. a
+            subscription of a shared PricingStreamReader. Defaults to a
+            dedicated pricing stream for the instrument.
+
         Returns:
             pd.DataFrame: dataframe containing the
             the data during the streaming process
         """
-        _, _ = self.qtrader.train(self.df)
+        self.prepare_agent()
         print()
-        r = pricing.PricingStream(accountID=self.accountID, params=self.params)
+        self.bot.watch_transactions()
+        self.start_checkpoints()
+        self.start_feature_store()
         try:
-            rv = self.client.request(r)
-            for tick in rv:
+            if ticks is None:
+                r = pricing.PricingStream(accountID=self.accountID, params=self.params)
+                ticks = self.client.request(r)
+            for tick in ticks:
                 if self.check_max_duration():
                     self.bot.close_all_trades()
                     break
-                try:
-                    self.process_tick(tick)
-                except Exception:
-                    print(
-                        colored(
-                            "Processing heartbeat messages for network latency check",
-                            "blue\n\n",
-                        )
-                    )
+                bar = self.read_tick(tick)
+                if bar is not None:
+                    self.on_candle(bar)
         except oandapyV20.exceptions.V20Error as err:
+            # Raised to the supervisor, which restarts the pipeline
             print(f"V20Error encountered: {err}")
+            raise
         except KeyboardInterrupt:
             print("Streaming stopped by user.")
         finally:
-            return self.df
+            self.stop_checkpoints()
+            self.stop_feature_store()
+            self.bot.stop_watching_transactions()
+        return self.df
@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.backtest import Backtester
+from src.batch_q_learning import BatchQLearningTrader, prepare_batch_arrays
+from src.q_learning import QLearningTrader
+from src.utils import calculate_indicators, parse_yml
+
+HYPERPARAMETERS = ["learning_rate", "discount_factor", "exploration_prob"]
+
+# Candles shared with the worker processes, attached once per worker
+_shared: Dict[str, Any] = {}
+
+
+def grid_search_space(space: Dict[str, Sequence[float]]) -> List[Dict[str, float]]:
+    """
+    Expand a grid of hyperparameter values into configurations.
+
+    Args:
+        space (Dict[str, Sequence[float]]): candidate values per
+        hyperparameter
+
+    Returns:
+        List[Dict[str, float]]: every combination of the values
+    """
+    names = list(space)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+
+
+def random_search_space(
+    space: Dict[str, Union[Sequence[float], Tuple[float, float]]],
+    num_samples: int,
+    seed: Optional[int] = None,
+) -> List[Dict[str, float]]:
+    """
+    Sample configurations at random. A two-element tuple is sampled
+    uniformly between its bounds, a list is sampled from its values.
+
+    Args:
+        space (Dict[str, Union[Sequence[float], Tuple[float, float]]]):
+        search space per hyperparameter
+        num_samples (int): number of configurations
+        seed (Optional[int], optional): random seed. Defaults to None.
+
+    Returns:
+        List[Dict[str, float]]: sampled configurations
+    """
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(num_samples):
+        config = {}
+        for name, values in space.items():
+            if isinstance(values, tuple) and len(values) == 2:
+                config[name] = float(rng.uniform(*values))
+            else:
+                config[name] = float(rng.choice(values))
+        configs.append(config)
+    return configs
+
+
+def _attach(name: str, shape: Tuple[int, int], columns: List[str]) -> None:
+    """Attach the shared candles in a worker process."""
+    memory = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+    _shared["memory"] = memory
+    _shared["df"] = pd.DataFrame(array, columns=columns, copy=False)
+
+
+def _evaluate(job: Tuple[int, Dict[str, float], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Train and backtest one configuration on the shared candles.
+
+    Args:
+        job (Tuple[int, Dict[str, float], Dict[str, Any]]): id of the
+        configuration, hyperparameters and backtest settings
+
+    Returns:
+        Dict[str, Any]: hyperparameters and backtest statistics
+    """
+    config_id, config, settings = job
+    df = _shared["df"]
+    np.random.seed(settings["seed"])
+
+    qtrader = QLearningTrader(
+        num_actions=3,
+        num_features=df.shape[1],
+        learning_rate=config["learning_rate"],
+        discount_factor=config["discount_factor"],
+        exploration_prob=config["exploration_prob"],
+    )
+    split = int(settings["train_fraction"] * len(df))
+    if split > 1:
+        qtrader.train_vectorized(df.iloc[:split], verbose=False)
+    backtester = Backtester(
+        settings["precision"],
+        spread=settings["spread"],
+        qtrader=qtrader,
+        verbose=False,
+    )
+    result = backtester.run(df.iloc[split:])
+    return {"config_id": config_id, **config, **result.stats}
+
+
+def run_sweep(
+    df: pd.DataFrame,
+    configs: List[Dict[str, float]],
+    precision: int,
+    spread: float = 0.0,
+    train_fraction: float = 0.8,
+    seed: int = 0,
+    max_workers: Optional[int] = None,
+    metric: str = "total_pnl",
+) -> pd.DataFrame:
+    """
+    Train and backtest many `QLearningTrader` configurations on the same
+    candles across a process pool. The candles and indicators are placed
+    in shared memory once, instead of pickling the dataframe for every
+    configuration.
+
+    Args:
+        df (pd.DataFrame): input dataframe that contains
+        candlestick data, with or without indicators
+        configs (List[Dict[str, float]]): hyperparameter configurations
+        precision (int): number of decimal places of the instrument
+        spread (float, optional): simulated spread. Defaults to 0.0.
+        train_fraction (float, optional): share of the candles used for
+        training before the backtest. Defaults to 0.8.
+        seed (int, optional): random seed of every run. Defaults to 0.
+        max_workers (Optional[int], optional): number of processes.
+        Defaults to the number of cores.
+        metric (str, optional): statistic to rank by. Defaults to
+        "total_pnl".
+
+    Returns:
+        pd.DataFrame: results ranked by the metric, best first
+    """
+    df = Backtester(precision).prepare(df)
+    values = np.ascontiguousarray(df.to_numpy(dtype=np.float64))
+    columns = list(df.columns)
+    max_workers = max_workers or os.cpu_count()
+    settings = {
+        "precision": precision,
+        "spread": spread,
+        "train_fraction": train_fraction,
+        "seed": seed,
+    }
+
+    memory = shared_memory.SharedMemory(create=True, size=values.nbytes)
+    try:
+        shared = np.ndarray(values.shape, dtype=np.float64, buffer=memory.buf)
+        shared[:] = values
+        logger.info(
+            f"Sweeping {len(configs)} configurations on {len(df)} candles "
+            f"with {max_workers} workers..."
+        )
+        jobs = [(i, config, settings) for i, config in enumerate(configs)]
+        chunksize = max(1, len(jobs) // (max_workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_attach,
+            initargs=(memory.name, values.shape, columns),
+        ) as executor:
+            results = list(executor.map(_evaluate, jobs, chunksize=chunksize))
+    finally:
+        memory.close()
+        memory.unlink()
+
+    ranked = pd.DataFrame(results).sort_values(metric, ascending=False)
+    ranked.insert(0, "rank", np.arange(1, len(ranked) + 1))
+    return ranked.reset_index(drop=True)
+
+
+def run_batch_sweep(
+    df: pd.DataFrame,
+    configs: List[Dict[str, float]],
+    precision: int,
+    spread: float = 0.0,
+    train_fraction: float = 0.8,
+    seed: int = 0,
+    metric: str = "total_pnl",
+) -> pd.DataFrame:
+    """
+    Single-process alternative to `run_sweep` that trains all the
+    configurations at once as the agents of a `BatchQLearningTrader`.
+    Every bar costs a few vectorized operations for all configurations,
+    and only the order simulation runs per configuration.
+
+    Args:
+        df (pd.DataFrame): input dataframe that contains
+        candlestick data, with or without indicators
+        configs (List[Dict[str, float]]): hyperparameter configurations
+        precision (int): number of decimal places of the instrument
+        spread (float, optional): simulated spread. Defaults to 0.0.
+        train_fraction (float, optional): share of the candles used for
+        training before the backtest. Defaults to 0.8.
+        seed (int, optional): random seed of the agents. Defaults to 0.
+        metric (str, optional): statistic to rank by. Defaults to
+        "total_pnl".
+
+    Returns:
+        pd.DataFrame: results ranked by the metric, best first
+    """
+    backtester = Backtester(precision, spread=spread, verbose=False)
+    df = backtester.prepare(df)
+    states, rewards = prepare_batch_arrays([df] * len(configs))
+    agents = BatchQLearningTrader(
+        num_agents=len(configs),
+        num_actions=3,
+        num_states=df.shape[1],
+        learning_rate=[config["learning_rate"] for config in configs],
+        discount_factor=[config["discount_factor"] for config in configs],
+        exploration_prob=[config["exploration_prob"] for config in configs],
+        seed=seed,
+    )
+
+    split = int(train_fraction * len(df))
+    if split > 1:
+        agents.train(states[:, :split], rewards[:, : split - 1])
+    # Like `Backtester.run`, the agents keep learning during the backtest
+    actions, _ = agents.train(states[:, split:], rewards[:, split:])
+
+    test = df.iloc[split:]
+    results = [
+        {"config_id": i, **config, **backtester.simulate(test, actions[i]).stats}
+        for i, config in enumerate(configs)
+    ]
+    ranked = pd.DataFrame(results).sort_values(metric, ascending=False)
+    ranked.insert(0, "rank", np.arange(1, len(ranked) + 1))
+    return ranked.reset_index(drop=True)
+
+
+def main():
+    """Run a hyperparameter sweep on candles stored in a CSV file."""
+    parser = argparse.ArgumentParser(description="Sweep Q-learning hyperparameters.")
+    parser.add_argument("path", help="CSV file with Time, Open, High, Low, Close")
+    parser.add_argument("instrument", help="currency pair of the candles")
+    parser.add_argument("--config", default="./cfg/parameters.yaml")
+    parser.add_argument("--spread", type=float, default=0.0)
+    parser.add_argument(
+        "--random",
+        type=int,
+        default=None,
+        help="number of random samples instead of the full grid",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="train all configurations as one batch of agents in this process",
+    )
+    parser.add_argument("--output", default=None, help="CSV file for the results")
+    args = parser.parse_args()
+
+    cfg = parse_yml(args.config)
+    space = {name: cfg["sweep"][name] for name in HYPERPARAMETERS}
+    if args.random:
+        configs = random_search_space(space, args.random)
+    else:
+        configs = grid_search_space(space)
+
+    df = pd.read_csv(args.path, index_col="Time", parse_dates=True)
+    df = calculate_indicators(df[["High", "Close", "Low", "Open"]], fast=True).dropna()
+    precision = cfg["instrument_precision"][args.instrument]
+    if args.batch:
+        results = run_batch_sweep(df, configs, precision, spread=args.spread)
+    else:
+        results = run_sweep(
+            df, configs, precision, spread=args.spread, max_workers=args.workers
+        )
+    print(results.head(20).to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
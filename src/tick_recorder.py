@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from src.candle_parser import parse_time
+
+# Little-endian, packed: epoch nanoseconds, instrument id, bid, ask
+TICK_DTYPE = np.dtype(
+    [("time", "<i8"), ("instrument", "<u2"), ("bid", "<f8"), ("ask", "<f8")]
+)
+_tick = struct.Struct("<qHdd")
+
+
+def _format_time(value: int) -> str:
+    return str(np.datetime64(value, "ns")) + "Z"
+
+
+class TickRecorder:
+    """
+    Append-only binary recorder of pricing ticks.
+
+    Every tick is stored as one fixed-size TICK_DTYPE record, so that a
+    recording can be memory-mapped with `load_ticks` while it is still
+    being written. The instrument names are kept in a JSON sidecar file
+    and referenced by id. Heartbeats and other messages are skipped.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 16):
+        self.path = path
+        self.index_path = path + ".json"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.instruments: Dict[str, int] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                names = json.load(f)["instruments"]
+            self.instruments = {name: i for i, name in enumerate(names)}
+        self.file = open(path, "ab", buffering=buffer_size)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def _instrument_id(self, instrument: str) -> int:
+        if instrument not in self.instruments:
+            self.instruments[instrument] = len(self.instruments)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"instruments": list(self.instruments)}, f)
+            os.replace(tmp_path, self.index_path)
+        return self.instruments[instrument]
+
+    def record(self, tick: Dict) -> None:
+        """
+        Append a tick to the recording.
+
+        Args:
+            tick (Dict): tick data from the API
+        """
+        if tick.get("type") != "PRICE":
+            return
+        with self.lock:
+            self.file.write(
+                _tick.pack(
+                    parse_time(tick["time"]),
+                    self._instrument_id(tick["instrument"]),
+                    float(tick["closeoutBid"]),
+                    float(tick["closeoutAsk"]),
+                )
+            )
+            self.count += 1
+
+    def flush(self) -> None:
+        with self.lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        logger.info(f"Recorded {self.count} ticks to {self.path}.")
+
+    def __enter__(self) -> "TickRecorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def load_ticks(path: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Memory-map a tick recording.
+
+    Args:
+        path (str): path of the recording
+
+    Returns:
+        Tuple[np.ndarray, List[str]]: TICK_DTYPE records and the
+        instrument names indexed by id
+    """
+    with open(path + ".json") as f:
+        names = json.load(f)["instruments"]
+    size = os.path.getsize(path) // TICK_DTYPE.itemsize
+    if size == 0:
+        return np.empty(0, dtype=TICK_DTYPE), names
+    return np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(size,)), names
+
+
+def replay_ticks(
+    path: str,
+    speed: Optional[float] = None,
+    instruments: Optional[List[str]] = None,
+) -> Iterator[Dict]:
+    """
+    Replay a tick recording as PricingStream messages, so that it can
+    stand in for the live stream of `StreamingDataPipeline.run`.
+
+    Args:
+        path (str): path of the recording
+        speed (Optional[float], optional): replay speed relative to the
+        recorded time, 1.0 for real time. Defaults to as fast as possible.
+        instruments (Optional[List[str]], optional): instruments to
+        replay. Defaults to all.
+
+    Yields:
+        Dict: tick data in the format of the pricing stream
+    """
+    records, names = load_ticks(path)
+    if instruments is not None:
+        ids = [names.index(name) for name in instruments if name in names]
+        records = records[np.isin(records["instrument"], ids)]
+    if not len(records):
+        return
+
+    first = int(records["time"][0])
+    started = time.perf_counter()
+    for t, instrument, bid, ask in records.tolist():
+        if speed:
+            delay = (t - first) / 1e9 / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        bid, ask = repr(bid), repr(ask)
+        yield {
+            "type": "PRICE",
+            "instrument": names[instrument],
+            "time": _format_time(t),
+            "bids": [{"price": bid}],
+            "asks": [{"price": ask}],
+            "closeoutBid": bid,
+            "closeoutAsk": ask,
+        }
+
+
+def main():
+    """Print a summary of a tick recording and its replay throughput."""
+    parser = argparse.ArgumentParser(description="Inspect a tick recording.")
+    parser.add_argument("path", help="path of the recording")
+    args = parser.parse_args()
+
+    records, names = load_ticks(args.path)
+    print(f"{len(records)} ticks of {names}")
+    if len(records):
+        print(
+            f"From {_format_time(int(records['time'][0]))} "
+            f"to {_format_time(int(records['time'][-1]))}"
+        )
+    started = time.perf_counter()
+    count = sum(1 for _ in replay_ticks(args.path))
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {count} ticks at {count / max(elapsed, 1e-9):.0f} ticks/s")
+
+
+if __name__ == "__main__":
+    main()
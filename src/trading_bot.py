@@ -1,11 +1,14 @@
 import os
-from typing import Any, Dict, Union
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple, Union
 
 import oandapyV20
 import oandapyV20.endpoints.orders as orders
 import oandapyV20.endpoints.positions as positions
 import oandapyV20.endpoints.pricing as pricing
 import oandapyV20.endpoints.trades as trades
+import oandapyV20.endpoints.transactions as transactions
 from dotenv import load_dotenv
 from loguru import logger
 from oandapyV20.exceptions import V20Error
@@ -24,24 +27,216 @@ class TradingBot:
         precision,
         stop_loss_pips,
         take_profit_pips,
+        cache_ttl: float = 60.0,
+        price_ttl: float = 1.0,
     ):
         self.client = client
         self.accountID = accountID
         self.precision = precision
         self.stop_loss_pips = stop_loss_pips
         self.take_profit_pips = take_profit_pips
+        self.cache_ttl = cache_ttl
+        self.price_ttl = price_ttl
+
+        # Cached account state: key -> (monotonic time of the update, value)
+        self._cache: Dict[Any, Tuple[float, Any]] = {}
+        self._cache_lock = threading.Lock()
+        self._stop_watching = threading.Event()
+        self._watcher = None
+
+    def _cached(
+        self, key: Any, ttl: float, fetch: Callable[[], Any], refresh: bool = False
+    ) -> Any:
+        """
+        Return the cached value of the key, fetching it if it is missing,
+        older than the ttl or a refresh is requested.
+
+        Args:
+            key (Any): cache key
+            ttl (float): time to live in seconds
+            fetch (Callable[[], Any]): function retrieving the value
+            refresh (bool, optional): bypass the cache. Defaults to False.
+
+        Returns:
+            Any: cached or freshly fetched value
+        """
+        if not refresh:
+            with self._cache_lock:
+                entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                return entry[1]
+        value = fetch()
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic(), value)
+        return value
+
+    def invalidate(self, *keys: Any) -> None:
+        """
+        Drop cached account state so that the next access refetches it.
+
+        Args:
+            *keys (Any): cache keys to drop, e.g. "positions", "trades" or
+            ("price", instrument). Drops everything when empty.
+        """
+        with self._cache_lock:
+            if not keys:
+                self._cache.clear()
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def refresh(self) -> None:
+        """Refetch the open positions and trades explicitly."""
+        self.get_open_positions(refresh=True)
+        self.get_open_trades(refresh=True)
+
+    def apply_transaction(self, transaction: Dict[str, Any]) -> None:
+        """
+        Update the cached trades from an order fill, taken from an order
+        response or the transactions stream. Positions are invalidated as
+        their aggregated values cannot be derived from a single fill.
+
+        Args:
+            transaction (Dict[str, Any]): transaction from the API
+        """
+        if transaction.get("type") != "ORDER_FILL":
+            return
+
+        with self._cache_lock:
+            self._cache.pop("positions", None)
+            entry = self._cache.get("trades")
+            if entry is None:
+                return
+
+            closed = {trade["tradeID"] for trade in transaction.get("tradesClosed", [])}
+            open_trades = [trade for trade in entry[1] if trade["id"] not in closed]
+            reduced = transaction.get("tradeReduced")
+            if reduced:
+                open_trades = [
+                    (
+                        dict(
+                            trade,
+                            currentUnits=str(
+                                float(trade["currentUnits"]) + float(reduced["units"])
+                            ),
+                        )
+                        if trade["id"] == reduced["tradeID"]
+                        else trade
+                    )
+                    for trade in open_trades
+                ]
+            opened = transaction.get("tradeOpened")
+            # The same fill can arrive from the order response and the stream
+            if opened and all(trade["id"] != opened["tradeID"] for trade in open_trades):
+                open_trades.append(
+                    {
+                        "id": opened["tradeID"],
+                        "instrument": transaction["instrument"],
+                        "price": opened.get("price", transaction.get("price")),
+                        "currentUnits": opened["units"],
+                    }
+                )
+            self._cache["trades"] = (entry[0], open_trades)
 
-    def get_open_positions(self) -> Dict[str, Any]:
+    def _apply_order_response(self, response: Dict[str, Any]) -> None:
+        fill = response.get("orderFillTransaction") if response else None
+        if fill:
+            self.apply_transaction(fill)
+
+    def watch_transactions(self) -> threading.Thread:
+        """
+        Keep the cached trades up to date from the transactions stream,
+        e.g. when take profit or stop loss orders fill on the server.
+
+        Returns:
+            threading.Thread: the background thread reading the stream
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+
+        def watch() -> None:
+            request = transactions.TransactionsStream(accountID=self.accountID)
+            try:
+                for transaction in self.client.request(request):
+                    if self._stop_watching.is_set():
+                        break
+                    self.apply_transaction(transaction)
+            except Exception as e:
+                logger.error(f"Transactions stream stopped: {e}")
+            finally:
+                # Without the stream the cache can only rely on the ttl
+                self.invalidate()
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(
+            target=watch, name="transactions-stream", daemon=True
+        )
+        self._watcher.start()
+        return self._watcher
+
+    def stop_watching_transactions(self) -> None:
+        """Stop reading the transactions stream."""
+        self._stop_watching.set()
+
+    def get_open_positions(self, refresh: bool = False) -> List[Dict[str, Any]]:
         """
         Get open positions for the account.
 
+        Args:
+            refresh (bool, optional): bypass the cache. Defaults to False.
+
+        Returns:
+            List[Dict[str, Any]]: Open positions for the account
+        """
+
+        def fetch() -> List[Dict[str, Any]]:
+            request = positions.OpenPositions(accountID=self.accountID)
+            response = self.client.request(request)
+            return response["positions"]
+
+        return self._cached("positions", self.cache_ttl, fetch, refresh)
+
+    def get_open_trades(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get open trades for the account.
+
+        Args:
+            refresh (bool, optional): bypass the cache. Defaults to False.
+
+        Returns:
+            List[Dict[str, Any]]: Open trades for the account
+        """
+
+        def fetch() -> List[Dict[str, Any]]:
+            request = trades.OpenTrades(accountID=self.accountID)
+            response = self.client.request(request)
+            return response["trades"]
+
+        return self._cached("trades", self.cache_ttl, fetch, refresh)
+
+    def get_price_info(
+        self, instrument: str, refresh: bool = False
+    ) -> Union[Dict[str, Any], None]:
+        """
+        Get the latest pricing information of an instrument.
+
+        Args:
+            instrument (str): currency pair
+            refresh (bool, optional): bypass the cache. Defaults to False.
+
         Returns:
-            Dict[str, Any]: Open positions for the account
+            Union[Dict[str, Any], None]: pricing information or None if
+            not available
         """
-        request = positions.OpenPositions(accountID=self.accountID)
-        response = self.client.request(request)
-        open_positions = response["positions"]
-        return open_positions
+
+        def fetch() -> Union[Dict[str, Any], None]:
+            params = {"instruments": instrument}
+            request = pricing.PricingInfo(accountID=self.accountID, params=params)
+            response = self.client.request(request)
+            if "prices" in response and response["prices"]:
+                return response["prices"][0]
+            return None
+
+        return self._cached(("price", instrument), self.price_ttl, fetch, refresh)
 
     def get_current_price(self, instrument: str) -> float:
         """
@@ -53,13 +248,10 @@ class TradingBot:
         Returns:
             float: price of the instrument
         """
-        params = {"instruments": instrument}
         try:
-            request = pricing.PricingInfo(accountID=self.accountID, params=params)
-            response = self.client.request(request)
-
-            if "prices" in response and response["prices"]:
-                return float(response["prices"][0]["bids"][0]["price"])
+            prices = self.get_price_info(instrument)
+            if prices is not None:
+                return float(prices["bids"][0]["price"])
         except Exception as e:
             print(f"An error occurred: {e}")
             return None
@@ -78,10 +270,7 @@ class TradingBot:
             Union[float, None]: price at which the bot bought the
             instrument or None if not applicable
         """
-        r = trades.OpenTrades(accountID=self.accountID)
-        self.client.request(r)
-        open_trades = r.response
-        for trade in open_trades["trades"]:
+        for trade in self.get_open_trades():
             if trade["instrument"] == instrument:
                 return round(float(trade["price"]), self.precision)
         return None
@@ -101,15 +290,12 @@ class TradingBot:
         Returns:
             float: take profit price
         """
-        entry_price = self.get_current_price(instrument)
-        if entry_price is None:
+        # the same pricing response gives the entry price and confirms the
+        # pricing availability of the instrument
+        prices = self.get_price_info(instrument)
+        if prices is None:
             raise ValueError("Could not retrieve the entry price")
-
-        params = {"instruments": instrument}
-        # checking pricing availability and if the instrument is currently tradeable
-        request = pricing.PricingInfo(accountID=self.accountID, params=params)
-        response = self.client.request(request)
-        prices = response["prices"][0]
+        entry_price = float(prices["bids"][0]["price"])
         if instrument in prices["instrument"]:
             if units > 0:
                 take_profit_price = entry_price + self.take_profit_pips
@@ -134,15 +320,12 @@ class TradingBot:
         Returns:
             float: stop loss price
         """
-        entry_price = self.get_current_price(instrument)
-        if entry_price is None:
+        # the same pricing response gives the entry price and confirms the
+        # pricing availability of the instrument
+        prices = self.get_price_info(instrument)
+        if prices is None:
             raise ValueError("Could not retrieve the entry price")
-
-        params = {"instruments": instrument}
-        # checking pricing availability and if the instrument is currently tradeable
-        request = pricing.PricingInfo(accountID=self.accountID, params=params)
-        response = self.client.request(request)
-        prices = response["prices"][0]
+        entry_price = float(prices["bids"][0]["price"])
         if instrument in prices["instrument"]:
             if units > 0:
                 stop_loss_price = entry_price - self.stop_loss_pips
@@ -173,6 +356,7 @@ class TradingBot:
         try:
             request = orders.OrderCreate(self.accountID, data=body)
             response = self.client.request(request)
+            self._apply_order_response(response)
             logger.success(f"Oanda Orders placed successfully! Response: {response}")
         except V20Error as e:
             logger.error(f"Error placing Oanda orders:{e}")
@@ -223,6 +407,7 @@ class TradingBot:
         try:
             request = orders.OrderCreate(self.accountID, data=body)
             response = self.client.request(request)
+            self._apply_order_response(response)
             logger.success(f"Oanda Orders placed successfully! Response: {response}")
         except V20Error as e:
             logger.error(f"Error placing Oanda orders:{e}")
@@ -264,6 +449,7 @@ class TradingBot:
         try:
             request = orders.OrderCreate(self.accountID, data=body)
             response = self.client.request(request)
+            self._apply_order_response(response)
             logger.success(f"Oanda Orders placed successfully! Response: {response}")
         except V20Error as e:
             logger.error(f"Error placing Oanda orders:{e}")
@@ -295,6 +481,7 @@ class TradingBot:
         try:
             request = orders.OrderCreate(self.accountID, data=body)
             response = self.client.request(request)
+            self._apply_order_response(response)
             logger.success(f"Oanda Orders placed successfully! Response: {response}")
         except V20Error as e:
             logger.error(f"Error placing Oanda orders:{e}")
@@ -302,11 +489,10 @@ class TradingBot:
     def close_all_trades(self) -> None:
         """Close all open trades for the account."""
         # Get a list of all open trades for the account
-        trades_request = trades.OpenTrades(accountID=self.accountID)
-        response = self.client.request(trades_request)
+        open_trades = self.get_open_trades(refresh=True)
 
-        if len(response["trades"]) > 0:
-            for trade in response["trades"]:
+        if len(open_trades) > 0:
+            for trade in open_trades:
                 trade_id = trade["id"]
                 try:
                     body = {
@@ -319,5 +505,6 @@ class TradingBot:
                     print(f"Trade {trade_id} closed successfully.")
                 except oandapyV20.exceptions.V20Error as e:
                     print(f"Failed to close trade {trade_id}. Error: {e}")
+            self.invalidate("positions", "trades")
         else:
             print("No open trades to close.")
@@ -1,9 +1,38 @@
+import math
+from collections import deque
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Union
 
+import numpy as np
 import pandas as pd
 import yaml
 
+from src.compact import CompactFrame
+from src.kernels import INDICATOR_COLUMNS, compute_indicators
+
+# Duration of the candle granularities with a fixed length
+GRANULARITY_SECONDS = {
+    "S5": 5,
+    "S10": 10,
+    "S15": 15,
+    "S30": 30,
+    "M1": 60,
+    "M2": 120,
+    "M4": 240,
+    "M5": 300,
+    "M10": 600,
+    "M15": 900,
+    "M30": 1800,
+    "H1": 3600,
+    "H2": 7200,
+    "H3": 10800,
+    "H4": 14400,
+    "H6": 21600,
+    "H8": 28800,
+    "H12": 43200,
+    "D": 86400,
+}
+
 
 def parse_yml(path: str) -> Dict:
     """
@@ -166,7 +195,7 @@ def calculate_support_resistance(
     return df
 
 
-def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_indicators(df: pd.DataFrame, fast: bool = False) -> pd.DataFrame:
     """
     Calculate the technical indicators needed to feed into the trading
     strategy.
@@ -174,11 +203,34 @@ def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
     Args:
         df (pd.DataFrame): input dataframe that contains
         candlestick data
+        fast (bool, optional): compute every indicator in one block with
+        the fused kernels of `src.kernels` when the prices are finite.
+        The result matches the pandas path to rounding, but is a new
+        dataframe joined with the block without copying it, `df` is
+        left unchanged. Defaults to False.
 
     Returns:
         pd.DataFrame: dataframe with the technical indicators
         appended
     """
+    if fast:
+        high, low, close = (
+            df[column].to_numpy(dtype=np.float64) for column in ("High", "Low", "Close")
+        )
+        if (
+            np.isfinite(high).all()
+            and np.isfinite(low).all()
+            and np.isfinite(close).all()
+        ):
+            indicators = pd.DataFrame(
+                compute_indicators(high, low, close),
+                index=df.index,
+                columns=INDICATOR_COLUMNS,
+                copy=False,
+            )
+            df = df.drop(columns=INDICATOR_COLUMNS, errors="ignore")
+            return pd.concat([df, indicators], axis=1)
+
     df = calculate_sma(df)
     df = calculate_rsi(df)
     df = calculate_macd(df)
@@ -186,3 +238,229 @@ def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
     df = calculate_support_resistance(df)
 
     return df
+
+
+def _safe_div(numerator: float, denominator: float) -> float:
+    """
+    Divide two floats the way pandas does, returning inf or NaN instead
+    of raising on a zero denominator.
+
+    Args:
+        numerator (float): numerator
+        denominator (float): denominator
+
+    Returns:
+        float: result of the division
+    """
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return math.nan
+        return math.copysign(math.inf, numerator)
+    return numerator / denominator
+
+
+class _EWMState:
+    """Running state of `Series.ewm(span=...).mean()` with adjust=True."""
+
+    def __init__(self, span: int):
+        alpha = 2.0 / (span + 1.0)
+        self.decay = 1.0 - alpha
+        self.weight = 0.0
+        self.mean = math.nan
+
+    def update(self, value: float) -> float:
+        # Same recurrence as pandas' ewma kernel
+        if math.isnan(self.mean):
+            self.mean = value
+            self.weight = 1.0
+        else:
+            self.weight *= self.decay
+            if self.mean != value:
+                self.mean = (self.weight * self.mean + value) / (self.weight + 1.0)
+            self.weight += 1.0
+        return self.mean
+
+
+class _RollingWindow:
+    """Ring buffer holding the last `window` values of a series."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values = [math.nan] * window
+        self.position = 0
+        self.count = 0
+
+    def append(self, value: float) -> None:
+        self.values[self.position] = value
+        self.position = (self.position + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+
+    def is_ready(self) -> bool:
+        return self.count == self.window
+
+    def mean(self) -> float:
+        if not self.is_ready():
+            return math.nan
+        return math.fsum(self.values) / self.window
+
+    def std(self) -> float:
+        if not self.is_ready() or self.window < 2:
+            return math.nan
+        mean = math.fsum(self.values) / self.window
+        squared = math.fsum((value - mean) ** 2 for value in self.values)
+        return math.sqrt(squared / (self.window - 1))
+
+
+class _RollingExtreme:
+    """Rolling min or max over a fixed window using a monotonic deque."""
+
+    def __init__(self, window: int, maximum: bool):
+        self.window = window
+        self.maximum = maximum
+        self.candidates = deque()
+        self.index = -1
+
+    def update(self, value: float) -> float:
+        self.index += 1
+        candidates = self.candidates
+        if self.maximum:
+            while candidates and candidates[-1][1] <= value:
+                candidates.pop()
+        else:
+            while candidates and candidates[-1][1] >= value:
+                candidates.pop()
+        candidates.append((self.index, value))
+        if candidates[0][0] <= self.index - self.window:
+            candidates.popleft()
+        if self.index < self.window - 1:
+            return math.nan
+        return candidates[0][1]
+
+
+class StreamingIndicators:
+    """
+    Incremental counterpart of `calculate_indicators`.
+
+    Keeps the running EWM state, rolling windows and rolling min/max so
+    that every new bar updates all indicator columns in constant time
+    instead of recomputing them over the whole history.
+    """
+
+    COLUMNS = [
+        "Open",
+        "High",
+        "Low",
+        "Close",
+        "SMA",
+        "RSI",
+        "MACD",
+        "%K",
+        "%D",
+        "resistance",
+        "support",
+    ]
+
+    def __init__(
+        self,
+        sma_window: int = 5,
+        rsi_span: int = 5,
+        short_window: int = 5,
+        long_window: int = 13,
+        stochastic_window: int = 5,
+        window_size: int = 5,
+        multiplier: float = 0.5,
+    ):
+        self.multiplier = multiplier
+        self.previous_close = math.nan
+
+        self.sma = _RollingWindow(sma_window)
+        self.gain = _EWMState(rsi_span)
+        self.loss = _EWMState(rsi_span)
+        self.macd_short = _EWMState(short_window)
+        self.macd_long = _EWMState(long_window)
+        self.lowest_low = _RollingExtreme(stochastic_window, maximum=False)
+        self.highest_high = _RollingExtreme(stochastic_window, maximum=True)
+        self.percent_k = _RollingWindow(3)
+        self.support_resistance = _RollingWindow(window_size)
+
+    def update(
+        self, open: float, high: float, low: float, close: float
+    ) -> Dict[str, float]:
+        """
+        Feed a new candle and compute its indicator values.
+
+        Args:
+            open (float): opening price
+            high (float): highest price
+            low (float): lowest price
+            close (float): closing price
+
+        Returns:
+            Dict[str, float]: candle and indicator values keyed by the
+            column names used by `calculate_indicators`
+        """
+        open, high, low, close = float(open), float(high), float(low), float(close)
+
+        self.sma.append(close)
+        sma = self.sma.mean()
+
+        # diff() yields NaN on the first row which is treated as 0
+        delta = close - self.previous_close
+        self.previous_close = close
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-delta if delta < 0 else -0.0)
+        rs = _safe_div(gain, loss)
+        rsi = 100 - _safe_div(100, 1 + rs)
+
+        macd = self.macd_short.update(close) - self.macd_long.update(close)
+
+        lowest_low = self.lowest_low.update(low)
+        highest_high = self.highest_high.update(high)
+        percent_k = _safe_div(100 * (close - lowest_low), highest_high - lowest_low)
+        self.percent_k.append(percent_k)
+        percent_d = self.percent_k.mean()
+
+        self.support_resistance.append(close)
+        mean = self.support_resistance.mean()
+        std = self.support_resistance.std()
+
+        return {
+            "Open": open,
+            "High": high,
+            "Low": low,
+            "Close": close,
+            "SMA": sma,
+            "RSI": rsi,
+            "MACD": macd,
+            "%K": percent_k,
+            "%D": percent_d,
+            "resistance": mean + self.multiplier * std,
+            "support": mean - self.multiplier * std,
+        }
+
+    @classmethod
+    def from_frame(
+        cls, df: Union[pd.DataFrame, CompactFrame], **kwargs
+    ) -> "StreamingIndicators":
+        """
+        Build the indicator state by replaying the candles of an
+        existing dataframe, so that the next update continues exactly
+        where `calculate_indicators` over the same dataframe would.
+
+        Args:
+            df (Union[pd.DataFrame, CompactFrame]): input dataframe that
+            contains candlestick data
+
+        Returns:
+            StreamingIndicators: indicator state after the last candle
+        """
+        indicators = cls(**kwargs)
+        columns = ["Open", "High", "Low", "Close"]
+        if isinstance(df, CompactFrame):
+            indices = [df.column_index[column] for column in columns]
+            candles = df.values[:, indices].astype(float)
+        else:
+            candles = df[columns].to_numpy(dtype=float)
+        for open, high, low, close in candles.tolist():
+            indicators.update(open, high, low, close)
+        return indicators
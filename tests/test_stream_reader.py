@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from src.stream_reader import PricingStreamReader
+
+
+def price(instrument, i):
+    return {"type": "PRICE", "instrument": instrument, "closeoutBid": str(i)}
+
+
+class StubClient:
+    """Serve each request with the next of the given message sources."""
+
+    def __init__(self, *sources):
+        self.sources = list(sources)
+        self.requests = 0
+        self.exhausted = threading.Event()
+
+    def request(self, endpoint):
+        self.requests += 1
+        if not self.sources:
+            self.exhausted.set()
+            return iter(())
+        source = self.sources.pop(0)
+        if isinstance(source, Exception):
+            raise source
+        return source()
+
+
+def drain(ticks, timeout=5.0):
+    """Consume a subscription in a thread, failing if it does not end."""
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(ticks), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the subscription never ended"
+    return received
+
+
+def test_subscription_ends_on_stop():
+    def messages():
+        yield price("EUR_USD", 1)
+        yield {"type": "HEARTBEAT", "time": "t"}
+        yield price("GBP_USD", 2)
+        yield price("EUR_USD", 3)
+
+    client = StubClient(messages)
+    reader = PricingStreamReader(client, "id", ["EUR_USD", "GBP_USD"], 0.01)
+    ticks = reader.subscribe("EUR_USD")
+    reader.start()
+    assert client.exhausted.wait(5)
+    reader.stop(timeout=5)
+
+    assert [tick["closeoutBid"] for tick in drain(ticks)] == ["1", "3"]
+    assert reader.last_heartbeat == "t"
+
+
+@pytest.mark.parametrize(
+    "error", [KeyError("instrument"), RuntimeError("bad chunk"), ConnectionError()]
+)
+def test_unexpected_errors_reconnect(error):
+    def failing():
+        yield price("EUR_USD", 1)
+        raise error
+
+    def messages():
+        yield price("EUR_USD", 2)
+
+    client = StubClient(failing, error, messages)
+    reader = PricingStreamReader(client, "id", ["EUR_USD"], 0.01)
+    ticks = reader.subscribe("EUR_USD")
+    reader.start()
+    assert client.exhausted.wait(5)
+    reader.stop(timeout=5)
+
+    assert [tick["closeoutBid"] for tick in drain(ticks)] == ["1", "2"]
+    assert not reader._thread.is_alive()
+
+
+def test_reader_thread_death_ends_subscriptions():
+    class Fatal(BaseException):
+        pass
+
+    client = StubClient(Fatal())
+    reader = PricingStreamReader(client, "id", ["EUR_USD"], 0.01)
+    ticks = reader.subscribe("EUR_USD")
+    with pytest.raises(Fatal):
+        reader.run()
+    assert drain(ticks) == []
+
+
+def test_subscribe_after_stop_ends_immediately():
+    reader = PricingStreamReader(StubClient(), "id", ["EUR_USD"])
+    reader.stop()
+    assert drain(reader.subscribe("EUR_USD")) == []
+
+
+def test_slow_subscriber_drops_oldest_ticks():
+    reader = PricingStreamReader(StubClient(), "id", ["EUR_USD"], max_queue_size=3)
+    ticks = reader.subscribe("EUR_USD")
+    for i in range(5):
+        reader.dispatch(price("EUR_USD", i))
+    assert reader.dropped["EUR_USD"] == 2
+    assert reader.tick_count == 5
+
+    reader.stop()
+    # The stop marker displaces one more tick of the full queue
+    assert [tick["closeoutBid"] for tick in drain(ticks)] == ["3", "4"]
+
+
+def test_unknown_instrument():
+    reader = PricingStreamReader(StubClient(), "id", ["EUR_USD"])
+    with pytest.raises(ValueError):
+        reader.subscribe("USD_JPY")
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import StreamingIndicators, calculate_indicators
+
+
+def random_candles(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 1.1 + np.cumsum(rng.normal(0, 1e-4, n))
+    open = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 5e-5, (2, n)))
+    return pd.DataFrame(
+        {
+            "Open": open,
+            "High": np.maximum(open, close) + spread[0],
+            "Low": np.minimum(open, close) - spread[1],
+            "Close": close,
+        },
+        index=pd.date_range("2024-01-01", periods=n, freq="min", tz="UTC"),
+    )
+
+
+@pytest.mark.parametrize("n", [1, 4, 20, 500])
+def test_streaming_indicators_match_calculate_indicators(n):
+    df = random_candles(n)
+    expected = calculate_indicators(df.copy())
+
+    indicators = StreamingIndicators()
+    rows = [indicators.update(*candle) for candle in df.to_numpy().tolist()]
+    actual = pd.DataFrame(rows, index=df.index)
+
+    for column in StreamingIndicators.COLUMNS:
+        assert np.allclose(
+            actual[column], expected[column], rtol=1e-9, atol=1e-12, equal_nan=True
+        ), column
+        # The warm-up rows are NaN on both paths
+        assert (actual[column].isna() == expected[column].isna()).all(), column
+
+
+def test_streaming_indicators_flat_prices():
+    df = random_candles(30)
+    df.loc[:, ["Open", "High", "Low", "Close"]] = 1.25
+    expected = calculate_indicators(df.copy())
+
+    indicators = StreamingIndicators()
+    rows = [indicators.update(*candle) for candle in df.to_numpy().tolist()]
+    actual = pd.DataFrame(rows, index=df.index)
+
+    for column in StreamingIndicators.COLUMNS:
+        assert np.allclose(actual[column], expected[column], equal_nan=True), column
+
+
+def test_from_frame_continues_the_history():
+    df = random_candles(100)
+    expected = calculate_indicators(df.copy())
+
+    indicators = StreamingIndicators.from_frame(df.iloc[:60])
+    rows = [indicators.update(*candle) for candle in df.iloc[60:].to_numpy().tolist()]
+    actual = pd.DataFrame(rows, index=df.index[60:])
+
+    for column in StreamingIndicators.COLUMNS:
+        assert np.allclose(
+            actual[column], expected[column].iloc[60:], rtol=1e-9, equal_nan=True
+        ), column